@@ -1,17 +1,32 @@
 import streamlit as st
-import pandas as pd
 import os
-import re
-import tempfile
-from verificacion_dim import (
-    ExtractorDIANSimplificado,
-    ComparadorDatos, 
-    ExtractorSubpartidas,
-    ValidadorDeclaracionImportacionCompleto
-)
+from transporte_dim import archivo_compartido, cerrar_archivos
+import verificacion_dim
+import regex_seguro_dim
+import pipeline_dim
+import triaje_dim
+import ocr_dim
+import estadisticas_patrones_dim
+import plantillas_excel_dim
+from ocr_dim import ocr_disponible
+from pipeline_dim import ejecutar_pipeline
+from cache_dim import digest_archivo, huella_archivo_codigo
+from exportacion_dim import exportar_a_bytes, COLUMNA_VEREDICTO_COMPARACION, COLUMNA_VEREDICTO_ANEXOS, MARCA_DIFERENCIA
+from trabajos_dim import GestorTrabajos, LimiteTrabajosExcedido, ESTADO_COMPLETADO, ESTADO_ERROR
 from collections import Counter, defaultdict
 import io
-from contextlib import redirect_stdout
+import time
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from carga_perezosa_dim import ModuloPerezoso
+
+# pandas solo se necesita al mostrar resultados: la primera pantalla carga sin importarlo
+pd = ModuloPerezoso('pandas')
+
+# Resultados en caché por servidor: se descartan los más antiguos al superar el límite
+MAX_RESULTADOS_CACHE = 16
+# Cambia con cualquier modificación del código o de los patrones de extracción
+VERSION_PIPELINE = huella_archivo_codigo(verificacion_dim, regex_seguro_dim, pipeline_dim, triaje_dim, ocr_dim,
+                                        estadisticas_patrones_dim, plantillas_excel_dim)
 
 # Configuración de la página
 st.set_page_config(
@@ -69,6 +84,15 @@ def inicializar_estados():
         st.session_state.estadisticas_validacion = None
     if 'validacion_integridad' not in st.session_state:
         st.session_state.validacion_integridad = None
+    if 'rendimiento' not in st.session_state:
+        st.session_state.rendimiento = None
+    if 'di_duplicadas' not in st.session_state:
+        st.session_state.di_duplicadas = None
+    # Trabajo en segundo plano asociado a la sesión (también se recupera desde la URL)
+    if 'trabajo_id' not in st.session_state:
+        st.session_state.trabajo_id = st.query_params.get('trabajo')
+    if 'trabajo_aplicado' not in st.session_state:
+        st.session_state.trabajo_aplicado = None
 
 # =============================================================================
 # NUEVAS FUNCIONES PARA MOSTRAR RESULTADOS EN EL FORMATO ESPECÍFICO
@@ -169,127 +193,6 @@ def mostrar_resultados_validacion_formateados(datos_proveedor, resumen_codigos,
     
     st.markdown(f"📈 {total_di_procesadas} de {total_di_anexos} DI procesadas | ✅ {declaraciones_correctas} correctas | ❌ {estadisticas_validacion.get('declaraciones_con_errores', 0)} con diferencias")
 
-def extraer_datos_de_consola_mejorado(consola_output):
-    """Extrae datos del proveedor de la salida de consola - MEJORADO"""
-    datos = {'nit': 'No disponible', 'nombre': 'No disponible'}
-    
-    lineas = consola_output.split('\n')
-    for i, linea in enumerate(lineas):
-        if 'NIT:' in linea:
-            # Buscar NIT en la línea actual o siguiente
-            nit_match = re.search(r'NIT:\s*([0-9]+)', linea)
-            if nit_match:
-                datos['nit'] = nit_match.group(1)
-            elif i + 1 < len(lineas):
-                nit_match = re.search(r'([0-9]{6,12})', lineas[i + 1])
-                if nit_match:
-                    datos['nit'] = nit_match.group(1)
-        
-        if 'Nombre:' in linea or 'Razón Social:' in linea:
-            # Buscar nombre en la línea actual o siguiente
-            nombre_match = re.search(r'(?:Nombre|Razón Social):\s*(.+)', linea)
-            if nombre_match:
-                datos['nombre'] = nombre_match.group(1).strip()
-            elif i + 1 < len(lineas):
-                nombre_texto = lineas[i + 1].strip()
-                if nombre_texto and not nombre_texto.isdigit():
-                    datos['nombre'] = nombre_texto
-    
-    return datos
-
-def extraer_resumen_de_consola_mejorado(consola_output):
-    """Extrae resumen de códigos Y validación de integridad de la salida de consola - MEJORADO"""
-    resumen = {}
-    validacion_integridad = {}
-    
-    lineas = consola_output.split('\n')
-    en_resumen = False
-    en_validacion = False
-    
-    for linea in lineas:
-        # Capturar VALIDACIÓN DE INTEGRIDAD
-        if 'VALIDACIÓN DE INTEGRIDAD:' in linea or 'VALIDACION DE INTEGRIDAD:' in linea:
-            en_validacion = True
-            continue
-        
-        if en_validacion:
-            if '❌' in linea:
-                if 'Levantes duplicados:' in linea or 'DI duplicadas:' in linea:
-                    match = re.search(r'❌\s*(\d+)\s*(?:Levantes|DI)\s*duplicados?:\s*([0-9, ]+)', linea)
-                    if match:
-                        validacion_integridad['levantes_duplicados'] = {
-                            'cantidad': match.group(1),
-                            'numero': match.group(2).strip()
-                        }
-                elif 'Desbalance:' in linea:
-                    match = re.search(r'❌\s*Desbalance:\s*(\d+)\s*DI\s*vs\s*(\d+)\s*Levantes', linea)
-                    if match:
-                        validacion_integridad['desbalance'] = {
-                            'di': match.group(1),
-                            'levantes': match.group(2)
-                        }
-            elif not linea.strip() or '📋 Declaraciones encontradas:' in linea:
-                en_validacion = False
-        
-        # Capturar RESUMEN POR CÓDIGO
-        if 'Resumen por código:' in linea or '🗒️ Resumen por código:' in linea:
-            en_resumen = True
-            continue
-        
-        if en_resumen and linea.strip().startswith('•'):
-            match = re.search(r'•\s*Código\s+(\d+):\s*(\d+)\s*-\s*(.+)', linea)
-            if match:
-                codigo = match.group(1)
-                cantidad = int(match.group(2))
-                nombre = match.group(3).strip()
-                resumen[codigo] = {'cantidad': cantidad, 'nombre': nombre}
-        
-        if en_resumen and not linea.strip().startswith('•') and linea.strip():
-            en_resumen = False
-    
-    return resumen, validacion_integridad
-
-def extraer_estadisticas_de_consola_mejorado(consola_output, datos_dian):
-    """Extrae estadísticas REALES de la salida de consola - MEJORADO"""
-    estadisticas = {
-        'total_anexos': 0,
-        'total_di': 0,
-        'total_di_dian': len(datos_dian) if datos_dian is not None else 0,
-        'declaraciones_con_errores': 0,
-        'declaraciones_correctas': 0,
-        'datos_dian': datos_dian
-    }
-    
-    lineas = consola_output.split('\n')
-    
-    for linea in lineas:
-        # Buscar total de anexos
-        if 'anexos encontrados' in linea:
-            match = re.search(r'✅\s*(\d+)\s*anexos', linea)
-            if match:
-                estadisticas['total_anexos'] = int(match.group(1))
-        
-        # Buscar total DI en anexos
-        if 'Código 9:' in linea:
-            match = re.search(r'Código\s*9:\s*(\d+)', linea)
-            if match:
-                estadisticas['total_di'] = int(match.group(1))
-        
-        # Buscar declaraciones con errores
-        if 'Declaraciones con errores:' in linea:
-            match = re.search(r'Declaraciones con errores:\s*(\d+)', linea)
-            if match:
-                estadisticas['declaraciones_con_errores'] = int(match.group(1))
-        elif 'declaraciones con errores' in linea.lower():
-            match = re.search(r'(\d+)\s*declaraciones con errores', linea.lower())
-            if match:
-                estadisticas['declaraciones_con_errores'] = int(match.group(1))
-    
-    # Calcular declaraciones correctas
-    estadisticas['declaraciones_correctas'] = estadisticas['total_di_dian'] - estadisticas['declaraciones_con_errores']
-    
-    return estadisticas
-
 # =============================================================================
 # FUNCIONES AUXILIARES EXISTENTES (MODIFICADA SOLO LA LÓGICA DE CONTEO)
 # =============================================================================
@@ -340,129 +243,128 @@ def mostrar_resumen_comparacion_simplificado(reporte_comparacion, reporte_anexos
 # FUNCIONES PRINCIPALES ACTUALIZADAS
 # =============================================================================
 
+@st.cache_data(max_entries=MAX_RESULTADOS_CACHE, show_spinner=False)
+def ejecutar_pipeline_cacheado(huella, _pdfs, _archivo_subpartidas, _archivo_formulario, _trabajo):
+    """Ejecuta el pipeline en el pool de procesos compartido, indexado solo por `huella`
+    (los buffers no se hashean)"""
+    return _trabajo.ejecutar_en_proceso(ejecutar_pipeline, _pdfs, _archivo_subpartidas, _archivo_formulario)
+
+def huella_entradas(pdfs, archivo_subpartidas, archivo_formulario):
+    """Clave de caché: SHA-256 y nombre de cada carga más la versión del código y patrones"""
+    return (
+        VERSION_PIPELINE,
+        tuple((pdf.name, digest_archivo(pdf)) for pdf in pdfs),
+        (archivo_subpartidas.name, digest_archivo(archivo_subpartidas)),
+        (archivo_formulario.name, digest_archivo(archivo_formulario))
+    )
+
+def trabajo_verificacion(trabajo, huella, pdfs, archivo_subpartidas, archivo_formulario):
+    """Cuerpo del trabajo en segundo plano: reutiliza la caché si las cargas no cambiaron"""
+    inicio = time.time()
+    try:
+        resultado = ejecutar_pipeline_cacheado(huella, pdfs, archivo_subpartidas, archivo_formulario, trabajo)
+    finally:
+        # Las cargas ya no hacen falta: se liberan y se eliminan sus archivos de intercambio
+        cerrar_archivos(pdfs, archivo_subpartidas, archivo_formulario)
+    return dict(resultado, desde_cache=resultado.get('calculado_en', inicio) < inicio)
+
+@st.cache_resource
+def obtener_gestor_trabajos():
+    """Un solo gestor y pool de procesos por servidor, compartido por todas las sesiones:
+    los trabajos sobreviven a recargas y se reparten por turnos entre usuarios"""
+    return GestorTrabajos(inicializador=verificacion_dim.precalentar)
+
+def usuario_actual():
+    """Identificador de la sesión de Streamlit, usado para el reparto justo y los límites por usuario"""
+    contexto = get_script_run_ctx()
+    return contexto.session_id if contexto else "anonimo"
+
 def procesar_conciliacion(dian_pdfs, excel_subpartidas, excel_anexos):
-    """Procesa la conciliación con los archivos cargados - ACTUALIZADA"""
-    
-    with tempfile.TemporaryDirectory() as temp_dir:
-        try:
-            # Guardar archivos en temporal
-            for pdf in dian_pdfs:
-                with open(os.path.join(temp_dir, pdf.name), "wb") as f:
-                    f.write(pdf.getbuffer())
-            
-            excel_sub_path = os.path.join(temp_dir, excel_subpartidas.name)
-            with open(excel_sub_path, "wb") as f:
-                f.write(excel_subpartidas.getbuffer())
-            
-            excel_anexos_path = os.path.join(temp_dir, excel_anexos.name)  
-            with open(excel_anexos_path, "wb") as f:
-                f.write(excel_anexos.getbuffer())
+    """Envía la conciliación a segundo plano y retorna el ID del trabajo"""
+    # Cada carga se copia una sola vez, a un archivo de intercambio mapeado en memoria:
+    # al proceso de trabajo solo viaja su ruta y el hash de la huella lee el mismo mapa
+    pdfs = [archivo_compartido(pdf.name, pdf.getbuffer()) for pdf in dian_pdfs]
+    archivo_subpartidas = archivo_compartido(excel_subpartidas.name, excel_subpartidas.getbuffer())
+    archivo_formulario = archivo_compartido(excel_anexos.name, excel_anexos.getbuffer())
+
+    # Dos sesiones que envían los mismos documentos comparten el mismo trabajo
+    huella = huella_entradas(pdfs, archivo_subpartidas, archivo_formulario)
+    try:
+        id_trabajo = obtener_gestor_trabajos().enviar(
+            trabajo_verificacion, huella, pdfs, archivo_subpartidas, archivo_formulario,
+            usuario=usuario_actual(), clave=huella,
+            descripcion=f"{len(pdfs)} PDF - {excel_subpartidas.name} - {excel_anexos.name}"
+        )
+    except LimiteTrabajosExcedido as e:
+        st.warning(f"⚠️ {e}")
+        return None
+    seguir_trabajo(id_trabajo)
+    return id_trabajo
+
+def seguir_trabajo(id_trabajo):
+    """Asocia la sesión (y la URL, para poder volver) al trabajo indicado"""
+    st.session_state.trabajo_id = id_trabajo
+    st.query_params['trabajo'] = id_trabajo
+
+def aplicar_resultado_trabajo(resultado):
+    """Copia el resultado de un trabajo terminado a session_state"""
+    # GUARDAR RESULTADOS EN SESSION_STATE - CLAVE PARA PERSISTENCIA
+    for clave in ('comparacion_data', 'anexos_data', 'reporte_comparacion', 'reporte_anexos',
+                  'datos_dian', 'datos_subpartidas', 'datos_proveedor', 'resumen_codigos',
+                  'estadisticas_validacion', 'validacion_integridad', 'rendimiento', 'di_duplicadas'):
+        st.session_state[clave] = resultado[clave]
+    st.session_state.procesamiento_completado = True
+
+@st.fragment(run_every=1.0)
+def mostrar_trabajo_en_curso():
+    """Barra de progreso del trabajo asociado; al terminar carga los resultados"""
+    id_trabajo = st.session_state.trabajo_id
+    trabajo = obtener_gestor_trabajos().obtener(id_trabajo)
+    if trabajo is None:
+        st.warning(f"⚠️ No se encontró la verificación {id_trabajo} (pudo expirar o el servidor se reinició)")
+        st.session_state.trabajo_id = None
+        st.query_params.clear()
+        return
 
-            # Procesar comparación DIM vs Subpartidas
-            st.info("🔍 Comparando DIM vs Subpartidas...")
-            
-            extractor_dian = ExtractorDIANSimplificado()
-            datos_dian = extractor_dian.procesar_multiples_dis(temp_dir)
-            
-            if datos_dian is None or datos_dian.empty:
-                st.error("❌ No se pudieron extraer datos de las DIM")
-                return None
-            
-            st.success(f"✅ {len(datos_dian)} declaraciones DIAN extraídas")
-            
-            extractor_subpartidas = ExtractorSubpartidas()
-            datos_subpartidas = extractor_subpartidas.extraer_y_estandarizar(temp_dir)
-            
-            if datos_subpartidas.empty:
-                st.error("❌ No se pudieron extraer datos del archivo de subpartidas")
-                return None
-            
-            st.success(f"✅ Datos de subpartidas extraídos: {len(datos_subpartidas)} registros")
-            
-            # Detectar si hay múltiples subpartidas para mostrar info
-            comparador = ComparadorDatos()
-            multiples_subpartidas = comparador.detectar_multiples_subpartidas(datos_subpartidas)
-            
-            if multiples_subpartidas:
-                st.info(f"🔍 Detectadas {len(datos_subpartidas)} subpartidas - Aplicando lógica de suma y comparación")
-            else:
-                st.info("🔍 Subpartida única detectada - Aplicando lógica estándar")
-            
-            output_comparacion = os.path.join(temp_dir, "comparacion_dim_subpartidas.xlsx")
-            reporte_comparacion = comparador.generar_reporte_comparacion(
-                datos_dian, datos_subpartidas, output_comparacion
-            )
+    estado = trabajo.instantanea()
+    st.caption(f"🆔 Verificación **{estado['id']}** · {estado['descripcion']} · puede cerrar la página y volver con este ID")
 
-            # Procesar validación de anexos
-            st.info("🔄 Validando anexos FMM...")
-            
-            validador = ValidadorDeclaracionImportacionCompleto()
-            output_anexos = os.path.join(temp_dir, "validacion_anexos.xlsx")
-            
-            # CAPTURAR LA SALIDA DE CONSOLA DEL VALIDADOR
-            output_buffer = io.StringIO()
-            
-            with redirect_stdout(output_buffer):
-                resultado_validacion = validador.procesar_validacion_completa(temp_dir, output_anexos)
-            
-            # Obtener la salida de consola
-            consola_output = output_buffer.getvalue()
-            
-            # EXTRAER DATOS REALES DEL PROCESAMIENTO CON LAS NUEVAS FUNCIONES
-            datos_proveedor = extraer_datos_de_consola_mejorado(consola_output)
-            resumen_codigos, validacion_integridad = extraer_resumen_de_consola_mejorado(consola_output)
-            estadisticas_validacion = extraer_estadisticas_de_consola_mejorado(consola_output, datos_dian)
-            
-            # Si el validador retorna un diccionario, usarlo, sino usar los datos extraídos
-            if isinstance(resultado_validacion, dict):
-                reporte_anexos = resultado_validacion.get('reporte_anexos')
-                # Combinar con datos extraídos de consola
-                datos_proveedor = resultado_validacion.get('datos_proveedor', datos_proveedor)
-                resumen_codigos = resultado_validacion.get('resumen_codigos', resumen_codigos)
-                estadisticas_validacion = resultado_validacion.get('estadisticas_validacion', estadisticas_validacion)
-            else:
-                reporte_anexos = resultado_validacion
-
-            # GUARDAR RESULTADOS EN SESSION_STATE - CLAVE PARA PERSISTENCIA
-            with open(output_comparacion, "rb") as f:
-                st.session_state.comparacion_data = f.read()
-            if os.path.exists(output_anexos):
-                with open(output_anexos, "rb") as f:
-                    st.session_state.anexos_data = f.read()
-            else:
-                st.warning("⚠️ No se generó el reporte de anexos porque no se encontraron coincidencias entre el PDF y el Excel.")
-                st.session_state.anexos_data = None
-    
-            # Guardar también los DataFrames completos para mostrar resultados
-            st.session_state.reporte_comparacion = reporte_comparacion
-            st.session_state.reporte_anexos = reporte_anexos
-            st.session_state.datos_dian = datos_dian
-            st.session_state.datos_subpartidas = datos_subpartidas
-            # Guardar las variables de resumen
-            st.session_state.datos_proveedor = datos_proveedor
-            st.session_state.resumen_codigos = resumen_codigos
-            st.session_state.estadisticas_validacion = estadisticas_validacion
-            st.session_state.validacion_integridad = validacion_integridad
-
-            return {
-                'comparacion': reporte_comparacion is not None,
-                'anexos': reporte_anexos is not None,
-                'datos_dian': datos_dian,
-                'datos_subpartidas': datos_subpartidas,
-                'reporte_comparacion': reporte_comparacion,
-                'reporte_anexos': reporte_anexos,
-                'datos_proveedor': datos_proveedor,
-                'resumen_codigos': resumen_codigos,
-                'estadisticas_validacion': estadisticas_validacion,
-                'validacion_integridad': validacion_integridad,
-                'multiples_subpartidas': multiples_subpartidas  # Nuevo campo para tracking
-            }
-
-        except Exception as e:
-            st.error(f"❌ Error en el procesamiento: {str(e)}")
-            import traceback
-            st.code(traceback.format_exc())
-            return None
+    if estado['estado'] == ESTADO_ERROR:
+        st.error(f"❌ Error en el procesamiento: {estado['progreso']['detalle']}")
+        st.code(estado['error'])
+        st.session_state.trabajo_id = None
+        return
+
+    if estado['estado'] == ESTADO_COMPLETADO:
+        resultado = trabajo.resultado
+        st.session_state.trabajo_aplicado = id_trabajo
+        if 'error' in resultado:
+            st.error(resultado['error'])
+            return
+        aplicar_resultado_trabajo(resultado)
+        if resultado.get('desde_cache'):
+            st.toast("⚡ Archivos idénticos a una verificación anterior - resultados recuperados de caché")
+        if resultado['anexos_data'] is None:
+            st.toast("⚠️ No se generó el reporte de anexos porque no se encontraron coincidencias entre el PDF y el Excel.")
+        st.toast("✅ Verificación completada exitosamente")
+        st.rerun()
+
+    progreso = estado['progreso']
+    st.progress(min(progreso['fraccion'], 1.0), text=f"{progreso['etapa']} {progreso['detalle']}")
+    if progreso['pdfs_sin_texto']:
+        destino = "se leen con OCR" if ocr_disponible() else "sin OCR (pytesseract + Tesseract) no se extraerán DI de ellos"
+        st.warning(f"⚠️ PDF sin capa de texto (¿escaneados?), {destino}: {', '.join(progreso['pdfs_sin_texto'])}")
+    estimadas = f" / ~{progreso['di_estimadas']}" if progreso['di_estimadas'] else ""
+    eta = f" / ~{progreso['eta_segundos']:.0f}" if progreso['eta_segundos'] is not None else ""
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Páginas leídas", progreso['paginas'])
+    with col2:
+        st.metric("DI extraídas", f"{progreso['dis_extraidas']}{estimadas}")
+    with col3:
+        st.metric("Declaraciones validadas", progreso['declaraciones_validadas'])
+    with col4:
+        st.metric("Tiempo (s)", f"{estado['duracion']:.0f}{eta}")
 
 def mostrar_resultados_en_pantalla():
     """Muestra los resultados detallados en pantalla usando session_state - ACTUALIZADA Y SIMPLIFICADA"""
@@ -494,51 +396,22 @@ def mostrar_resultados_en_pantalla():
 
     # Resultados de Validación de Anexos - TABLA DETALLADA (OPCIONAL)
     with st.expander("🔍 Ver Detalle de Validación de Anexos"):
-        if st.session_state.reporte_anexos is not None:
-            reporte_anexos = st.session_state.reporte_anexos
-            
-            if reporte_anexos is not None and not reporte_anexos.empty:
-                # Mostrar tabla de validación con resaltado SOLO para diferencias
-                st.markdown("**Detalle de Validación:**")
-                
-                def resaltar_solo_validacion_anexos(row):
-                    """Resalta SOLO filas que no coinciden en la validación de anexos"""
-                    if row['Coincidencias'] == '❌ NO COINCIDE':
-                        return ['background-color: #ffcccc'] * len(row)  # Rojo claro solo para diferencias
-                    else:
-                        return [''] * len(row)  # Sin resaltado para coincidencias
-                
-                # Aplicar el estilo
-                styled_anexos = reporte_anexos.style.apply(resaltar_solo_validacion_anexos, axis=1)
-                
-                st.dataframe(styled_anexos, use_container_width=True)
+        reporte_anexos = st.session_state.reporte_anexos
+        if reporte_anexos is not None and not reporte_anexos.empty:
+            st.markdown("**Detalle de Validación:**")
+            mostrar_tabla_paginada(reporte_anexos, "anexos", COLUMNA_VEREDICTO_ANEXOS, "Numero DI",
+                                   columna_campo="Campos DI a Validar")
 
     # Resultados de Comparación DIM vs Subpartidas - TABLA DETALLADA (OPCIONAL)
     with st.expander("🔍 Ver Detalle de Comparación DIM vs Subpartidas"):
         if st.session_state.reporte_comparacion is not None:
             reporte = st.session_state.reporte_comparacion
             
-            # Mostrar tabla de resultados con resaltado SOLO para diferencias
             st.markdown("**Detalle por Declaración:**")
             
             # Filtrar solo filas individuales (excluyendo totales acumulados)
-            di_individuales = reporte[
-                (reporte['4. Número DI'] != 'VALORES ACUMULADOS') & 
-                (reporte['4. Número DI'] != 'VALORES ACUMULADOS (MÚLTIPLES SUBPARTIDAS)')
-            ]
-            
-            def resaltar_solo_diferencias(row):
-                """Resalta SOLO filas que tienen diferencias (❌)"""
-                if '❌' in str(row['Resultado verificación']):
-                    return ['background-color: #ffcccc'] * len(row)  # Rojo claro solo para diferencias
-                else:
-                    return [''] * len(row)  # Sin resaltado para conformes
-            
-            # Aplicar el estilo
-            styled_reporte = di_individuales.style.apply(resaltar_solo_diferencias, axis=1)
-            
-            # Mostrar la tabla con estilos
-            st.dataframe(styled_reporte, use_container_width=True)
+            mascara_totales = reporte['4. Número DI'].astype(str).str.startswith('VALORES ACUMULADOS')
+            mostrar_tabla_paginada(reporte[~mascara_totales], "comparacion", COLUMNA_VEREDICTO_COMPARACION, "4. Número DI")
             
             # MOSTRAR TOTALES ACUMULADOS (como estaba antes)
             fila_totales = reporte[reporte['4. Número DI'] == 'VALORES ACUMULADOS']
@@ -560,6 +433,113 @@ def mostrar_resultados_en_pantalla():
                 if '❌' in str(fila_totales_multiples.iloc[0]['Resultado verificación']):
                     st.warning("⚠️ Se detectaron diferencias en los totales de múltiples subpartidas")
 
+    if st.session_state.di_duplicadas:
+        mostrar_di_duplicadas(st.session_state.di_duplicadas)
+
+    if st.session_state.rendimiento:
+        mostrar_rendimiento(st.session_state.rendimiento)
+
+TAMANOS_PAGINA = (25, 50, 100, 250)
+
+def _campos_comparacion(columnas):
+    """Nombres de campo de un reporte con columnas pareadas '<campo> DI' / '<campo> Subpartida'"""
+    return list(dict.fromkeys(c[:-len(" DI")] for c in columnas if c.endswith(" DI")))
+
+@st.fragment
+def mostrar_tabla_paginada(df, clave, columna_veredicto, columna_di, columna_campo=None):
+    """Tabla con filtros (solo diferencias, DI, campo) y paginación. Se ejecuta como
+    fragmento: los filtros solo recalculan esta tabla y solo se estiliza la página visible"""
+    mascara_diferencias = df[columna_veredicto].astype(str).str.contains(MARCA_DIFERENCIA, regex=False)
+    # Cambiar un filtro vuelve a la primera página (la actual podría dejar de existir)
+    volver_inicio = lambda: st.session_state.update({f"{clave}_pagina": 1})
+
+    col1, col2, col3 = st.columns([1, 2, 2])
+    with col1:
+        solo_diferencias = st.checkbox(f"Solo diferencias ({int(mascara_diferencias.sum())})", key=f"{clave}_solo_dif", on_change=volver_inicio)
+    with col2:
+        dis = st.multiselect("DI", df[columna_di].astype(str).unique().tolist(), key=f"{clave}_di", on_change=volver_inicio)
+    with col3:
+        if columna_campo:
+            campos = st.multiselect("Campo", df[columna_campo].astype(str).unique().tolist(), key=f"{clave}_campo", on_change=volver_inicio)
+        else:
+            campos = st.multiselect("Campo", _campos_comparacion(df.columns), key=f"{clave}_campo", on_change=volver_inicio)
+
+    mascara = pd.Series(True, index=df.index)
+    if solo_diferencias:
+        mascara &= mascara_diferencias
+    if dis:
+        mascara &= df[columna_di].astype(str).isin(dis)
+    columnas = list(df.columns)
+    if campos and columna_campo:
+        mascara &= df[columna_campo].astype(str).isin(campos)
+    elif campos:
+        columnas = [c for c in df.columns if c in (columna_di, columna_veredicto) or any(c.startswith(f"{campo} ") for campo in campos)]
+    filtrado = df.loc[mascara, columnas]
+
+    if filtrado.empty:
+        st.info("No hay filas para los filtros seleccionados")
+        return
+
+    col1, col2, col3 = st.columns([1, 1, 3])
+    with col1:
+        tamano = st.selectbox("Filas por página", TAMANOS_PAGINA, key=f"{clave}_tamano", on_change=volver_inicio)
+    total_paginas = max(1, -(-len(filtrado) // tamano))
+    with col2:
+        pagina = st.number_input("Página", min_value=1, max_value=total_paginas, step=1, key=f"{clave}_pagina")
+    with col3:
+        st.caption(f"{len(filtrado)} filas · página {min(pagina, total_paginas)} de {total_paginas}")
+
+    inicio = (min(pagina, total_paginas) - 1) * tamano
+    visible = filtrado.iloc[inicio:inicio + tamano]
+    # Resaltado vectorizado: una sola máscara por página en lugar de una función por fila
+    estilos = pd.DataFrame("", index=visible.index, columns=visible.columns)
+    estilos.loc[mascara_diferencias.loc[visible.index].to_numpy()] = "background-color: #ffcccc"
+    st.dataframe(visible.style.apply(lambda _: estilos, axis=None), use_container_width=True)
+
+def mostrar_di_duplicadas(duplicados):
+    """DI repetidas entre los PDF cargados: las copias idénticas no se cuentan dos veces"""
+    copias = sum(d['Tipo'] == verificacion_dim.TIPO_COPIA_IDENTICA for d in duplicados)
+    with st.expander(f"♻️ DI repetidas en los PDF ({copias} copias omitidas)"):
+        st.dataframe(pd.DataFrame(duplicados), use_container_width=True)
+
+def mostrar_rendimiento(rendimiento):
+    """Muestra los tiempos por etapa, archivo y campo del último procesamiento"""
+    with st.expander("⏱️ Rendimiento"):
+        contadores = rendimiento.get('contadores', {})
+        col1, col2 = st.columns(2)
+        with col1:
+            st.metric("Páginas procesadas", contadores.get('paginas', 0))
+        with col2:
+            st.metric("MB leídos", f"{contadores.get('bytes_leidos', 0) / 1024 / 1024:.1f}")
+
+        if rendimiento.get('etapas'):
+            st.markdown("**Tiempo por etapa (s):**")
+            df_etapas = pd.DataFrame.from_dict(rendimiento['etapas'], orient='index').sort_values('pared', ascending=False)
+            st.dataframe(df_etapas, use_container_width=True)
+
+        if rendimiento.get('archivos'):
+            st.markdown("**Tiempo por archivo (s, pared):**")
+            df_archivos = pd.DataFrame({
+                archivo: {etapa: datos['pared'] for etapa, datos in etapas.items()}
+                for archivo, etapas in rendimiento['archivos'].items()
+            }).T.fillna(0)
+            st.dataframe(df_archivos, use_container_width=True)
+
+        if rendimiento.get('campos'):
+            st.markdown("**Regex por campo (s):**")
+            df_campos = pd.DataFrame.from_dict(rendimiento['campos'], orient='index').sort_values('pared', ascending=False)
+            st.dataframe(df_campos, use_container_width=True)
+
+        sin_aciertos = estadisticas_patrones_dim.patrones_sin_aciertos(
+            rendimiento.get('patrones', {}), verificacion_dim.PATRONES_CAMPOS_DI)
+        if sin_aciertos:
+            st.markdown("**Patrones que no encontraron su campo (por formato de DI):**")
+            st.dataframe(pd.DataFrame(sin_aciertos), use_container_width=True)
+
+        if rendimiento.get('excesos_regex'):
+            st.warning(f"⏱️ {len(rendimiento['excesos_regex'])} DI omitidas porque un patrón superó su tiempo máximo")
+            st.dataframe(pd.DataFrame(rendimiento['excesos_regex']), use_container_width=True)
+
 def mostrar_botones_descarga():
     """Muestra los botones para descargar los Excel"""
     
@@ -609,6 +589,31 @@ def mostrar_botones_descarga():
                 use_container_width=True
             )
 
+    # Formatos para sistemas externos: se generan solo al elegirlos
+    formato = st.selectbox("Otros formatos", ["—", "csv", "json", "parquet"], key="formato_exportacion")
+    if formato != "—":
+        col1, col2 = st.columns(2)
+        reportes = [
+            (col1, st.session_state.reporte_comparacion, "Comparacion_DIM_Subpartidas", "Validación DIM vs Subpartidas"),
+            (col2, st.session_state.reporte_anexos, "Validacion_Anexos_FMM", "Comparación Anexos FMM")
+        ]
+        for columna, reporte, nombre, titulo in reportes:
+            if reporte is None or reporte.empty:
+                continue
+            with columna:
+                try:
+                    datos = exportar_a_bytes(reporte, formato)
+                except ImportError as e:
+                    st.warning(f"⚠️ {formato} no disponible en el servidor: {e}")
+                    continue
+                st.download_button(
+                    label=f"📥 {titulo} ({formato.upper()})",
+                    data=datos,
+                    file_name=f"{nombre}.{formato}",
+                    use_container_width=True,
+                    key=f"download_{nombre}_{formato}_{st.session_state.download_counter}"
+                )
+
 def main():
     inicializar_estados()
     
@@ -651,7 +656,12 @@ def main():
             st.session_state.resumen_codigos = None
             st.session_state.estadisticas_validacion = None
             st.session_state.validacion_integridad = None
+            st.session_state.rendimiento = None
+            st.session_state.di_duplicadas = None
             st.session_state.procesamiento_completado = False
+            st.session_state.trabajo_id = None
+            st.session_state.trabajo_aplicado = None
+            st.query_params.clear()
             
             # Incrementar el contador para forzar nuevos file uploaders
             st.session_state.uploader_key_counter += 1
@@ -663,6 +673,13 @@ def main():
             # Forzar actualización
             st.rerun()
 
+        # Volver a una verificación enviada antes (desde esta u otra sesión)
+        st.markdown("---")
+        id_recuperar = st.text_input("🆔 Recuperar verificación por ID", key="id_recuperar")
+        if st.button("🔎 Recuperar", use_container_width=True) and id_recuperar:
+            seguir_trabajo(id_recuperar.strip())
+            st.rerun()
+
     # Sección de carga de archivos
     st.header("Cargar Archivos")
 
@@ -716,6 +733,11 @@ def main():
     # Proceso de conciliación
     st.header("Proceso: Verificación")
 
+    # Verificación en segundo plano pendiente de cargar
+    if st.session_state.trabajo_id and st.session_state.trabajo_id != st.session_state.trabajo_aplicado:
+        mostrar_trabajo_en_curso()
+        return
+
     # Verificar archivos mínimos para nuevo procesamiento
     archivos_cargados = (dian_pdfs and excel_subpartidas and excel_anexos)
 
@@ -730,11 +752,8 @@ def main():
             st.markdown("---")
             st.subheader("Reprocesar con nuevos archivos")
             if st.button("🔄 Ejecutar Nueva Verificación", type="primary", use_container_width=True):
-                with st.spinner("Procesando nueva verificación..."):
-                    resultados = procesar_conciliacion(dian_pdfs, excel_subpartidas, excel_anexos)
-                    if resultados:
-                        st.success("✅ Nueva verificación completada exitosamente")
-                        st.rerun()
+                if procesar_conciliacion(dian_pdfs, excel_subpartidas, excel_anexos):
+                    st.rerun()
         return
 
     # Si no hay resultados previos, procesar normalmente
@@ -753,13 +772,8 @@ def main():
 
     # Botón de procesamiento
     if st.button("🔄 Ejecutar Verificación", type="primary", use_container_width=True):
-        with st.spinner("Procesando verificación..."):
-            resultados = procesar_conciliacion(dian_pdfs, excel_subpartidas, excel_anexos)
-            
-            if resultados:
-                st.session_state.procesamiento_completado = True
-                st.success("✅ Verificación completada exitosamente")
-                st.rerun()
+        if procesar_conciliacion(dian_pdfs, excel_subpartidas, excel_anexos):
+            st.rerun()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,203 @@
+# Benchmark por etapas del pipeline de verificación sobre operaciones sintéticas.
+#
+#   python -m benchmarks.ejecutar_benchmarks --tamanos 10 100 1000
+#   python -m benchmarks.ejecutar_benchmarks --guardar      (actualiza baseline.json)
+#   python -m benchmarks.ejecutar_benchmarks --comparar     (falla si hay regresiones)
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime
+from contextlib import redirect_stdout
+
+from verificacion_dim import (
+    MotorDeclaraciones,
+    ComparadorDatos,
+    ExtractorSubpartidas,
+    ValidadorDeclaracionImportacionCompleto,
+    CAMPOS_DIAN,
+    precalentar
+)
+from registros_dim import registros_a_dataframe
+from exportacion_dim import escribir_excel, COLUMNA_VEREDICTO_COMPARACION, COLUMNA_VEREDICTO_ANEXOS
+from benchmarks.generadores import generar_operacion
+
+RUTA_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+TAMANOS_POR_DEFECTO = (10, 100, 1000)
+UMBRAL_REGRESION = 0.25
+COLUMNAS_DIAN = ("Nombre Archivo PDF",) + tuple(CAMPOS_DIAN.values())
+
+ETAPAS = ('texto_pdf', 'division_di', 'regex_campos', 'comparacion',
+          'anexos_fmm', 'validacion', 'escritura_excel')
+
+# Módulos de entrada cuyo arranque en frío se mide en un intérprete nuevo
+MODULOS_ARRANQUE = ('verificacion_dim', 'cli_dim', 'pipeline_dim')
+
+_CODIGO_ARRANQUE = """
+import json, sys, time
+inicio = time.perf_counter()
+import {modulo}
+importacion = time.perf_counter() - inicio
+import verificacion_dim
+pesados = [m for m in ('pandas', 'numpy', 'pdfplumber', 'openpyxl') if m in sys.modules]
+inicio = time.perf_counter()
+detalle = verificacion_dim.precalentar()
+print(json.dumps({{'importacion': importacion, 'precalentar': time.perf_counter() - inicio,
+                  'detalle_precalentar': detalle, 'pesados_al_importar': pesados}}))
+"""
+
+def _cronometrar(funcion):
+    inicio = time.perf_counter()
+    resultado = funcion()
+    return resultado, time.perf_counter() - inicio
+
+def medir_operacion(operacion, carpeta_salida):
+    """Mide cada etapa del pipeline una vez y retorna los segundos por etapa"""
+    tiempos = {}
+    motor = MotorDeclaraciones()
+    validador = ValidadorDeclaracionImportacionCompleto()
+    pdfs = operacion['pdfs']
+
+    textos, tiempos['texto_pdf'] = _cronometrar(lambda: [(os.path.basename(p), motor.extraer_texto_pdf(p)) for p in pdfs])
+
+    bloques, tiempos['division_di'] = _cronometrar(
+        lambda: [(nombre, motor.dividir_declaraciones(texto, nombre)) for nombre, texto in textos])
+
+    def _regex():
+        # Como MotorDeclaraciones.procesar_texto: una detección de versión por PDF y las regex de su perfil
+        registros = []
+        for nombre, bloques_pdf in bloques:
+            perfil = motor.detectar_perfil(bloques_pdf[0]['text'])
+            registros.extend(r for r in (motor.procesar_declaracion(b['text'], b['form_number'], nombre, perfil)
+                                         for b in bloques_pdf) if r)
+        return registros
+    registros, tiempos['regex_campos'] = _cronometrar(_regex)
+
+    import pandas as pd
+    datos_dian = registros_a_dataframe(registros, COLUMNAS_DIAN)
+    datos_sub = ExtractorSubpartidas().extraer_y_estandarizar_archivo(operacion['subpartidas'])
+    comparador = ComparadorDatos()
+    reporte, tiempos['comparacion'] = _cronometrar(lambda: comparador.generar_reporte_tabular(datos_dian, datos_sub))
+
+    def _anexos():
+        validador.extraer_proveedor_formulario(operacion['formulario'])
+        return validador.extraer_anexos_formulario_robusto(operacion['formulario'])
+    anexos, tiempos['anexos_fmm'] = _cronometrar(_anexos)
+
+    def _validacion():
+        # La validación consume los registros ya extraídos: el motor lee cada PDF una sola vez
+        decs = registros
+        facts_form = anexos[anexos['Codigo'] == 6]['Documento'].tolist()
+        facts_decs = {d.numero_di: d.get('51. No. Factura Comercial', 'NO ENCONTRADO') for d in decs}
+        validador.facturas_emparejadas = validador._emparejar_facturas_completo(facts_decs, facts_form)
+        return pd.concat([validador.validar_campos_por_declaracion(d, anexos) for d in decs], ignore_index=True)
+    reporte_anexos, tiempos['validacion'] = _cronometrar(_validacion)
+
+    def _escritura():
+        escribir_excel(reporte, os.path.join(carpeta_salida, "comparacion.xlsx"), columna_veredicto=COLUMNA_VEREDICTO_COMPARACION)
+        escribir_excel(reporte_anexos, os.path.join(carpeta_salida, "anexos.xlsx"), hoja='Validacion_Detallada',
+                       columna_veredicto=COLUMNA_VEREDICTO_ANEXOS)
+    _, tiempos['escritura_excel'] = _cronometrar(_escritura)
+
+    tiempos['total'] = sum(tiempos[e] for e in ETAPAS)
+    return {etapa: round(segundos, 4) for etapa, segundos in tiempos.items()}
+
+def medir_arranque(modulos=MODULOS_ARRANQUE, repeticiones=3):
+    """Segundos de `import modulo` y del precalentamiento en un intérprete nuevo (mejor de n)"""
+    raiz = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    arranque = {}
+    for modulo in modulos:
+        mejores = None
+        for _ in range(repeticiones):
+            salida = subprocess.run([sys.executable, '-c', _CODIGO_ARRANQUE.format(modulo=modulo)], cwd=raiz,
+                                    capture_output=True, text=True, check=True).stdout
+            medida = json.loads(salida.strip().splitlines()[-1])
+            if mejores is None or medida['importacion'] < mejores['importacion']:
+                mejores = medida
+        arranque[modulo] = {
+            'importacion': round(mejores['importacion'], 4),
+            'precalentar': round(mejores['precalentar'], 4),
+            'detalle_precalentar': {k: round(v, 4) for k, v in mejores['detalle_precalentar'].items()},
+            'pesados_al_importar': mejores['pesados_al_importar']
+        }
+    return arranque
+
+def ejecutar(tamanos, repeticiones=1, semilla=0):
+    """Genera una operación por tamaño y conserva el mejor tiempo de cada etapa"""
+    arranque = medir_arranque()
+    # Las dependencias se importan antes de medir para no cargar su costo a la primera etapa
+    precalentar()
+    resultados = {}
+    for tamano in tamanos:
+        carpeta = tempfile.mkdtemp(prefix=f"bench_dim_{tamano}_")
+        try:
+            operacion = generar_operacion(os.path.join(carpeta, "operacion"), tamano, semilla)
+            mejores = None
+            for _ in range(repeticiones):
+                with redirect_stdout(open(os.devnull, 'w')):
+                    tiempos = medir_operacion(operacion, carpeta)
+                mejores = tiempos if mejores is None else {e: min(mejores[e], tiempos[e]) for e in tiempos}
+            mejores['paginas'] = sum(_contar_paginas(p) for p in operacion['pdfs'])
+            mejores['pdfs'] = len(operacion['pdfs'])
+            resultados[str(tamano)] = mejores
+            print(f"✅ {tamano} DI: {mejores['total']:.2f} s ({mejores['paginas']} páginas)", file=sys.stderr)
+        finally:
+            shutil.rmtree(carpeta, ignore_errors=True)
+    return {
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'arranque': arranque,
+        'resultados': resultados
+    }
+
+def _contar_paginas(ruta_pdf):
+    import pdfplumber
+    with pdfplumber.open(ruta_pdf) as pdf:
+        return len(pdf.pages)
+
+def comparar_con_baseline(actual, baseline, umbral=UMBRAL_REGRESION):
+    """Lista las etapas cuyo tiempo supera el de la baseline en más del umbral"""
+    regresiones = []
+    for tamano, tiempos in actual['resultados'].items():
+        base = baseline.get('resultados', {}).get(tamano)
+        if not base:
+            continue
+        for etapa in ETAPAS + ('total',):
+            if etapa in base and base[etapa] > 0 and tiempos[etapa] > base[etapa] * (1 + umbral):
+                regresiones.append({'tamano': tamano, 'etapa': etapa, 'baseline': base[etapa],
+                                    'actual': tiempos[etapa], 'variacion': round(tiempos[etapa] / base[etapa] - 1, 3)})
+    return regresiones
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark por etapas con DIM y FMM sintéticos")
+    parser.add_argument("--tamanos", nargs='+', type=int, default=list(TAMANOS_POR_DEFECTO), help="Número de DI por operación")
+    parser.add_argument("--repeticiones", type=int, default=1, help="Repeticiones por tamaño (se toma el mínimo)")
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--guardar", action='store_true', help="Guarda el resultado como nueva baseline")
+    parser.add_argument("--comparar", action='store_true', help="Compara contra la baseline guardada")
+    parser.add_argument("--umbral", type=float, default=UMBRAL_REGRESION, help="Variación tolerada antes de marcar regresión")
+    args = parser.parse_args(argv)
+
+    actual = ejecutar(args.tamanos, args.repeticiones, args.semilla)
+    codigo = 0
+    if args.comparar and os.path.exists(RUTA_BASELINE):
+        with open(RUTA_BASELINE, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        actual['regresiones'] = comparar_con_baseline(actual, baseline, args.umbral)
+        codigo = 1 if actual['regresiones'] else 0
+    if args.guardar:
+        with open(RUTA_BASELINE, 'w', encoding='utf-8') as f:
+            json.dump(actual, f, ensure_ascii=False, indent=2)
+        print(f"💾 Baseline guardada en: {RUTA_BASELINE}", file=sys.stderr)
+
+    print(json.dumps(actual, ensure_ascii=False, indent=2))
+    return codigo
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,230 @@
+# Generadores de documentos sintéticos (DIM en PDF, subpartidas y FMM en Excel).
+# Los PDF se escriben a mano con la fuente estándar Helvetica para no depender de
+# librerías de generación; el texto sigue la disposición de casillas que esperan
+# los patrones de verificacion_dim.
+import os
+import zlib
+import random
+
+from openpyxl import Workbook
+
+NIT_PROVEEDOR = "900123456"
+NOMBRE_PROVEEDOR = "IMPORTADORA SINTETICA SAS"
+MANIFIESTO = "1234567890123"
+DOCUMENTO_TRANSPORTE = "MEDU1234567"
+SUBPARTIDA = "8471300000"
+PAIS_ORIGEN = "215"
+PAIS_COMPRA = "249"
+BANDERA = "169"
+MODALIDAD = "C200"
+TASA_CAMBIO = "3.950,45"
+
+# =============================================================================
+# ESCRITOR MÍNIMO DE PDF
+# =============================================================================
+
+def _escapar_pdf(texto):
+    crudo = texto.encode('cp1252', errors='replace')
+    return crudo.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)')
+
+def _contenido_pagina(lineas, tamano_fuente=6, interlineado=9, margen=20, alto=792):
+    partes = [b"BT", f"/F1 {tamano_fuente} Tf".encode(), f"{interlineado} TL".encode(),
+              f"{margen} {alto - margen} Td".encode()]
+    for linea in lineas:
+        partes.append(b"(" + _escapar_pdf(linea) + b") Tj T*")
+    partes.append(b"ET")
+    return b"\n".join(partes)
+
+def escribir_pdf(ruta, paginas):
+    """Escribe un PDF con una página por cada lista de líneas de texto"""
+    escribir_pdf_crudo(ruta, [(_contenido_pagina(lineas), {}) for lineas in paginas])
+
+def escribir_pdf_crudo(ruta, paginas):
+    """Escribe un PDF con una página por cada `(contenido, xobjects)`: el flujo de contenido
+    tal cual (con la fuente /F1) y los XObjects que dibuja con `Do`, `{nombre: (subtipo,
+    contenido)}`. Un 'Form' lleva su propio flujo con texto en /F1; una 'Image' es un
+    píxel gris (su contenido se ignora)"""
+    objetos = []
+    objetos.append(b"<< /Type /Catalog /Pages 2 0 R >>")
+    objetos.append(None)  # Pages: se completa al conocer los hijos
+    objetos.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+    hijos = []
+    for contenido, xobjects in paginas:
+        referencias = []
+        for nombre, (subtipo, flujo) in xobjects.items():
+            if subtipo == 'Form':
+                flujo = zlib.compress(flujo)
+                objetos.append(b"<< /Type /XObject /Subtype /Form /BBox [0 0 612 792] /Resources << /Font << /F1 3 0 R >> >> "
+                               b"/Length " + str(len(flujo)).encode() + b" /Filter /FlateDecode >>\nstream\n" + flujo + b"\nendstream")
+            else:
+                objetos.append(b"<< /Type /XObject /Subtype /Image /Width 1 /Height 1 /ColorSpace /DeviceGray "
+                               b"/BitsPerComponent 8 /Length 1 >>\nstream\n\x80\nendstream")
+            referencias.append(f"/{nombre} {len(objetos)} 0 R")
+        contenido = zlib.compress(contenido)
+        objetos.append(b"<< /Length " + str(len(contenido)).encode() + b" /Filter /FlateDecode >>\nstream\n" + contenido + b"\nendstream")
+        id_contenido = len(objetos)
+        recursos = "/Font << /F1 3 0 R >>" + (f" /XObject << {' '.join(referencias)} >>" if referencias else "")
+        objetos.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << {recursos} >> /Contents {id_contenido} 0 R >>".encode())
+        hijos.append(len(objetos))
+    objetos[1] = f"<< /Type /Pages /Kids [{' '.join(f'{h} 0 R' for h in hijos)}] /Count {len(hijos)} >>".encode()
+
+    salida = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    desplazamientos = []
+    for i, objeto in enumerate(objetos, start=1):
+        desplazamientos.append(len(salida))
+        salida += f"{i} 0 obj\n".encode() + objeto + b"\nendobj\n"
+    inicio_xref = len(salida)
+    salida += f"xref\n0 {len(objetos) + 1}\n0000000000 65535 f \n".encode()
+    for desplazamiento in desplazamientos:
+        salida += f"{desplazamiento:010d} 00000 n \n".encode()
+    salida += f"trailer\n<< /Size {len(objetos) + 1} /Root 1 0 R >>\nstartxref\n{inicio_xref}\n%%EOF\n".encode()
+    with open(ruta, 'wb') as f:
+        f.write(salida)
+
+# =============================================================================
+# DATOS SINTÉTICOS DE UNA OPERACIÓN
+# =============================================================================
+
+def _numero_dian(valor):
+    """Formato de casillas 71/72/77: miles y decimales con punto (12.345.67)"""
+    entero, decimales = f"{valor:.2f}".split('.')
+    grupos = []
+    while len(entero) > 3:
+        grupos.insert(0, entero[-3:])
+        entero = entero[:-3]
+    grupos.insert(0, entero)
+    return '.'.join(grupos) + '.' + decimales
+
+def generar_declaraciones(num_dis, semilla=0):
+    """Genera los valores de cada DI de una operación"""
+    rnd = random.Random(semilla)
+    declaraciones = []
+    for i in range(num_dis):
+        peso_bruto = round(rnd.uniform(100, 20000), 2)
+        declaraciones.append({
+            'numero_di': f"48202{semilla % 100:02d}{i:08d}",
+            'aceptacion': f"48202{semilla % 100:02d}{i:08d}",
+            'levante': f"88202{semilla % 100:02d}{i:08d}",
+            'factura': f"FAC-{i + 1:05d}",
+            'fecha_factura': f"2024-01-{1 + i % 28:02d}",
+            'fecha_aceptacion': f"2024-02-{1 + i % 28:02d}",
+            'fecha_levante': f"2024-02-{1 + (i + 2) % 28:02d}",
+            'peso_bruto': peso_bruto,
+            'peso_neto': round(peso_bruto * 0.9, 2),
+            'cantidad': float(rnd.randint(1, 500)),
+            'valor_fob': round(rnd.uniform(1000, 90000), 2),
+            'valor_fletes': round(rnd.uniform(10, 900), 2),
+            'valor_seguro': round(rnd.uniform(1, 90), 2),
+            'otros_gastos': round(rnd.uniform(0, 50), 2),
+            'paginas_extra': rnd.choice([0, 0, 1, 2])
+        })
+    return declaraciones
+
+def paginas_declaracion(d, bultos):
+    """Texto de las páginas de una DI: principal, continuaciones y levante"""
+    principal = [
+        "DECLARACION DE IMPORTACION",
+        "4. Número de formulario",
+        d['numero_di'],
+        f"5. Número de Identificación Tributaria (NIT) {NIT_PROVEEDOR} 6. DV 7",
+        "11. Apellidos y nombres o Razón Social",
+        f"{NIT_PROVEEDOR} 7 {NOMBRE_PROVEEDOR} 13. Cod. Admón 03",
+        f"42. Manifiesto de carga No. {MANIFIESTO}",
+        "43. Año - Mes - Día 2024-01-20",
+        f"44. Documento de transporte No. HBL{d['numero_di'][-4:]} No. {DOCUMENTO_TRANSPORTE} ",
+        "45. Año - Mes - Día 2024-01-10 2024-01-12",
+        "51. No. de factura 52. Año - Mes - Día",
+        f"{d['factura']} {d['fecha_factura']}",
+        "55. Código de bandera",
+        f"10 20 {BANDERA}",
+        f"58. Tasa de cambio $ cvs. {TASA_CAMBIO}",
+        "59. Subpartida arancelaria 60. Cod. 61. Cod. 62. Cod. Modalidad 63. No. cuotas 64. Valor cuota USD "
+        "65. Periodicidad del 66. Cod. país 67. Cod. Acuerdo",
+        f"{SUBPARTIDA} 0 0 {MODALIDAD} 0 0.00 0 0",
+        f"País origen {PAIS_ORIGEN} - CHINA",
+        "70. Cod. país compra 71. Peso bruto kgs. dcms. 72. Peso neto kgs. dcms. 74. No. bultos 75. Cod. embalaje",
+        f"{bultos} PK {_numero_dian(d['peso_bruto'])} {_numero_dian(d['peso_neto'])}",
+        f"País compra {PAIS_COMPRA} - ESTADOS UNIDOS",
+        "77. Cantidad dcms. 76. Unidad comercial",
+        f"{_numero_dian(d['cantidad'])} U",
+        "78. Valor FOB USD 79. Valor fletes USD",
+        f"{d['valor_fob']:.2f} {d['valor_fletes']:.2f}",
+        "80. Valor Seguros USD 81. Valor Otros Gastos USD",
+        f"{d['valor_seguro']:.2f} {d['otros_gastos']:.2f}",
+    ]
+    continuaciones = [
+        ["HOJA DE CONTINUACION", "91. Descripción de las mercancías"] +
+        [f"ITEM {k + 1} EQUIPO DE COMPUTO PORTATIL REFERENCIA SINTETICA LOTE {k:04d}" for k in range(60)]
+        for _ in range(d['paginas_extra'])
+    ]
+    levante = [
+        f"132. No. Aceptación declaración {d['aceptacion']}",
+        f"133. Fecha: {d['fecha_aceptacion']}",
+        f"134. Levante No. {d['levante']}",
+        f"135. Fecha {d['fecha_levante']}",
+    ]
+    return [principal] + continuaciones + [levante]
+
+def _fecha_fmm(fecha_iso):
+    anio, mes, dia = fecha_iso.split('-')
+    return f"{dia}/{mes}/{anio}"
+
+def escribir_subpartidas(ruta, declaraciones, bultos):
+    wb = Workbook()
+    hoja = wb.active
+    hoja.title = "Subpartidas"
+    hoja.append(['SUBPARTIDA', 'DESCRIPCION', 'PESO BRUTO', 'PESO NETO', 'NUMERO BULTOS', 'PAIS ORIGEN',
+                 'PAIS COMPRA', 'BANDERA', 'VALOR FOB', 'VALOR_FLETES', 'VALOR_SEGURO', 'OTROS_GASTOS', 'CANTIDAD'])
+    hoja.append([
+        SUBPARTIDA, 'EQUIPOS DE COMPUTO',
+        round(sum(d['peso_bruto'] for d in declaraciones), 2), round(sum(d['peso_neto'] for d in declaraciones), 2),
+        bultos, PAIS_ORIGEN, PAIS_COMPRA, BANDERA,
+        round(sum(d['valor_fob'] for d in declaraciones), 2), round(sum(d['valor_fletes'] for d in declaraciones), 2),
+        round(sum(d['valor_seguro'] for d in declaraciones), 2), round(sum(d['otros_gastos'] for d in declaraciones), 2),
+        sum(d['cantidad'] for d in declaraciones)
+    ])
+    wb.save(ruta)
+
+def escribir_formulario_fmm(ruta, declaraciones):
+    wb = Workbook()
+    hoja = wb.active
+    hoja.title = "Rpt_Impresion_Formulario"
+    hoja.append(["FORMULARIO DE MOVIMIENTO DE MERCANCIAS"])
+    hoja.append([f"Proveedor/Cliente: {NIT_PROVEEDOR} - {NOMBRE_PROVEEDOR}"])
+    for _ in range(5):
+        hoja.append([])
+    hoja.append(["DETALLE DE LOS ANEXOS"])
+    hoja.append(["CÓDIGO", "DESCRIPCIÓN", "DOCUMENTO", "FECHA"])
+    hoja.append([93, "FORMULARIO DE SALIDA ZONA FRANCA", MANIFIESTO, "20/01/2024"])
+    hoja.append([17, "DOCUMENTO DE TRANSPORTE", DOCUMENTO_TRANSPORTE, "12/01/2024"])
+    for d in declaraciones:
+        hoja.append([6, "FACTURA COMERCIAL", d['factura'], _fecha_fmm(d['fecha_factura'])])
+    for d in declaraciones:
+        hoja.append([9, "DECLARACION DE IMPORTACION", d['numero_di'], _fecha_fmm(d['fecha_aceptacion'])])
+        hoja.append([47, "AUTORIZACION DE LEVANTE", d['levante'], _fecha_fmm(d['fecha_levante'])])
+    wb.save(ruta)
+
+def generar_operacion(carpeta, num_dis, semilla=0, max_dis_por_pdf=5):
+    """Escribe una carpeta de operación completa: PDFs multi-DI, subpartidas y FMM"""
+    os.makedirs(carpeta, exist_ok=True)
+    rnd = random.Random(semilla + 1)
+    declaraciones = generar_declaraciones(num_dis, semilla)
+    bultos = rnd.randint(10, 900)
+
+    pdfs = []
+    i = 0
+    while i < len(declaraciones):
+        grupo = declaraciones[i:i + rnd.randint(1, max_dis_por_pdf)]
+        paginas = []
+        for d in grupo:
+            paginas.extend(paginas_declaracion(d, bultos))
+        ruta_pdf = os.path.join(carpeta, f"DIM_{len(pdfs) + 1:04d}.pdf")
+        escribir_pdf(ruta_pdf, paginas)
+        pdfs.append(ruta_pdf)
+        i += len(grupo)
+
+    ruta_subpartidas = os.path.join(carpeta, "subpartidas.xlsx")
+    ruta_fmm = os.path.join(carpeta, "Rpt_Impresion_Formulario.xlsx")
+    escribir_subpartidas(ruta_subpartidas, declaraciones, bultos)
+    escribir_formulario_fmm(ruta_fmm, declaraciones)
+    return {'pdfs': pdfs, 'subpartidas': ruta_subpartidas, 'formulario': ruta_fmm, 'declaraciones': declaraciones}
@@ -0,0 +1,167 @@
+import os
+import re
+import json
+import hashlib
+import tempfile
+from contextlib import contextmanager
+from collections.abc import Mapping
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo entre procesos
+    fcntl = None
+
+# =============================================================================
+# CACHÉ EN DISCO DE RESULTADOS DE EXTRACCIÓN
+# =============================================================================
+
+def _serializable(valor):
+    # Patrones compilados por su texto completo y flags (su repr se trunca a 200 caracteres)
+    if isinstance(valor, re.Pattern):
+        return [valor.pattern, valor.flags]
+    if isinstance(valor, Mapping):
+        return dict(valor)
+    return str(valor)
+
+def _a_json(valor):
+    # Registros de DI (registros_dim.RegistroDI) por sus campos con valor; escalares de
+    # numpy (p. ej. celdas de una fila de pandas) por su valor de Python
+    if hasattr(valor, 'como_dict'):
+        return valor.como_dict()
+    if type(valor).__module__ == 'numpy' and hasattr(valor, 'item'):
+        return valor.item()
+    return str(valor)
+
+def huella_patrones(*tablas):
+    """Huella corta de las tablas de patrones/campos: cambia si cambia cualquier regex"""
+    contenido = json.dumps(tablas, sort_keys=True, ensure_ascii=False, default=_serializable)
+    return hashlib.sha256(contenido.encode('utf-8')).hexdigest()[:16]
+
+def huella_archivo_codigo(*modulos):
+    """Huella corta del código fuente de los módulos indicados (incluye sus tablas de patrones)"""
+    sha = hashlib.sha256()
+    for modulo in modulos:
+        with open(modulo.__file__, 'rb') as f:
+            sha.update(f.read())
+    return sha.hexdigest()[:16]
+
+def digest_archivo(ruta, tamano_bloque=1024 * 1024):
+    """SHA-256 del contenido de un archivo, leído por bloques (o de un BytesIO sin copiarlo)"""
+    if not isinstance(ruta, str):
+        with ruta.getbuffer() as vista:
+            return hashlib.sha256(vista).hexdigest()
+    sha = hashlib.sha256()
+    with open(ruta, 'rb') as f:
+        for bloque in iter(lambda: f.read(tamano_bloque), b''):
+            sha.update(bloque)
+    return sha.hexdigest()
+
+class CacheExtraccion:
+    """Guarda los registros extraídos de cada PDF indexados por su contenido.
+
+    La clave combina el SHA-256 del PDF, el tipo de extracción y la huella de los
+    patrones, de modo que un cambio de regex invalida solo las entradas afectadas.
+    En `paginas` guarda además el texto por página para no releer los PDF.
+    """
+
+    def __init__(self, directorio):
+        self.directorio = directorio
+        os.makedirs(directorio, exist_ok=True)
+        self.paginas = AlmacenPaginas(os.path.join(directorio, 'paginas'))
+
+    def _ruta(self, digest, tipo, version):
+        return os.path.join(self.directorio, f"{digest}_{tipo}_{version}.json")
+
+    def obtener(self, digest, tipo, version):
+        return _leer_json(self._ruta(digest, tipo, version))
+
+    def guardar(self, digest, tipo, version, registros):
+        _escribir_json(self.directorio, self._ruta(digest, tipo, version), registros)
+
+# =============================================================================
+# ALMACÉN DE PÁGINAS (TEXTO Y PALABRAS POR PÁGINA)
+# =============================================================================
+
+class AlmacenPaginas:
+    """Texto y cajas de palabras de cada página, indexados por la huella de la página.
+
+    Por cada PDF (su SHA-256) se guarda la lista de huellas de sus páginas: si el
+    PDF no cambió su texto se arma sin abrirlo (un cambio de patrones solo repite
+    las regex) y si cambió, solo se extraen las páginas cuya huella es nueva.
+    """
+
+    def __init__(self, directorio):
+        self.directorio = directorio
+        os.makedirs(directorio, exist_ok=True)
+
+    def _ruta_indice(self, digest, version):
+        return os.path.join(self.directorio, f"pdf_{digest}_{version}.json" if version else f"pdf_{digest}.json")
+
+    def _ruta_pagina(self, huella):
+        return os.path.join(self.directorio, f"pagina_{huella}.json")
+
+    def indice(self, digest, version=''):
+        """Huellas de las páginas del PDF en orden (None en las omitidas), o None si
+        nunca se almacenó con esa `version` del criterio de páginas"""
+        return _leer_json(self._ruta_indice(digest, version))
+
+    def guardar_indice(self, digest, huellas, version=''):
+        _escribir_json(self.directorio, self._ruta_indice(digest, version), list(huellas))
+
+    def pagina(self, huella):
+        """{'texto': str, 'palabras': [[x0, top, x1, bottom, texto], ...]} o None"""
+        return _leer_json(self._ruta_pagina(huella))
+
+    def guardar_pagina(self, huella, texto, palabras):
+        _escribir_json(self.directorio, self._ruta_pagina(huella), {'texto': texto, 'palabras': palabras})
+
+# =============================================================================
+# CARPETA PREDETERMINADA DE LO APRENDIDO ENTRE EJECUCIONES
+# =============================================================================
+
+# Estadísticas de patrones y plantillas de Excel de la app y del lote, que no usan una
+# caché de extracción; la variable de entorno la cambia (también para procesos hijos)
+VARIABLE_DIRECTORIO_APRENDIZAJE = "VERIFICACION_DIM_APRENDIZAJE"
+DIRECTORIO_APRENDIZAJE = os.path.join(os.path.expanduser("~"), ".cache", "verificacion_dim")
+
+def directorio_aprendizaje():
+    """Carpeta (creada si falta) de lo aprendido entre ejecuciones; None si no se puede crear"""
+    directorio = os.environ.get(VARIABLE_DIRECTORIO_APRENDIZAJE) or DIRECTORIO_APRENDIZAJE
+    try:
+        os.makedirs(directorio, exist_ok=True)
+    except OSError:
+        return None
+    return directorio
+
+def _leer_json(ruta):
+    if not os.path.exists(ruta):
+        return None
+    try:
+        with open(ruta, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _escribir_json(directorio, ruta, datos):
+    # Escritura atómica: un proceso concurrente nunca lee un archivo a medias
+    descriptor, temporal = tempfile.mkstemp(dir=directorio, suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, 'w', encoding='utf-8') as f:
+            json.dump(datos, f, ensure_ascii=False, default=_a_json)
+        os.replace(temporal, ruta)
+    except OSError:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+
+@contextmanager
+def _bloqueo_exclusivo(ruta):
+    """Bloqueo entre procesos para leer, modificar y reescribir `ruta` (sobre `ruta`.lock)"""
+    if fcntl is None:
+        yield
+        return
+    with open(ruta + ".lock", 'a') as candado:
+        fcntl.flock(candado, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(candado, fcntl.LOCK_UN)
@@ -0,0 +1,46 @@
+import time
+import importlib
+
+# =============================================================================
+# IMPORTACIÓN DIFERIDA DE DEPENDENCIAS PESADAS
+# =============================================================================
+
+class ModuloPerezoso:
+    """Sustituto de un módulo que lo importa en el primer acceso a un atributo.
+
+    pandas, numpy, pdfplumber y openpyxl suman más de medio segundo de arranque;
+    así la CLI (--help, errores de argumentos) y la primera pantalla de la app no
+    los pagan hasta que una etapa realmente los usa.
+    """
+
+    def __init__(self, nombre):
+        self.__dict__['_nombre_modulo'] = nombre
+        self.__dict__['_modulo'] = None
+
+    def cargar(self):
+        if self._modulo is None:
+            modulo = importlib.import_module(self._nombre_modulo)
+            # Los atributos quedan en el propio sustituto: los accesos siguientes no pasan por __getattr__
+            self.__dict__.update(vars(modulo))
+            self.__dict__['_modulo'] = modulo
+        return self._modulo
+
+    @property
+    def cargado(self):
+        return self._modulo is not None
+
+    def __getattr__(self, atributo):
+        return getattr(self.cargar(), atributo)
+
+    def __repr__(self):
+        estado = "cargado" if self.cargado else "sin cargar"
+        return f"<módulo perezoso '{self._nombre_modulo}' ({estado})>"
+
+def precargar(*modulos):
+    """Fuerza la importación de los módulos perezosos y retorna los segundos de cada uno"""
+    tiempos = {}
+    for modulo in modulos:
+        inicio = time.perf_counter()
+        modulo.cargar()
+        tiempos[modulo._nombre_modulo] = time.perf_counter() - inicio
+    return tiempos
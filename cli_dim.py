@@ -0,0 +1,252 @@
+import os
+import sys
+import glob
+import json
+import argparse
+from contextlib import redirect_stdout
+
+from verificacion_dim import (
+    ExtractorDIANSimplificado,
+    ComparadorDatos,
+    ExtractorSubpartidas,
+    ValidadorDeclaracionImportacionCompleto,
+    MotorDeclaraciones,
+    deduplicar_registros,
+    NOMBRE_REPORTE_COMPARACION,
+    NOMBRE_REPORTE_ANEXOS
+)
+from cache_dim import CacheExtraccion
+from estadisticas_patrones_dim import EstadisticasPatrones
+from plantillas_excel_dim import CachePlantillas
+from operacion_dim import OperacionAcumulada, TIPO_COMPARACION, TIPO_ANEXOS
+from triaje_dim import triaje_pdfs
+from ocr_dim import ocr_disponible
+from exportacion_dim import exportar_reporte, FORMATOS_EXPORTACION, COLUMNA_VEREDICTO_ANEXOS
+from instrumentacion_dim import combinar_tiempos, VARIABLE_PERFILAR, VARIABLE_CARPETA_PERFILES
+
+# Códigos de salida
+EXIT_CONFORME = 0
+EXIT_DIFERENCIAS = 1
+EXIT_ERROR = 2
+
+FORMATOS_SALIDA = FORMATOS_EXPORTACION
+
+# =============================================================================
+# ESCRITURA DE REPORTES
+# =============================================================================
+
+def guardar_reporte(df, ruta_base, formato, columna_veredicto=None):
+    """Guarda el DataFrame en el formato pedido y retorna la ruta final"""
+    ruta = f"{ruta_base}.{formato}"
+    exportar_reporte(df, ruta, formato, columna_veredicto)
+    return ruta
+
+# =============================================================================
+# RESOLUCIÓN DE ENTRADAS
+# =============================================================================
+
+def resolver_entradas(args):
+    """Completa las rutas no indicadas buscando en --carpeta con la lógica de las clases"""
+    pdfs = list(args.pdf or [])
+    subpartidas = args.subpartidas
+    formulario = args.formulario
+    if args.carpeta:
+        if not pdfs:
+            pdfs = sorted(glob.glob(os.path.join(args.carpeta, "*.pdf")))
+        if not subpartidas:
+            subpartidas = ExtractorSubpartidas().buscar_archivo_subpartidas(args.carpeta)
+        if not formulario:
+            formulario = ValidadorDeclaracionImportacionCompleto().buscar_archivo_formulario(args.carpeta)
+    return pdfs, subpartidas, formulario
+
+# =============================================================================
+# EJECUCIÓN
+# =============================================================================
+
+def ejecutar_verificacion(pdfs, subpartidas, formulario, salida, formato, max_workers=1, cache=None, operacion=None,
+                          workers_ocr=1):
+    """Ejecuta comparación y validación y retorna (resumen, código de salida).
+
+    Con `operacion` (operacion_dim.OperacionAcumulada, modo anexar) los PDF se suman a los
+    de entregas anteriores: solo se extraen, comparan y validan los que la operación no
+    tiene, y los reportes cubren la operación completa.
+    """
+    resumen = {'pdfs': pdfs, 'subpartidas': subpartidas, 'formulario': formulario,
+               'comparacion': None, 'anexos': None, 'reportes': []}
+    os.makedirs(salida, exist_ok=True)
+    registros_tiempos = []
+
+    hay_diferencias = False
+    hay_incompletos = False
+
+    # Cada PDF se extrae una sola vez; comparación y validación usan los mismos registros.
+    # Con caché, el texto por página también queda guardado (un cambio de patrones no relee los PDF)
+    # y los aciertos de cada patrón se acumulan entre ejecuciones para ordenarlos por formato
+    motor = MotorDeclaraciones(paginas=cache.paginas if cache is not None else None, workers_ocr=workers_ocr,
+                               estadisticas=EstadisticasPatrones.en_directorio(cache.directorio) if cache is not None else None)
+    registros_tiempos.append(motor.tiempos)
+    por_extraer = pdfs
+    if operacion is not None:
+        operacion.preparar(motor.version(), subpartidas, formulario)
+        pendientes = operacion.pendientes(pdfs)
+        por_extraer = [pdf for pdf, _ in pendientes]
+        for motivo in operacion.descartes:
+            print(f"♻️ Operación: cambió {motivo}, se recalcula")
+        print(f"📚 Operación con {len(operacion.pdfs)} PDF: se agregan {len(por_extraer)} nuevos")
+
+    # Pre-escaneo: tamaño estimado y PDFs escaneados (sin texto) avisados antes de extraer
+    triaje = triaje_pdfs(por_extraer, max_workers)
+    resumen['triaje'] = {clave: triaje[clave] for clave in ('paginas', 'di_estimadas', 'eta_segundos', 'sin_texto')}
+    print(f"🔎 {len(por_extraer)} PDF, {triaje['paginas']} páginas, ~{triaje['di_estimadas']} DI, ETA ~{triaje['eta_segundos']:.0f} s")
+    for archivo in triaje['sin_texto']:
+        destino = "se leerá con OCR" if ocr_disponible() else "sin OCR (pytesseract + Tesseract) no se extraerán DI de él"
+        print(f"⚠️ {archivo} no tiene capa de texto (¿escaneado?): {destino}")
+
+    registros = motor.procesar_archivos(por_extraer, max_workers, cache)
+    resumen['di_duplicadas'] = motor.duplicados
+    if operacion is not None:
+        # Las DI de la entrega se suman a las anteriores; una copia de una DI ya incorporada se omite
+        operacion.agregar(pendientes, motor.registros_por_archivo)
+        registros, resumen['di_duplicadas'] = deduplicar_registros(operacion.registros())
+        resumen['pdfs'] = operacion.archivos()
+        resumen['operacion'] = {'pdfs_nuevos': [os.path.basename(pdf) for pdf in por_extraer],
+                                'pdfs_acumulados': len(operacion.pdfs), 'di_acumuladas': len(registros),
+                                'recalculado_por': operacion.descartes}
+    resumen['patrones_sin_aciertos'] = motor.estadisticas.sin_aciertos(motor.patrones)
+
+    # Con caché, el formato resuelto de cada libro (hoja, encabezados, columnas) se reutiliza entre ejecuciones
+    plantillas = CachePlantillas.en_directorio(cache.directorio) if cache is not None else None
+
+    if subpartidas:
+        extractor_dian = ExtractorDIANSimplificado()
+        extractor_subpartidas = ExtractorSubpartidas(plantillas)
+        comparador = ComparadorDatos()
+        registros_tiempos += [extractor_dian.tiempos, extractor_subpartidas.tiempos, comparador.tiempos]
+        datos_dian = extractor_dian.procesar_archivos_pdf(pdfs, registros=registros)
+        datos_sub = extractor_subpartidas.extraer_y_estandarizar_archivo(subpartidas)
+        if datos_dian is not None and not datos_dian.empty and not datos_sub.empty:
+            ruta_base = os.path.join(salida, os.path.splitext(NOMBRE_REPORTE_COMPARACION)[0])
+            previas = operacion.filas_previas(registros, TIPO_COMPARACION) if operacion is not None else None
+            if formato == 'xlsx':
+                reporte = comparador.generar_reporte_comparacion(datos_dian, datos_sub, f"{ruta_base}.xlsx", previas)
+                resumen['reportes'].append(f"{ruta_base}.xlsx")
+            else:
+                reporte = comparador.generar_reporte_tabular(datos_dian, datos_sub, previas)
+                resumen['reportes'].append(guardar_reporte(reporte, ruta_base, formato))
+            if operacion is not None:
+                operacion.guardar_filas(registros, TIPO_COMPARACION, comparador.filas_por_di)
+                resumen['operacion']['di_comparadas_reutilizadas'] = sum(p is not None for p in previas)
+
+            mascara_totales = reporte['4. Número DI'].astype(str).str.contains('VALORES ACUMULADOS', na=False)
+            individuales = reporte[~mascara_totales]
+            conformes = int((individuales['Resultado verificación'] == '✅ CONFORME').sum())
+            totales = reporte[mascara_totales]['Resultado verificación'].tolist()
+            resumen['comparacion'] = {
+                'di_procesadas': len(individuales),
+                'di_conformes': conformes,
+                'di_con_diferencias': len(individuales) - conformes,
+                'totales': totales[0] if totales else None
+            }
+            hay_diferencias |= conformes != len(individuales) or any('❌' in t for t in totales)
+        else:
+            hay_incompletos = True
+
+    if formulario:
+        validador = ValidadorDeclaracionImportacionCompleto(plantillas)
+        registros_tiempos.append(validador.tiempos)
+        previas = operacion.filas_previas(registros, TIPO_ANEXOS) if operacion is not None else None
+        reporte_anexos = validador.procesar_validacion_archivos(formulario, pdfs, None, registros=registros,
+                                                                previas=previas)
+        if operacion is not None:
+            operacion.guardar_validaciones(validador.validaciones)
+            resumen['operacion']['di_validadas_reutilizadas'] = sum(p is not None for p in previas)
+        if reporte_anexos is not None:
+            ruta_base = os.path.join(salida, os.path.splitext(NOMBRE_REPORTE_ANEXOS)[0])
+            resumen['reportes'].append(guardar_reporte(reporte_anexos, ruta_base, formato, COLUMNA_VEREDICTO_ANEXOS))
+            con_errores = reporte_anexos[reporte_anexos['Coincidencias'] == '❌ NO COINCIDE']['Numero DI'].nunique()
+            total = reporte_anexos['Numero DI'].nunique()
+            resumen['anexos'] = {
+                'nit_proveedor': validador.nit_proveedor,
+                'nombre_proveedor': validador.nombre_proveedor,
+                'declaraciones_validadas': total,
+                'declaraciones_con_errores': con_errores,
+                'declaraciones_correctas': total - con_errores
+            }
+            hay_diferencias |= con_errores > 0
+        else:
+            hay_incompletos = True
+
+    if operacion is not None:
+        operacion.guardar()
+    resumen['tiempos'] = combinar_tiempos(*registros_tiempos)
+    # DI omitidas por tiempo de regex dejan el resultado incompleto
+    resumen['regex_excedidos'] = resumen['tiempos']['excesos_regex']
+    hay_incompletos |= bool(resumen['regex_excedidos'])
+
+    if hay_incompletos:
+        codigo = EXIT_ERROR
+    elif hay_diferencias:
+        codigo = EXIT_DIFERENCIAS
+    else:
+        codigo = EXIT_CONFORME
+    resumen['estado'] = {EXIT_CONFORME: 'CONFORME', EXIT_DIFERENCIAS: 'CON DIFERENCIAS', EXIT_ERROR: 'ERROR'}[codigo]
+    return resumen, codigo
+
+def construir_parser():
+    parser = argparse.ArgumentParser(
+        description="Verificación DIM vs Subpartidas y Anexos FMM sin interfaz gráfica",
+        epilog="Códigos de salida: 0 = conforme, 1 = con diferencias, 2 = error o datos insuficientes"
+    )
+    parser.add_argument("--carpeta", help="Carpeta de la operación (se buscan PDFs y Excel no indicados)")
+    parser.add_argument("--pdf", nargs='+', help="PDFs de las declaraciones (DIM)")
+    parser.add_argument("--subpartidas", help="Excel de subpartidas")
+    parser.add_argument("--formulario", help="Excel del formulario FMM (Rpt_Impresion_Formulario)")
+    parser.add_argument("--salida", default=".", help="Carpeta donde se escriben los reportes")
+    parser.add_argument("--formato", choices=FORMATOS_SALIDA, default='xlsx', help="Formato de los reportes")
+    parser.add_argument("--workers", type=int, default=1, help="Procesos para extraer PDFs en paralelo")
+    parser.add_argument("--workers-ocr", type=int, default=1,
+                        help="Procesos para reconocer con OCR las páginas escaneadas de un PDF")
+    parser.add_argument("--cache-dir", help="Carpeta de caché de extracción por contenido de PDF")
+    parser.add_argument("--operacion",
+                        help="Carpeta del estado de la operación (modo anexar): los PDF se suman a los de entregas "
+                             "anteriores y solo se extraen y validan los nuevos")
+    parser.add_argument("--triaje", action='store_true',
+                        help="Solo pre-escanea los PDFs (páginas, DI estimadas, ETA, PDFs sin texto) sin extraerlos")
+    parser.add_argument("--quiet", action='store_true', help="Suprime el detalle de consola del proceso")
+    parser.add_argument("--perfilar", nargs='+', help="Etapas a perfilar con cProfile (p. ej. texto_pdf regex_campos)")
+    parser.add_argument("--carpeta-perfiles", default=".", help="Carpeta donde se vuelcan los .prof")
+    return parser
+
+def main(argv=None):
+    args = construir_parser().parse_args(argv)
+    if args.perfilar:
+        # Por entorno para que también lo hereden los procesos de extracción
+        os.environ[VARIABLE_PERFILAR] = ','.join(args.perfilar)
+        os.environ[VARIABLE_CARPETA_PERFILES] = args.carpeta_perfiles
+    cache = CacheExtraccion(args.cache_dir) if args.cache_dir else None
+    # La salida estándar queda reservada para el resumen JSON
+    destino_consola = open(os.devnull, 'w') if args.quiet else sys.stderr
+    try:
+        with redirect_stdout(destino_consola):
+            pdfs, subpartidas, formulario = resolver_entradas(args)
+            if args.triaje and pdfs:
+                resumen, codigo = triaje_pdfs(pdfs, args.workers), EXIT_CONFORME
+            elif not pdfs or not (subpartidas or formulario):
+                resumen = {'estado': 'ERROR', 'detalle': 'Se requieren PDFs y al menos un Excel (subpartidas o formulario)'}
+                codigo = EXIT_ERROR
+            else:
+                operacion = OperacionAcumulada.en_directorio(args.operacion) if args.operacion else None
+                resumen, codigo = ejecutar_verificacion(pdfs, subpartidas, formulario, args.salida,
+                                                        args.formato, args.workers, cache, operacion,
+                                                        args.workers_ocr)
+    except Exception as e:
+        resumen, codigo = {'estado': 'ERROR', 'detalle': f"{type(e).__name__}: {e}"}, EXIT_ERROR
+    finally:
+        if args.quiet:
+            destino_consola.close()
+
+    print(json.dumps(resumen, ensure_ascii=False, indent=2, default=str))
+    return codigo
+
+if __name__ == "__main__":
+    raise SystemExit(main())
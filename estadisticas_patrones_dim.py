@@ -0,0 +1,95 @@
+import os
+import re
+import hashlib
+
+from cache_dim import huella_patrones, _leer_json, _escribir_json, _bloqueo_exclusivo
+from triaje_dim import CASILLAS_DI
+from instrumentacion_dim import combinar_patrones
+
+# =============================================================================
+# ESTADÍSTICAS DE PATRONES POR FORMATO DE DI (ORDEN ADAPTATIVO)
+# =============================================================================
+
+ARCHIVO_ESTADISTICAS_PATRONES = "estadisticas_patrones.json"
+# Intentos a partir de los cuales la tasa de aciertos de un patrón decide su lugar
+MIN_INTENTOS_ORDEN = 20
+
+# Encabezado de una casilla del esquema en el texto extraído ("58. Tasa de Cambio");
+# las casillas de más dígitos primero para que "135." no se lea como "13"
+PATRON_ENCABEZADO_FORMATO = re.compile(
+    r"(?<![\d.,])(" + "|".join(str(c) for c in sorted(CASILLAS_DI, reverse=True)) + r")\s*\.\s*[A-Za-zÀ-ÿ]")
+
+def firma_formato(texto):
+    """Huella corta del formato de un bloque de DI: la secuencia de casillas del
+    esquema en el orden en que aparecen sus encabezados"""
+    casillas = dict.fromkeys(PATRON_ENCABEZADO_FORMATO.findall(texto))
+    return hashlib.sha256("-".join(casillas).encode('utf-8')).hexdigest()[:12]
+
+def huellas_por_campo(patrones_campos):
+    """{campo: (huella de cada patrón, en su orden)}: la estadística sigue al patrón,
+    no a su posición, y un patrón editado empieza de cero"""
+    return {campo: tuple(huella_patrones(patron) for patron in patrones)
+            for campo, patrones in patrones_campos.items()}
+
+def patrones_sin_aciertos(contadores, patrones_campos, min_intentos=1):
+    """Patrones intentados al menos `min_intentos` veces que nunca encontraron su campo,
+    con su posición (1 = primero) en la tabla de patrones actual"""
+    huellas = huellas_por_campo(patrones_campos)
+    reporte = []
+    for formato, campos in contadores.items():
+        for campo, patrones in campos.items():
+            for posicion, huella in enumerate(huellas.get(campo, ()), 1):
+                datos = patrones.get(huella)
+                if datos and datos['aciertos'] == 0 and datos['intentos'] >= min_intentos:
+                    reporte.append({'formato': formato, 'campo': campo, 'patron': posicion,
+                                    'intentos': datos['intentos'],
+                                    'ms_promedio': round(1000 * datos['pared'] / datos['intentos'], 3)})
+    return sorted(reporte, key=lambda r: (r['campo'], r['patron'], r['formato']))
+
+class EstadisticasPatrones:
+    """Aciertos, fallos y tiempo de cada patrón por formato de DI y campo, acumulados
+    entre ejecuciones en un JSON (o solo en memoria si no hay `ruta`).
+
+    `orden` prueba primero, para ese formato, los patrones que más aciertan: los que
+    llevan MIN_INTENTOS_ORDEN intentos se reordenan entre sí por tasa de aciertos y el
+    resto conserva su lugar en la tabla. `guardar` suma al JSON solo lo combinado desde
+    la última lectura, bajo bloqueo, así varios procesos no pisan sus contadores.
+    """
+
+    def __init__(self, ruta=None):
+        self.ruta = ruta
+        self.contadores = (_leer_json(ruta) if ruta else None) or {}
+        self.pendientes = {}
+
+    @classmethod
+    def en_directorio(cls, directorio):
+        """Estadísticas guardadas junto a la caché de extracción (o en la carpeta de
+        cache_dim.directorio_aprendizaje); solo en memoria si `directorio` es None"""
+        return cls(os.path.join(directorio, ARCHIVO_ESTADISTICAS_PATRONES) if directorio else None)
+
+    def orden(self, formato, campo, huellas):
+        """Índices de los patrones de `campo` en el orden en que se prueban para `formato`"""
+        observados = self.contadores.get(formato, {}).get(campo, {})
+        tasas = [datos['aciertos'] / datos['intentos']
+                 if (datos := observados.get(huella)) and datos['intentos'] >= MIN_INTENTOS_ORDEN else None
+                 for huella in huellas]
+        # Los medidos ocupan sus mismos lugares, de mayor a menor tasa (empates en el orden de la tabla)
+        medidos = iter(sorted((i for i, tasa in enumerate(tasas) if tasa is not None), key=lambda i: -tasas[i]))
+        return tuple(next(medidos) if tasa is not None else i for i, tasa in enumerate(tasas))
+
+    def combinar(self, contadores):
+        combinar_patrones(self.contadores, contadores)
+        combinar_patrones(self.pendientes, contadores)
+
+    def sin_aciertos(self, patrones_campos, min_intentos=1):
+        """Reporte de los patrones que nunca coinciden (ver patrones_sin_aciertos)"""
+        return patrones_sin_aciertos(self.contadores, patrones_campos, min_intentos)
+
+    def guardar(self):
+        """Suma lo pendiente a lo guardado (por otros procesos inclusive) y recarga el total"""
+        if not self.ruta or not self.pendientes:
+            return
+        with _bloqueo_exclusivo(self.ruta):
+            contadores = combinar_patrones(_leer_json(self.ruta) or {}, self.pendientes)
+            _escribir_json(os.path.dirname(self.ruta) or '.', self.ruta, contadores)
+        self.contadores, self.pendientes = contadores, {}
@@ -0,0 +1,144 @@
+import io
+
+from carga_perezosa_dim import ModuloPerezoso
+
+pd = ModuloPerezoso('pandas')
+
+try:
+    import xlsxwriter  # Escritura en streaming (constant_memory) y formatos condicionales nativos
+except ImportError:
+    xlsxwriter = None
+
+FORMATOS_EXPORTACION = ('xlsx', 'csv', 'json', 'parquet')
+
+# Columna con el veredicto de cada reporte: las filas con ❌ se resaltan en rojo
+COLUMNA_VEREDICTO_COMPARACION = "Resultado verificación"
+COLUMNA_VEREDICTO_ANEXOS = "Coincidencias"
+MARCA_DIFERENCIA = "❌"
+COLOR_DIFERENCIA = "FFCCCC"
+
+# =============================================================================
+# EXCEL: ESCRITURA EN STREAMING CON FORMATO CONDICIONAL
+# =============================================================================
+
+def _filas(df):
+    """Filas como listas de valores nativos de Python (None para vacíos)"""
+    return df.astype(object).where(df.notna(), None).values.tolist()
+
+def _anchos(df, maximo=60):
+    """Ancho de columna aproximado por el encabezado y una muestra de valores"""
+    muestra = df.head(200).astype(str)
+    return [min(maximo, max([len(str(col))] + muestra[col].str.len().tolist()) + 2) for col in df.columns]
+
+def _letra_columna(indice):
+    letras = ""
+    indice += 1
+    while indice:
+        indice, resto = divmod(indice - 1, 26)
+        letras = chr(65 + resto) + letras
+    return letras
+
+def _formula_diferencia(df, columna_veredicto):
+    letra = _letra_columna(df.columns.get_loc(columna_veredicto))
+    return f'ISNUMBER(SEARCH("{MARCA_DIFERENCIA}",${letra}2))'
+
+def _escribir_xlsxwriter(df, destino, hoja, columna_veredicto):
+    en_memoria = not isinstance(destino, str)
+    libro = xlsxwriter.Workbook(destino, {
+        # constant_memory libera cada fila al escribirla; con un buffer de destino
+        # xlsxwriter exige in_memory (que la anula), sin cambiar el resultado
+        'constant_memory': not en_memoria,
+        'in_memory': en_memoria,
+        'strings_to_formulas': False,
+        'strings_to_urls': False,
+        'strings_to_numbers': False
+    })
+    hoja_xlsx = libro.add_worksheet(hoja)
+    encabezado = libro.add_format({'bold': True, 'bg_color': '#D9E1F2', 'border': 1})
+    for col, ancho in enumerate(_anchos(df)):
+        hoja_xlsx.set_column(col, col, ancho)
+    hoja_xlsx.write_row(0, 0, [str(c) for c in df.columns], encabezado)
+    for fila, valores in enumerate(_filas(df), start=1):
+        hoja_xlsx.write_row(fila, 0, valores)
+
+    ultima_fila, ultima_col = len(df), max(len(df.columns) - 1, 0)
+    hoja_xlsx.freeze_panes(1, 0)
+    hoja_xlsx.autofilter(0, 0, ultima_fila, ultima_col)
+    if columna_veredicto in df.columns and len(df):
+        hoja_xlsx.conditional_format(1, 0, ultima_fila, ultima_col, {
+            'type': 'formula',
+            'criteria': '=' + _formula_diferencia(df, columna_veredicto),
+            'format': libro.add_format({'bg_color': f'#{COLOR_DIFERENCIA}'})
+        })
+    libro.close()
+
+def _escribir_openpyxl(df, destino, hoja, columna_veredicto):
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.formatting.rule import FormulaRule
+    from openpyxl.styles import Font, PatternFill
+
+    libro = Workbook(write_only=True)
+    hoja_xlsx = libro.create_sheet(hoja)
+    for col, ancho in enumerate(_anchos(df)):
+        hoja_xlsx.column_dimensions[_letra_columna(col)].width = ancho
+    hoja_xlsx.freeze_panes = 'A2'
+    ultima = f"{_letra_columna(max(len(df.columns) - 1, 0))}{len(df) + 1}"
+    hoja_xlsx.auto_filter.ref = f"A1:{ultima}"
+    if columna_veredicto in df.columns and len(df):
+        relleno = PatternFill(start_color=COLOR_DIFERENCIA, end_color=COLOR_DIFERENCIA, fill_type='solid')
+        hoja_xlsx.conditional_formatting.add(f"A2:{ultima}", FormulaRule(formula=[_formula_diferencia(df, columna_veredicto)], fill=relleno))
+
+    encabezados = []
+    for nombre in df.columns:
+        celda = WriteOnlyCell(hoja_xlsx, value=str(nombre))
+        celda.font = Font(bold=True)
+        encabezados.append(celda)
+    hoja_xlsx.append(encabezados)
+    for valores in _filas(df):
+        hoja_xlsx.append(valores)
+    libro.save(destino)
+
+def escribir_excel(df, destino, hoja="Sheet1", columna_veredicto=None):
+    """Escribe `df` en un .xlsx (ruta o buffer) fila a fila, con encabezado fijo, filtro
+    y las filas cuyo veredicto contiene ❌ resaltadas mediante formato condicional"""
+    if xlsxwriter is not None:
+        _escribir_xlsxwriter(df, destino, hoja, columna_veredicto)
+    else:
+        _escribir_openpyxl(df, destino, hoja, columna_veredicto)
+
+# =============================================================================
+# FORMATOS PARA SISTEMAS EXTERNOS
+# =============================================================================
+
+def _para_parquet(df):
+    # Las columnas de verificación mezclan texto y números: se guardan como texto
+    df_parquet = df.copy()
+    for col in df_parquet.columns[df_parquet.dtypes == object]:
+        df_parquet[col] = df_parquet[col].map(lambda v: None if pd.isna(v) else str(v))
+    return df_parquet
+
+def exportar_reporte(df, destino, formato, columna_veredicto=None, hoja="Sheet1"):
+    """Escribe el reporte en `formato` (xlsx, csv, json o parquet) en una ruta o buffer"""
+    if formato == 'xlsx':
+        escribir_excel(df, destino, hoja, columna_veredicto)
+    elif formato == 'csv':
+        df.to_csv(destino, index=False, encoding='utf-8-sig')
+    elif formato == 'json':
+        texto = df.to_json(orient='records', force_ascii=False, indent=2)
+        if isinstance(destino, str):
+            with open(destino, 'w', encoding='utf-8') as f:
+                f.write(texto)
+        else:
+            destino.write(texto.encode('utf-8'))
+    elif formato == 'parquet':
+        _para_parquet(df).to_parquet(destino, index=False)
+    else:
+        raise ValueError(f"Formato no soportado: {formato}")
+    return destino
+
+def exportar_a_bytes(df, formato, columna_veredicto=None, hoja="Sheet1"):
+    """Igual que exportar_reporte pero retorna el contenido en memoria (para descargas)"""
+    buffer = io.BytesIO()
+    exportar_reporte(df, buffer, formato, columna_veredicto, hoja)
+    return buffer.getvalue()
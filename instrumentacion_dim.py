@@ -0,0 +1,158 @@
+import os
+import time
+import cProfile
+import threading
+from contextlib import contextmanager
+
+# Perfilado opcional por variables de entorno (también aplica a procesos hijos):
+#   VERIFICACION_DIM_PERFILAR=texto_pdf,regex_campos
+#   VERIFICACION_DIM_PERFILES=/ruta/a/perfiles
+VARIABLE_PERFILAR = "VERIFICACION_DIM_PERFILAR"
+VARIABLE_CARPETA_PERFILES = "VERIFICACION_DIM_PERFILES"
+
+# =============================================================================
+# REGISTRO DE TIEMPOS POR ETAPA, ARCHIVO Y CAMPO
+# =============================================================================
+
+class RegistroTiempos:
+    """Acumula tiempos de pared y CPU por etapa y por archivo, tiempos de regex por campo
+    y contadores (páginas procesadas, bytes leídos).
+
+    Con un registro `compartido` (el de otro hilo) los contadores se suman al momento en
+    él, p. ej. para que el progreso vea las páginas, y los tiempos quedan aquí hasta combinarlos.
+    """
+
+    def __init__(self, perfilar=None, carpeta_perfiles=None, compartido=None):
+        if perfilar is None:
+            perfilar = [e.strip() for e in os.environ.get(VARIABLE_PERFILAR, '').split(',') if e.strip()]
+        self.perfilar = set(perfilar)
+        self.carpeta_perfiles = carpeta_perfiles or os.environ.get(VARIABLE_CARPETA_PERFILES) or '.'
+        self.compartido = compartido
+        self._bloqueo_contadores = threading.Lock()
+        self.reiniciar()
+
+    def reiniciar(self):
+        self.etapas = {}
+        self.archivos = {}
+        self.campos = {}
+        self.patrones = {}
+        self.contadores = {'paginas': 0, 'bytes_leidos': 0}
+        self.perfiles = []
+        self.excesos_regex = []
+
+    @contextmanager
+    def etapa(self, nombre, archivo=None):
+        perfil = None
+        if nombre in self.perfilar:
+            perfil = cProfile.Profile()
+            perfil.enable()
+        inicio_pared = time.perf_counter()
+        inicio_cpu = time.process_time()
+        try:
+            yield
+        finally:
+            pared = time.perf_counter() - inicio_pared
+            cpu = time.process_time() - inicio_cpu
+            if perfil is not None:
+                perfil.disable()
+                self._volcar_perfil(perfil, nombre, archivo)
+            self._acumular(self.etapas.setdefault(nombre, {}), pared, cpu)
+            if archivo:
+                self._acumular(self.archivos.setdefault(archivo, {}).setdefault(nombre, {}), pared, cpu)
+
+    @staticmethod
+    def _acumular(destino, pared, cpu, llamadas=1):
+        destino['pared'] = destino.get('pared', 0.0) + pared
+        destino['cpu'] = destino.get('cpu', 0.0) + cpu
+        destino['llamadas'] = destino.get('llamadas', 0) + llamadas
+
+    def _volcar_perfil(self, perfil, nombre, archivo):
+        os.makedirs(self.carpeta_perfiles, exist_ok=True)
+        sufijo = f"_{os.path.splitext(os.path.basename(archivo))[0]}" if archivo else ''
+        ruta = os.path.join(self.carpeta_perfiles, f"perfil_{nombre}{sufijo}_{os.getpid()}_{len(self.perfiles)}.prof")
+        perfil.dump_stats(ruta)
+        self.perfiles.append(ruta)
+
+    def registrar_campo(self, campo, segundos, encontrado):
+        datos = self.campos.setdefault(campo, {'pared': 0.0, 'llamadas': 0, 'encontrados': 0, 'maximo': 0.0})
+        datos['pared'] += segundos
+        datos['llamadas'] += 1
+        datos['encontrados'] += 1 if encontrado else 0
+        datos['maximo'] = max(datos['maximo'], segundos)
+
+    def registrar_patron(self, formato, campo, huella, segundos, acierto):
+        """Un intento de un patrón (por su huella) sobre un bloque de DI del formato dado"""
+        datos = self.patrones.setdefault(formato, {}).setdefault(campo, {}).setdefault(
+            huella, {'intentos': 0, 'aciertos': 0, 'pared': 0.0})
+        datos['intentos'] += 1
+        datos['aciertos'] += 1 if acierto else 0
+        datos['pared'] += segundos
+
+    def registrar_exceso_regex(self, archivo, numero_di, campo, segundos):
+        """Anota un DI descartado porque un patrón superó su presupuesto de tiempo"""
+        self.excesos_regex.append({'archivo': archivo, 'numero_di': numero_di, 'campo': campo,
+                                   'segundos': round(segundos, 3)})
+
+    def sumar(self, contador, cantidad):
+        if self.compartido is not None:
+            self.compartido.sumar(contador, cantidad)
+            return
+        with self._bloqueo_contadores:
+            self.contadores[contador] = self.contadores.get(contador, 0) + cantidad
+
+    def combinar(self, otro):
+        """Suma un diccionario de `como_dict()` (p. ej. el de un proceso hijo)"""
+        if not otro:
+            return
+        for nombre, datos in otro.get('etapas', {}).items():
+            self._acumular(self.etapas.setdefault(nombre, {}), datos['pared'], datos['cpu'], datos['llamadas'])
+        for archivo, etapas in otro.get('archivos', {}).items():
+            for nombre, datos in etapas.items():
+                self._acumular(self.archivos.setdefault(archivo, {}).setdefault(nombre, {}), datos['pared'], datos['cpu'], datos['llamadas'])
+        for campo, datos in otro.get('campos', {}).items():
+            actual = self.campos.setdefault(campo, {'pared': 0.0, 'llamadas': 0, 'encontrados': 0, 'maximo': 0.0})
+            actual['pared'] += datos['pared']
+            actual['llamadas'] += datos['llamadas']
+            actual['encontrados'] += datos['encontrados']
+            actual['maximo'] = max(actual['maximo'], datos['maximo'])
+        combinar_patrones(self.patrones, otro.get('patrones', {}))
+        for contador, cantidad in otro.get('contadores', {}).items():
+            self.sumar(contador, cantidad)
+        self.perfiles.extend(otro.get('perfiles', []))
+        self.excesos_regex.extend(otro.get('excesos_regex', []))
+
+    def como_dict(self):
+        redondear = lambda d: {k: round(v, 6) if isinstance(v, float) else v for k, v in d.items()}
+        return {
+            'etapas': {nombre: redondear(datos) for nombre, datos in self.etapas.items()},
+            'archivos': {archivo: {nombre: redondear(datos) for nombre, datos in etapas.items()}
+                         for archivo, etapas in self.archivos.items()},
+            'campos': {campo: redondear(datos) for campo, datos in self.campos.items()},
+            'patrones': {formato: {campo: {huella: redondear(datos) for huella, datos in patrones.items()}
+                                   for campo, patrones in campos.items()}
+                         for formato, campos in self.patrones.items()},
+            'contadores': dict(self.contadores),
+            'perfiles': list(self.perfiles),
+            'excesos_regex': list(self.excesos_regex)
+        }
+
+def combinar_patrones(destino, otros):
+    """Suma contadores de patrones `{formato: {campo: {huella: {'intentos', 'aciertos', 'pared'}}}}`"""
+    for formato, campos in otros.items():
+        for campo, patrones in campos.items():
+            for huella, datos in patrones.items():
+                actual = destino.setdefault(formato, {}).setdefault(campo, {}).setdefault(
+                    huella, {'intentos': 0, 'aciertos': 0, 'pared': 0.0})
+                actual['intentos'] += datos['intentos']
+                actual['aciertos'] += datos['aciertos']
+                actual['pared'] += datos['pared']
+    return destino
+
+def combinar_tiempos(*registros):
+    """Une los tiempos de varias clases del pipeline en un solo diccionario"""
+    total = RegistroTiempos(perfilar=[])
+    for registro in registros:
+        if registro is None:
+            continue
+        total.combinar(registro.como_dict() if isinstance(registro, RegistroTiempos) else registro)
+    return total.como_dict()
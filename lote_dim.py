@@ -0,0 +1,284 @@
+import os
+import glob
+import time
+import signal
+import argparse
+import multiprocessing
+from multiprocessing.connection import wait
+from concurrent.futures import ProcessPoolExecutor, wait as esperar_futuros, FIRST_COMPLETED
+from contextlib import redirect_stdout
+from datetime import datetime
+
+from carga_perezosa_dim import ModuloPerezoso
+from verificacion_dim import (
+    ExtractorDIANSimplificado,
+    ComparadorDatos,
+    ExtractorSubpartidas,
+    ValidadorDeclaracionImportacionCompleto,
+    MotorDeclaraciones,
+    NOMBRE_REPORTE_COMPARACION,
+    NOMBRE_REPORTE_ANEXOS
+)
+from triaje_dim import triaje_pdfs, estimar_eta
+from ocr_dim import ocr_disponible
+from cache_dim import directorio_aprendizaje
+from estadisticas_patrones_dim import EstadisticasPatrones
+from plantillas_excel_dim import CachePlantillas
+
+NOMBRE_RESUMEN_LOTE = "Reporte Lote Validacion DIM.xlsx"
+NOMBRE_LOG_CARPETA = "verificacion_dim.log"
+# Segundos que tiene una carpeta con tiempo excedido para cerrar sus pools y archivos
+# de intercambio antes de matar su grupo de procesos
+GRACIA_TERMINACION = 5.0
+
+pd = ModuloPerezoso('pandas')
+
+# =============================================================================
+# DESCUBRIMIENTO DE CARPETAS DE OPERACIÓN
+# =============================================================================
+
+def es_carpeta_operacion(carpeta):
+    """Una carpeta de operación (SLI) contiene al menos un PDF y un Excel"""
+    if not os.path.isdir(carpeta):
+        return False
+    tiene_pdf = bool(glob.glob(os.path.join(carpeta, "*.pdf")))
+    tiene_excel = bool(glob.glob(os.path.join(carpeta, "*.xlsx")) or glob.glob(os.path.join(carpeta, "*.xls")))
+    return tiene_pdf and tiene_excel
+
+def descubrir_carpetas_operacion(raiz):
+    """Recorre la raíz y retorna las carpetas de operación ordenadas por nombre"""
+    carpetas = []
+    for carpeta, subcarpetas, _ in os.walk(raiz):
+        subcarpetas[:] = sorted(s for s in subcarpetas if not s.startswith('.'))
+        if es_carpeta_operacion(carpeta):
+            carpetas.append(os.path.abspath(carpeta))
+    return carpetas
+
+# =============================================================================
+# PROCESAMIENTO DE UNA CARPETA (SE EJECUTA AISLADO EN SU PROPIO PROCESO)
+# =============================================================================
+
+def _contar_errores_anexos(reporte_anexos):
+    if reporte_anexos is None or reporte_anexos.empty:
+        return 0
+    errores = reporte_anexos[reporte_anexos['Coincidencias'] == '❌ NO COINCIDE']
+    return errores['Numero DI'].nunique()
+
+def procesar_carpeta_operacion(carpeta):
+    """Ejecuta comparación y validación de anexos de una carpeta y retorna su resumen"""
+    inicio = time.perf_counter()
+    resumen = {
+        'Carpeta': carpeta, 'Estado': '❌ ERROR',
+        'DI procesadas': 0, 'DI conformes': 0, 'DI con diferencias': 0, 'Totales': 'N/A',
+        'Declaraciones validadas': 0, 'Declaraciones con errores anexos': 0, 'DI duplicadas': 0,
+        'Duración (s)': 0.0, 'Detalle': ''
+    }
+
+    # La carpeta ya es un proceso (demonio) del lote: su OCR no abre otro pool. Las estadísticas
+    # de patrones y las plantillas de Excel se comparten entre carpetas y lotes (con bloqueo)
+    aprendizaje = directorio_aprendizaje()
+    plantillas = CachePlantillas.en_directorio(aprendizaje)
+    motor = MotorDeclaraciones(workers_ocr=1, estadisticas=EstadisticasPatrones.en_directorio(aprendizaje))
+    registros = motor.procesar_archivos(sorted(glob.glob(os.path.join(carpeta, "*.pdf"))))
+    resumen['DI duplicadas'] = len(motor.duplicados)
+    datos_dian = ExtractorDIANSimplificado().procesar_multiples_dis(carpeta, registros=registros)
+    datos_sub = ExtractorSubpartidas(plantillas).extraer_y_estandarizar(carpeta)
+
+    reporte_comp = None
+    if datos_dian is not None and not datos_dian.empty and not datos_sub.empty:
+        salida_comparacion = os.path.join(carpeta, NOMBRE_REPORTE_COMPARACION)
+        reporte_comp = ComparadorDatos().generar_reporte_comparacion(datos_dian, datos_sub, salida_comparacion)
+
+    salida_anexos = os.path.join(carpeta, NOMBRE_REPORTE_ANEXOS)
+    reporte_anexos = ValidadorDeclaracionImportacionCompleto(plantillas).procesar_validacion_completa(carpeta, salida_anexos, registros=registros)
+
+    detalles = []
+    if reporte_comp is not None and not reporte_comp.empty:
+        mascara_totales = reporte_comp['4. Número DI'].astype(str).str.contains('VALORES ACUMULADOS', na=False)
+        individuales = reporte_comp[~mascara_totales]
+        conformes = int((individuales['Resultado verificación'] == '✅ CONFORME').sum())
+        resumen['DI procesadas'] = len(individuales)
+        resumen['DI conformes'] = conformes
+        resumen['DI con diferencias'] = len(individuales) - conformes
+        if mascara_totales.any():
+            resumen['Totales'] = reporte_comp[mascara_totales].iloc[0]['Resultado verificación']
+    else:
+        detalles.append("Sin comparación DIM vs Subpartida")
+
+    if reporte_anexos is not None:
+        resumen['Declaraciones validadas'] = reporte_anexos['Numero DI'].nunique()
+        resumen['Declaraciones con errores anexos'] = _contar_errores_anexos(reporte_anexos)
+    else:
+        detalles.append("Sin validación de anexos FMM")
+
+    if detalles:
+        resumen['Estado'] = '⚠️ INCOMPLETO'
+    elif resumen['DI con diferencias'] or resumen['Declaraciones con errores anexos'] or '❌' in str(resumen['Totales']):
+        resumen['Estado'] = '❌ CON DIFERENCIAS'
+    else:
+        resumen['Estado'] = '✅ CONFORME'
+    resumen['Detalle'] = '; '.join(detalles)
+    resumen['Duración (s)'] = round(time.perf_counter() - inicio, 2)
+    return resumen
+
+def _salir_por_senal(signum, frame):
+    # SystemExit desenrolla la pila: se cierran pools, archivos y mapas de la carpeta
+    raise SystemExit(128 + signum)
+
+def _trabajador_carpeta(carpeta, conexion):
+    """Punto de entrada del proceso hijo: la salida de consola va al log de la carpeta.
+
+    El hijo encabeza su propio grupo de procesos para que al exceder el tiempo se
+    termine junto con los procesos que haya lanzado (ver _terminar_carpeta).
+    """
+    if hasattr(os, 'setpgrp'):
+        os.setpgrp()
+    signal.signal(signal.SIGTERM, _salir_por_senal)
+    try:
+        with open(os.path.join(carpeta, NOMBRE_LOG_CARPETA), 'w', encoding='utf-8') as log, redirect_stdout(log):
+            resumen = procesar_carpeta_operacion(carpeta)
+    except Exception as e:
+        resumen = _resumen_fallido(carpeta, '❌ ERROR', f"{type(e).__name__}: {e}")
+    conexion.send(resumen)
+    conexion.close()
+
+def _senal_grupo(proceso, senal):
+    """Envía `senal` al grupo de procesos de la carpeta; False si no se pudo (sin grupo propio)"""
+    if not hasattr(os, 'killpg'):
+        return False
+    try:
+        os.killpg(proceso.pid, senal)
+        return True
+    except (ProcessLookupError, PermissionError):
+        return False
+
+def _terminar_carpeta(proceso, gracia=GRACIA_TERMINACION):
+    """SIGTERM a la carpeta y a sus procesos hijos para que liberen sus recursos; lo que
+    siga vivo tras `gracia` segundos se mata con SIGKILL"""
+    if not _senal_grupo(proceso, signal.SIGTERM):
+        proceso.terminate()
+    proceso.join(gracia)
+    # Aunque la carpeta ya haya salido, sus hijos huérfanos siguen en el grupo
+    _senal_grupo(proceso, signal.SIGKILL)
+    if proceso.is_alive():
+        proceso.kill()
+
+def _resumen_fallido(carpeta, estado, detalle, duracion=0.0):
+    return {
+        'Carpeta': carpeta, 'Estado': estado,
+        'DI procesadas': 0, 'DI conformes': 0, 'DI con diferencias': 0, 'Totales': 'N/A',
+        'Declaraciones validadas': 0, 'Declaraciones con errores anexos': 0, 'DI duplicadas': 0,
+        'Duración (s)': round(duracion, 2), 'Detalle': detalle
+    }
+
+# =============================================================================
+# PLANIFICADOR DEL LOTE
+# =============================================================================
+
+def _triaje_carpeta(carpeta):
+    return triaje_pdfs(sorted(glob.glob(os.path.join(carpeta, "*.pdf"))))
+
+def ejecutar_lote(raiz, max_workers=None, timeout=None, archivo_resumen=None):
+    """Procesa todas las carpetas de operación bajo la raíz en paralelo.
+
+    Cada carpeta corre en un proceso independiente: un fallo o un cuelgue no afecta
+    a las demás, y si supera `timeout` segundos se termina con sus procesos hijos.
+    """
+    carpetas = descubrir_carpetas_operacion(raiz)
+    if not carpetas:
+        print(f"❌ No se encontraron carpetas de operación en: {raiz}")
+        return pd.DataFrame()
+
+    max_workers = max(1, max_workers or os.cpu_count() or 1)
+    print(f"🚀 Lote con {len(carpetas)} carpetas - {max_workers} procesos en paralelo")
+
+    # Pre-escaneo en su propio pool, en paralelo con las carpetas: cada carpeta se agenda
+    # apenas termina su triaje (la más costosa de las ya triadas primero) y los PDF
+    # escaneados se avisan sin esperar al resto
+    triador = ProcessPoolExecutor(max_workers=min(max_workers, len(carpetas)))
+    triajes_pendientes = {triador.submit(_triaje_carpeta, carpeta): carpeta for carpeta in carpetas}
+    costos, di_estimadas = {}, 0
+
+    contexto = multiprocessing.get_context()
+    pendientes = []
+    activos = {}
+    resultados = {}
+
+    try:
+        while triajes_pendientes or pendientes or activos:
+            for futuro in [f for f in triajes_pendientes if f.done()]:
+                carpeta = triajes_pendientes.pop(futuro)
+                try:
+                    triaje = futuro.result()
+                except Exception as e:
+                    print(f"   ⚠️ Pre-escaneo fallido en {os.path.relpath(carpeta, raiz)}: {type(e).__name__}: {e}")
+                    triaje = {'pdfs': [], 'di_estimadas': 0, 'sin_texto': []}
+                costos[carpeta] = sum(sondeo['costo'] for sondeo in triaje['pdfs'])
+                di_estimadas += triaje['di_estimadas']
+                for archivo in triaje['sin_texto']:
+                    print(f"   ⚠️ {os.path.relpath(carpeta, raiz)}/{archivo} no tiene capa de texto (¿escaneado?)"
+                          + ("" if ocr_disponible() else " y no hay OCR disponible"))
+                pendientes.append(carpeta)
+                pendientes.sort(key=lambda c: -costos[c])
+                if not triajes_pendientes:
+                    print(f"🔎 ~{di_estimadas} DI estimadas, ETA ~{estimar_eta(costos.values(), max_workers):.0f} s")
+
+            while pendientes and len(activos) < max_workers:
+                carpeta = pendientes.pop(0)
+                receptor, emisor = contexto.Pipe(duplex=False)
+                proceso = contexto.Process(target=_trabajador_carpeta, args=(carpeta, emisor), daemon=True)
+                proceso.start()
+                emisor.close()
+                activos[carpeta] = (proceso, receptor, time.monotonic())
+
+            if activos:
+                wait([receptor for _, receptor, _ in activos.values()],
+                     timeout=0.1 if triajes_pendientes else 0.5)
+            elif triajes_pendientes:
+                esperar_futuros(triajes_pendientes, timeout=0.5, return_when=FIRST_COMPLETED)
+
+            for carpeta, (proceso, receptor, inicio) in list(activos.items()):
+                duracion = time.monotonic() - inicio
+                if receptor.poll():
+                    try:
+                        resultados[carpeta] = receptor.recv()
+                    except EOFError:
+                        resultados[carpeta] = _resumen_fallido(carpeta, '❌ ERROR', f"Proceso terminado sin resultado (código {proceso.exitcode})", duracion)
+                elif timeout and duracion > timeout:
+                    _terminar_carpeta(proceso)
+                    resultados[carpeta] = _resumen_fallido(carpeta, '⏱️ TIEMPO EXCEDIDO', f"Superó {timeout} s", duracion)
+                else:
+                    continue
+                proceso.join()
+                receptor.close()
+                del activos[carpeta]
+                print(f"   {resultados[carpeta]['Estado']} {os.path.relpath(carpeta, raiz)} ({resultados[carpeta]['Duración (s)']} s)")
+    finally:
+        triador.shutdown(cancel_futures=True)
+
+    df_resumen = pd.DataFrame([resultados[c] for c in carpetas])
+    if archivo_resumen is None:
+        archivo_resumen = os.path.join(raiz, NOMBRE_RESUMEN_LOTE)
+    try:
+        df_resumen.to_excel(archivo_resumen, index=False)
+        print(f"💾 Resumen consolidado guardado en: {archivo_resumen}")
+    except Exception as e:
+        print(f"❌ Error al guardar el resumen consolidado: {e}")
+    return df_resumen
+
+def main():
+    parser = argparse.ArgumentParser(description="Verificación DIM vs FMM por lotes de carpetas de operación")
+    parser.add_argument("raiz", help="Carpeta raíz que contiene las carpetas SLI")
+    parser.add_argument("--workers", type=int, default=None, help="Procesos en paralelo (por defecto: núcleos disponibles)")
+    parser.add_argument("--timeout", type=float, default=None, help="Tiempo máximo por carpeta en segundos")
+    parser.add_argument("--resumen", default=None, help="Ruta del Excel de resumen consolidado")
+    args = parser.parse_args()
+
+    print(f"📁 Raíz del lote: {args.raiz} ({datetime.now():%Y-%m-%d %H:%M})")
+    df_resumen = ejecutar_lote(args.raiz, args.workers, args.timeout, args.resumen)
+    if df_resumen.empty:
+        return 1
+    return 0 if (df_resumen['Estado'] == '✅ CONFORME').all() else 1
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,131 @@
+import io
+import hashlib
+import importlib
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from carga_perezosa_dim import ModuloPerezoso
+from triaje_dim import contenido_pagina
+from transporte_dim import archivo_compartido
+
+pdfplumber = ModuloPerezoso('pdfplumber')
+
+# =============================================================================
+# OCR LOCAL DE PÁGINAS ESCANEADAS (TESSERACT)
+# =============================================================================
+
+RESOLUCION_OCR = 300
+IDIOMA_OCR = 'spa'
+# Páginas reconocidas que se recuerdan en memoria cuando no hay almacén de páginas en disco
+MAX_PAGINAS_CACHE_OCR = 256
+PREFIJO_HUELLA_OCR = "ocr_"
+
+_pytesseract = None
+_ocr_disponible = None
+_cache_ocr = OrderedDict()
+
+def _cargar_pytesseract():
+    """pytesseract (opcional) se importa en el primer uso; None si no está instalado"""
+    global _pytesseract
+    if _pytesseract is None:
+        try:
+            _pytesseract = importlib.import_module('pytesseract')
+        except ImportError:
+            _pytesseract = False
+    return _pytesseract or None
+
+def ocr_disponible():
+    """True si están pytesseract y el ejecutable de Tesseract"""
+    global _ocr_disponible
+    if _ocr_disponible is None:
+        pytesseract = _cargar_pytesseract()
+        try:
+            _ocr_disponible = pytesseract is not None and bool(pytesseract.get_tesseract_version())
+        except Exception:
+            _ocr_disponible = False
+    return _ocr_disponible
+
+def huella_imagen_pagina(pagina):
+    """Huella de lo que se reconocería en una página de pdfplumber: su flujo de contenido,
+    los datos crudos y la posición de cada imagen, la resolución y el idioma del OCR"""
+    sha = hashlib.sha256(repr((tuple(pagina.bbox), RESOLUCION_OCR, IDIOMA_OCR)).encode('utf-8'))
+    sha.update(contenido_pagina(pagina.page_obj))
+    for imagen in pagina.images:
+        sha.update(repr((imagen['srcsize'], imagen['x0'], imagen['top'], imagen['x1'], imagen['bottom'])).encode('utf-8'))
+        sha.update(imagen['stream'].get_rawdata() or b"")
+    return PREFIJO_HUELLA_OCR + sha.hexdigest()[:32]
+
+def origen_pdf(pdf_path):
+    """Ruta o bytes del PDF, para reabrirlo en otro proceso. Un archivo compartido
+    (transporte_dim.ArchivoMapeado) se reabre por la ruta de su archivo de intercambio"""
+    if isinstance(pdf_path, str):
+        return pdf_path
+    if getattr(pdf_path, 'ruta', None):
+        return pdf_path.ruta
+    return bytes(pdf_path.getbuffer())
+
+def ocr_pagina(origen, indice):
+    """Texto y palabras ([x0, top, x1, bottom, texto], en puntos del PDF) de la página
+    `indice` de un PDF (ruta o bytes), renderizada y reconocida con Tesseract"""
+    pytesseract = _cargar_pytesseract()
+    with pdfplumber.open(origen if isinstance(origen, str) else io.BytesIO(origen)) as pdf:
+        imagen = pdf.pages[indice].to_image(resolution=RESOLUCION_OCR).original
+    datos = pytesseract.image_to_data(imagen, lang=IDIOMA_OCR, output_type=pytesseract.Output.DICT)
+
+    # Una línea de texto por línea de Tesseract, en su orden de lectura
+    escala = 72 / RESOLUCION_OCR
+    lineas, palabras = {}, []
+    for i, texto in enumerate(datos['text']):
+        texto = texto.strip()
+        if not texto:
+            continue
+        lineas.setdefault((datos['block_num'][i], datos['par_num'][i], datos['line_num'][i]), []).append(texto)
+        x0, top = datos['left'][i] * escala, datos['top'][i] * escala
+        palabras.append([round(x0, 2), round(top, 2), round(x0 + datos['width'][i] * escala, 2),
+                         round(top + datos['height'][i] * escala, 2), texto])
+    return {'texto': "\n".join(" ".join(linea) for linea in lineas.values()), 'palabras': palabras}
+
+def _recordar(huella, datos):
+    _cache_ocr[huella] = datos
+    _cache_ocr.move_to_end(huella)
+    while len(_cache_ocr) > MAX_PAGINAS_CACHE_OCR:
+        _cache_ocr.popitem(last=False)
+
+def ocr_paginas(pdf_path, paginas, almacen=None, max_workers=1):
+    """{índice: {'texto', 'palabras'}} de las páginas `[(índice, huella), ...]` de un PDF.
+
+    Las ya reconocidas se toman del almacén de páginas (o de la memoria del proceso)
+    por la huella de su imagen; el resto se reconoce en un pool de procesos, una
+    página por tarea, cuando `max_workers` es mayor que 1.
+    """
+    resultados, pendientes = {}, []
+    for indice, huella in paginas:
+        datos = almacen.pagina(huella) if almacen is not None else _cache_ocr.get(huella)
+        if datos is None:
+            pendientes.append((indice, huella))
+        else:
+            resultados[indice] = datos
+
+    if pendientes:
+        origen = origen_pdf(pdf_path)
+        indices = [indice for indice, _ in pendientes]
+        if max_workers and max_workers > 1 and len(pendientes) > 1:
+            # Las tareas reciben una ruta: un PDF en memoria se vuelca una vez a un archivo de intercambio
+            intercambio = None if isinstance(origen, str) else archivo_compartido(getattr(pdf_path, 'name', None) or "ocr.pdf", origen)
+            ruta = origen if intercambio is None else intercambio.ruta
+            try:
+                with ProcessPoolExecutor(max_workers=min(max_workers, len(pendientes))) as pool:
+                    reconocidas = list(pool.map(ocr_pagina, [ruta] * len(indices), indices))
+            finally:
+                # Cerrar el original elimina el archivo de intercambio
+                if intercambio is not None:
+                    intercambio.close()
+        else:
+            reconocidas = [ocr_pagina(origen, indice) for indice in indices]
+        for (indice, huella), datos in zip(pendientes, reconocidas):
+            resultados[indice] = datos
+            if almacen is not None:
+                almacen.guardar_pagina(huella, datos['texto'], datos['palabras'])
+            else:
+                _recordar(huella, datos)
+    return resultados
@@ -0,0 +1,122 @@
+import os
+
+import verificacion_dim
+from cache_dim import digest_archivo, huella_archivo_codigo, _leer_json, _escribir_json
+from registros_dim import RegistroDI
+
+# =============================================================================
+# OPERACIÓN ACUMULADA POR ENTREGAS (MODO ANEXAR)
+# =============================================================================
+
+ARCHIVO_OPERACION = "operacion_dim.json"
+# Las filas guardadas de comparación y de anexos dejan de valer si cambia el código que las produce
+VERSION_FILAS = huella_archivo_codigo(verificacion_dim)
+TIPO_COMPARACION = 'comparacion'
+TIPO_ANEXOS = 'anexos'
+
+class OperacionAcumulada:
+    """Estado de una operación (SLI) cuyas DIM llegan en varias entregas, guardado en un
+    JSON (o solo en memoria si no hay `ruta`).
+
+    Por cada PDF ya incorporado (por su SHA-256) guarda sus registros de DI y, por cada
+    registro, su fila de comparación con subpartidas y sus filas de validación de anexos
+    con la factura emparejada. Una entrega nueva solo extrae y valida sus PDF; los
+    acumulados, la consistencia entre DI, la integridad del FMM y el emparejamiento de
+    facturas se recalculan sobre el conjunto completo.
+    """
+
+    def __init__(self, ruta=None):
+        self.ruta = ruta
+        estado = (_leer_json(ruta) if ruta else None) or {}
+        self.versiones = estado.get('versiones', {})
+        self.subpartidas = estado.get('subpartidas')
+        self.formulario = estado.get('formulario')
+        self.pdfs = [{'digest': pdf['digest'], 'archivo': pdf['archivo'],
+                      'partidas': [dict(partida, registro=RegistroDI.desde_dict(partida['registro']))
+                                   for partida in pdf['partidas']]}
+                     for pdf in estado.get('pdfs', [])]
+        self.descartes = []
+
+    @classmethod
+    def en_directorio(cls, directorio):
+        os.makedirs(directorio, exist_ok=True)
+        return cls(os.path.join(directorio, ARCHIVO_OPERACION))
+
+    def _descartar_filas(self, tipo, motivo):
+        if any(partida[tipo] is not None for pdf in self.pdfs for partida in pdf['partidas']):
+            self.descartes.append(motivo)
+        for pdf in self.pdfs:
+            for partida in pdf['partidas']:
+                partida[tipo] = None
+
+    def preparar(self, version_extraccion, subpartidas=None, formulario=None):
+        """Descarta lo guardado que ya no vale: todo si cambiaron los patrones de extracción
+        (los PDF anteriores deben volver a entregarse), las filas de comparación si cambió
+        el Excel de subpartidas y las de anexos si cambió el FMM. Un Excel no indicado en
+        esta entrega conserva sus filas."""
+        if self.pdfs and self.versiones.get('extraccion') != version_extraccion:
+            self.descartes.append(f"patrones de extracción: {len(self.pdfs)} PDF anteriores descartados")
+            self.pdfs = []
+        if self.versiones.get('filas') != VERSION_FILAS:
+            self._descartar_filas(TIPO_COMPARACION, "código de comparación y validación")
+            self._descartar_filas(TIPO_ANEXOS, "código de comparación y validación")
+        self.versiones = {'extraccion': version_extraccion, 'filas': VERSION_FILAS}
+        if subpartidas:
+            digest = digest_archivo(subpartidas)
+            if digest != self.subpartidas:
+                self._descartar_filas(TIPO_COMPARACION, "Excel de subpartidas")
+                self.subpartidas = digest
+        if formulario:
+            digest = digest_archivo(formulario)
+            if digest != self.formulario:
+                self._descartar_filas(TIPO_ANEXOS, "formulario FMM")
+                self.formulario = digest
+
+    def pendientes(self, pdfs):
+        """[(pdf, digest)] de los PDF cuyo contenido aún no está en la operación"""
+        vistos = {pdf['digest'] for pdf in self.pdfs}
+        pendientes = []
+        for pdf in pdfs:
+            digest = digest_archivo(pdf)
+            if digest not in vistos:
+                vistos.add(digest)
+                pendientes.append((pdf, digest))
+        return pendientes
+
+    def agregar(self, pendientes, registros_por_archivo):
+        """Incorpora los PDF de `pendientes` con sus registros (MotorDeclaraciones.registros_por_archivo)"""
+        for (pdf, digest), registros in zip(pendientes, registros_por_archivo):
+            self.pdfs.append({'digest': digest, 'archivo': verificacion_dim._nombre_archivo(pdf),
+                              'partidas': [{'registro': registro, TIPO_COMPARACION: None, TIPO_ANEXOS: None}
+                                           for registro in registros]})
+
+    def archivos(self):
+        return [pdf['archivo'] for pdf in self.pdfs]
+
+    def registros(self):
+        """Registros de todos los PDF de la operación, en orden de entrega (con copias)"""
+        return [partida['registro'] for pdf in self.pdfs for partida in pdf['partidas']]
+
+    def _partidas_por_registro(self):
+        return {id(partida['registro']): partida for pdf in self.pdfs for partida in pdf['partidas']}
+
+    def filas_previas(self, registros, tipo):
+        """Por cada registro, lo guardado de `tipo` (TIPO_COMPARACION o TIPO_ANEXOS) o None"""
+        partidas = self._partidas_por_registro()
+        return [partidas[id(registro)][tipo] for registro in registros]
+
+    def guardar_filas(self, registros, tipo, filas):
+        partidas = self._partidas_por_registro()
+        for registro, fila in zip(registros, filas):
+            partidas[id(registro)][tipo] = fila
+
+    def guardar_validaciones(self, validaciones):
+        """Filas y factura emparejada de cada DI (ValidadorDeclaracionImportacionCompleto.validaciones)"""
+        self.guardar_filas([registro for registro, _, _ in validaciones], TIPO_ANEXOS,
+                           [{'filas': filas, 'factura': factura} for _, filas, factura in validaciones])
+
+    def guardar(self):
+        if self.ruta:
+            _escribir_json(os.path.dirname(self.ruta) or '.', self.ruta,
+                           {'versiones': self.versiones, 'subpartidas': self.subpartidas,
+                            'formulario': self.formulario, 'pdfs': self.pdfs})
@@ -0,0 +1,126 @@
+import io
+import time
+
+from verificacion_dim import (
+    ExtractorDIANSimplificado,
+    ComparadorDatos,
+    ExtractorSubpartidas,
+    ValidadorDeclaracionImportacionCompleto,
+    MotorDeclaraciones
+)
+from instrumentacion_dim import combinar_tiempos
+from cache_dim import directorio_aprendizaje
+from estadisticas_patrones_dim import EstadisticasPatrones
+from plantillas_excel_dim import CachePlantillas
+from triaje_dim import triaje_pdfs
+
+# =============================================================================
+# PIPELINE COMPLETO SOBRE ARCHIVOS EN MEMORIA (SIN STREAMLIT)
+# =============================================================================
+
+# Etapas con avance por archivo o por declaración: (texto, fracción inicial, fracción final)
+ETAPAS_PROGRESO = {
+    'extraccion_dim': ("📄 Extrayendo DIM", 0.0, 0.75),
+    'validacion': ("✅ Validando declaraciones", 0.85, 1.0)
+}
+
+def ejecutar_pipeline(pdfs, archivo_subpartidas, archivo_formulario, progreso=None):
+    """Ejecuta la comparación y la validación de anexos sobre archivos en memoria.
+
+    No usa elementos de Streamlit ni captura la consola, así que puede correr en
+    un hilo o en un proceso hijo. `progreso(**cambios)` recibe fracción, etapa y
+    contadores.
+    """
+    # Estadísticas de patrones y plantillas de Excel se acumulan entre trabajos en la carpeta de aprendizaje
+    aprendizaje = directorio_aprendizaje()
+    plantillas = CachePlantillas.en_directorio(aprendizaje)
+    extractor_dian = ExtractorDIANSimplificado()
+    extractor_subpartidas = ExtractorSubpartidas(plantillas)
+    comparador = ComparadorDatos()
+    validador = ValidadorDeclaracionImportacionCompleto(plantillas)
+    contadores = {'dis_extraidas': 0, 'declaraciones_validadas': 0}
+    costo_extraido = 0.0
+
+    def avisar(fraccion, etapa, detalle=""):
+        if progreso is not None:
+            paginas = extractor_dian.tiempos.contadores['paginas']
+            progreso(fraccion=fraccion, etapa=etapa, detalle=detalle, paginas=paginas, **contadores)
+
+    def avisar_etapa(etapa, completados, total, cantidad, detalle):
+        nonlocal costo_extraido
+        nombre, inicio, fin = ETAPAS_PROGRESO[etapa]
+        avance = completados / max(total, 1)
+        if etapa == 'extraccion_dim':
+            contadores['dis_extraidas'] += cantidad
+            # Avance por costo estimado de cada PDF, no por cantidad de archivos
+            costo_extraido += costos.get(detalle, 0.0)
+            if costo_total > 0: avance = min(costo_extraido / costo_total, 1.0)
+        elif etapa == 'validacion':
+            contadores['declaraciones_validadas'] += cantidad
+        avisar(inicio + (fin - inicio) * avance, f"{nombre} ({completados}/{total})", detalle)
+
+    # Pre-escaneo: DI estimadas, ETA y PDFs sin capa de texto visibles antes de extraer
+    triaje = triaje_pdfs(pdfs)
+    costos = {sondeo['archivo']: sondeo['costo'] for sondeo in triaje['pdfs']}
+    costo_total = sum(costos.values())
+    contadores.update(di_estimadas=triaje['di_estimadas'], eta_segundos=triaje['eta_segundos'],
+                      pdfs_sin_texto=triaje['sin_texto'])
+
+    avisar(0.0, "🔍 Comparando DIM vs Subpartidas...")
+    # Una sola lectura de los PDFs para la comparación y la validación de anexos
+    # Cada trabajo ya corre en su propio proceso (trabajos_dim): su OCR no abre otro pool
+    motor = MotorDeclaraciones(extractor_dian.tiempos, workers_ocr=1,
+                               estadisticas=EstadisticasPatrones.en_directorio(aprendizaje))
+    registros = motor.procesar_archivos(pdfs, progreso=avisar_etapa)
+    datos_dian = extractor_dian.procesar_archivos_pdf(pdfs, registros=registros)
+
+    if datos_dian is None or datos_dian.empty:
+        return {'error': "❌ No se pudieron extraer datos de las DIM"}
+
+    avisar(0.75, "📊 Leyendo subpartidas...")
+    datos_subpartidas = extractor_subpartidas.extraer_y_estandarizar_archivo(archivo_subpartidas)
+
+    if datos_subpartidas.empty:
+        return {'error': "❌ No se pudieron extraer datos del archivo de subpartidas"}
+
+    avisar(0.78, "🔍 Generando reporte de comparación...")
+    multiples_subpartidas = comparador.detectar_multiples_subpartidas(datos_subpartidas)
+    output_comparacion = io.BytesIO()
+    reporte_comparacion = comparador.generar_reporte_comparacion(
+        datos_dian, datos_subpartidas, output_comparacion
+    )
+
+    avisar(0.8, "🔄 Validando anexos FMM...")
+    output_anexos = io.BytesIO()
+    reporte_anexos = validador.procesar_validacion_archivos(archivo_formulario, pdfs, output_anexos,
+                                                            progreso=avisar_etapa, registros=registros)
+
+    # Resumen estructurado del validador (proveedor, códigos, integridad y conteos)
+    resumen = validador.resumen_validacion()
+    estadisticas_validacion = {
+        'total_anexos': resumen['total_anexos'],
+        'total_di': resumen['total_di'],
+        'total_di_dian': len(datos_dian),
+        'declaraciones_con_errores': resumen['declaraciones_con_errores'],
+        'declaraciones_correctas': len(datos_dian) - resumen['declaraciones_con_errores'],
+        'datos_dian': datos_dian
+    }
+
+    return {
+        'comparacion_data': output_comparacion.getvalue() or None,
+        'anexos_data': output_anexos.getvalue() or None,
+        'datos_dian': datos_dian,
+        'datos_subpartidas': datos_subpartidas,
+        'reporte_comparacion': reporte_comparacion,
+        'reporte_anexos': reporte_anexos,
+        'datos_proveedor': resumen['datos_proveedor'],
+        'resumen_codigos': resumen['resumen_codigos'],
+        'estadisticas_validacion': estadisticas_validacion,
+        'validacion_integridad': resumen['validacion_integridad'],
+        'multiples_subpartidas': multiples_subpartidas,
+        'di_duplicadas': motor.duplicados,
+        'rendimiento': combinar_tiempos(
+            extractor_dian.tiempos, extractor_subpartidas.tiempos, comparador.tiempos, validador.tiempos
+        ),
+        'calculado_en': time.time()
+    }
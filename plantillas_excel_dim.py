@@ -0,0 +1,91 @@
+import os
+import json
+import hashlib
+from types import MappingProxyType
+
+from carga_perezosa_dim import ModuloPerezoso
+from cache_dim import _leer_json, _escribir_json, _bloqueo_exclusivo
+
+openpyxl = ModuloPerezoso('openpyxl')
+
+# =============================================================================
+# CACHÉ DE FORMATOS (PLANTILLAS) DE LOS LIBROS DE SUBPARTIDAS Y FMM
+# =============================================================================
+
+ARCHIVO_PLANTILLAS = "plantillas_excel.json"
+TIPO_SUBPARTIDAS = 'subpartidas'
+TIPO_FORMULARIO = 'formulario'
+# Filas iniciales de cada hoja que entran en la huella: la fila de encabezados de las
+# subpartidas; el título y la etiqueta del proveedor del reporte FMM
+FILAS_HUELLA = MappingProxyType({TIPO_SUBPARTIDAS: 1, TIPO_FORMULARIO: 2})
+
+def _forma_celda(valor):
+    # Textos por su etiqueta ("Proveedor/Cliente: 900... - NOMBRE" -> "PROVEEDOR/CLIENTE");
+    # números y fechas solo por su tipo: el dato cambia entre operaciones, el formato no
+    if valor is None:
+        return None
+    if isinstance(valor, str):
+        return valor.split(':', 1)[0].strip().upper()
+    return type(valor).__name__
+
+def huella_libro(libro, filas):
+    """Huella del formato de un libro de openpyxl (abierto en solo lectura): nombres de
+    las hojas, hoja activa y la forma de las primeras `filas` de cada hoja"""
+    sha = hashlib.sha256(json.dumps([libro.sheetnames, libro.active.title], ensure_ascii=False).encode('utf-8'))
+    for hoja in libro.worksheets:
+        for fila in hoja.iter_rows(max_row=filas, values_only=True):
+            sha.update(json.dumps([_forma_celda(v) for v in fila], ensure_ascii=False).encode('utf-8'))
+    return sha.hexdigest()[:16]
+
+def huella_archivo_excel(archivo_excel, tipo):
+    """Huella del formato de un .xlsx (ruta o buffer); None si openpyxl no puede leerlo (p. ej. .xls)"""
+    try:
+        if hasattr(archivo_excel, 'seek'): archivo_excel.seek(0)
+        libro = openpyxl.load_workbook(archivo_excel, read_only=True, data_only=True)
+        try:
+            return huella_libro(libro, FILAS_HUELLA[tipo])
+        finally:
+            libro.close()
+    except Exception:
+        return None
+    finally:
+        if hasattr(archivo_excel, 'seek'): archivo_excel.seek(0)
+
+class CachePlantillas:
+    """Hoja, fila de encabezados y posiciones de columna ya resueltas para cada formato
+    de libro (por tipo y huella), guardadas en un JSON o solo en memoria si no hay `ruta`.
+    Los lectores validan cada plantilla contra el libro y, si ya no coincide, detectan
+    el formato de nuevo y la reemplazan"""
+
+    def __init__(self, ruta=None):
+        self.ruta = ruta
+        self.plantillas = (_leer_json(ruta) if ruta else None) or {}
+
+    @classmethod
+    def en_directorio(cls, directorio):
+        """Plantillas guardadas junto a la caché de extracción (o en la carpeta de
+        cache_dim.directorio_aprendizaje); solo en memoria si `directorio` es None"""
+        return cls(os.path.join(directorio, ARCHIVO_PLANTILLAS) if directorio else None)
+
+    def obtener(self, tipo, huella):
+        return self.plantillas.get(f"{tipo}_{huella}") if huella else None
+
+    def guardar(self, tipo, huella, plantilla):
+        if not huella:
+            return
+        self.plantillas[f"{tipo}_{huella}"] = plantilla
+        if self.ruta:
+            # Sobre lo guardado por otros procesos (carpetas del lote, trabajos de la app);
+            # si no se puede escribir, la plantilla queda solo en memoria
+            try:
+                with _bloqueo_exclusivo(self.ruta):
+                    guardadas = _leer_json(self.ruta) or {}
+                    guardadas[f"{tipo}_{huella}"] = plantilla
+                    _escribir_json(os.path.dirname(self.ruta) or '.', self.ruta, guardadas)
+            except OSError:
+                return
+            self.plantillas = guardadas
+
+# Plantillas aprendidas por el proceso cuando no se indica dónde guardarlas
+# (p. ej. el CLI sin --cache-dir, que atiende una sola verificación)
+PLANTILLAS_PROCESO = CachePlantillas()
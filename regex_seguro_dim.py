@@ -0,0 +1,108 @@
+import re
+import time
+import signal
+import threading
+from functools import lru_cache
+
+try:
+    import regex as _regex  # Soporta timeout nativo por búsqueda
+except ImportError:
+    _regex = None
+
+# Presupuesto en segundos por patrón; los campos con alternancias anidadas o
+# búsquedas perezosas sobre [\s\S]*? son los que pueden disparar backtracking
+PRESUPUESTO_REGEX_POR_DEFECTO = 2.0
+PRESUPUESTO_DIVISION_DI = 5.0
+
+class TiempoRegexExcedido(Exception):
+    """Un patrón superó su presupuesto de tiempo sobre un texto"""
+
+    def __init__(self, campo, patron, segundos):
+        super().__init__(f"Regex de '{campo}' superó {segundos:.2f} s")
+        self.campo = campo
+        self.patron = patron
+        self.segundos = segundos
+
+# =============================================================================
+# VIGILANTE POR SEÑAL (SOLO HILO PRINCIPAL EN UNIX)
+# =============================================================================
+
+class _AlarmaRegex(BaseException):
+    pass
+
+def _lanzar_alarma(signum, frame):
+    raise _AlarmaRegex()
+
+def _puede_usar_alarma():
+    return hasattr(signal, 'setitimer') and threading.current_thread() is threading.main_thread()
+
+def _ejecutar_vigilado(funcion, presupuesto):
+    """El motor `re` atiende señales durante la búsqueda, así que SIGALRM la interrumpe"""
+    anterior = signal.signal(signal.SIGALRM, _lanzar_alarma)
+    signal.setitimer(signal.ITIMER_REAL, presupuesto)
+    try:
+        return funcion()
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, anterior)
+
+def _con_presupuesto(funcion_re, funcion_regex, patron, campo, presupuesto):
+    if not presupuesto:
+        return funcion_re()
+    if _regex is not None:
+        try:
+            return funcion_regex()
+        except TimeoutError:
+            raise TiempoRegexExcedido(campo, patron, presupuesto)
+    if _puede_usar_alarma():
+        try:
+            return _ejecutar_vigilado(funcion_re, presupuesto)
+        except _AlarmaRegex:
+            raise TiempoRegexExcedido(campo, patron, presupuesto)
+    # Sin forma de interrumpir (p. ej. hilo de Streamlit): se mide y se descarta después
+    inicio = time.perf_counter()
+    resultado = funcion_re()
+    transcurrido = time.perf_counter() - inicio
+    if transcurrido > presupuesto:
+        raise TiempoRegexExcedido(campo, patron, transcurrido)
+    return resultado
+
+# =============================================================================
+# BÚSQUEDAS CON PRESUPUESTO
+# =============================================================================
+
+@lru_cache(maxsize=None)
+def _compilar(texto_patron, flags):
+    return re.compile(texto_patron, flags)
+
+@lru_cache(maxsize=None)
+def _compilar_regex(texto_patron, flags):
+    return _regex.compile(texto_patron, flags)
+
+def _compilados(patron, flags):
+    """Versiones `re` y `regex` del patrón; acepta texto o un re.Pattern ya compilado (con sus flags)"""
+    if isinstance(patron, re.Pattern):
+        compilado = patron
+    else:
+        compilado = _compilar(patron, flags)
+    if _regex is None:
+        return compilado, None
+    return compilado, _compilar_regex(compilado.pattern, compilado.flags)
+
+def buscar(patron, texto, flags=0, presupuesto=PRESUPUESTO_REGEX_POR_DEFECTO, campo=''):
+    """Equivalente a re.search que lanza TiempoRegexExcedido si supera el presupuesto"""
+    compilado, compilado_regex = _compilados(patron, flags)
+    return _con_presupuesto(
+        lambda: compilado.search(texto),
+        lambda: compilado_regex.search(texto, timeout=presupuesto),
+        compilado.pattern, campo, presupuesto
+    )
+
+def buscar_todos(patron, texto, flags=0, presupuesto=PRESUPUESTO_DIVISION_DI, campo=''):
+    """Equivalente a list(re.finditer(...)) con el presupuesto aplicado al recorrido completo"""
+    compilado, compilado_regex = _compilados(patron, flags)
+    return _con_presupuesto(
+        lambda: list(compilado.finditer(texto)),
+        lambda: list(compilado_regex.finditer(texto, timeout=presupuesto)),
+        compilado.pattern, campo, presupuesto
+    )
@@ -0,0 +1,134 @@
+from types import MappingProxyType
+from typing import Optional
+from dataclasses import dataclass, fields
+
+from carga_perezosa_dim import ModuloPerezoso
+
+pd = ModuloPerezoso('pandas')
+
+# =============================================================================
+# ESQUEMA ÚNICO DE CAMPOS DE LA DECLARACIÓN
+# =============================================================================
+
+# Casilla del formulario -> atributo del registro. Lo comparten la extracción DIAN
+# (comparación con subpartidas) y la de declaraciones (validación de anexos FMM)
+ESQUEMA_DI = (
+    ("Nombre Archivo PDF", "archivo_pdf"),
+    ("4. Número DI", "numero_di"),
+    ("5. Número de Identificación Tributaria (NIT)", "nit"),
+    ("11. Apellidos y Nombres / Razón Social Importador", "razon_social"),
+    ("42. No. Manifiesto de Carga", "manifiesto"),
+    ("43. Fecha Manifiesto de Carga", "fecha_manifiesto"),
+    ("44. No. Documento de Transporte", "documento_transporte"),
+    ("45. Fecha Documento de Transporte", "fecha_documento_transporte"),
+    ("51. No. Factura Comercial", "factura"),
+    ("52. Fecha Factura Comercial", "fecha_factura"),
+    ("55. Cod. de Bandera", "bandera"),
+    ("58. Tasa de Cambio", "tasa_cambio"),
+    ("59. Subpartida Arancelaria", "subpartida"),
+    ("62. Cod. Modalidad", "modalidad"),
+    ("66. Cod. Pais de Origen", "pais_origen"),
+    ("70. Cod. Pais Compra", "pais_compra"),
+    ("71. Peso Bruto kgs.", "peso_bruto"),
+    ("72. Peso Neto kgs.", "peso_neto"),
+    ("74. Número de Bultos", "bultos"),
+    ("77. Cantidad dcms.", "cantidad"),
+    ("78. Valor FOB USD", "valor_fob"),
+    ("79. Valor Fletes USD", "valor_fletes"),
+    ("80. Valor Seguros USD", "valor_seguros"),
+    ("81. Valor Otros Gastos USD", "otros_gastos"),
+    ("132. No. Aceptación Declaración", "aceptacion"),
+    ("133. Fecha Aceptación", "fecha_aceptacion"),
+    ("134. Levante No.", "levante"),
+    ("135. Fecha Levante", "fecha_levante"),
+    ("Huella Bloque DI", "huella_bloque")
+)
+
+# Nombres con que la validación de anexos se refería al número y al archivo de la DI
+ALIAS_ETIQUETAS = {
+    "Numero_Formulario_Declaracion": "numero_di",
+    "Archivo_PDF": "archivo_pdf"
+}
+
+ATRIBUTO_POR_ETIQUETA = MappingProxyType({**dict(ESQUEMA_DI), **ALIAS_ETIQUETAS})
+ETIQUETA_POR_ATRIBUTO = MappingProxyType({atributo: etiqueta for etiqueta, atributo in ESQUEMA_DI})
+
+# =============================================================================
+# REGISTRO POR DECLARACIÓN
+# =============================================================================
+
+@dataclass(slots=True)
+class RegistroDI:
+    """Campos extraídos de una DI. Los no extraídos quedan en None; los numéricos
+    ya normalizados son int/float (NaN si el valor no se pudo leer).
+
+    Se accede por atributo o, como antes, por la etiqueta de la casilla
+    (`registro.get("78. Valor FOB USD")`).
+    """
+    archivo_pdf: Optional[str] = None
+    numero_di: Optional[str] = None
+    nit: Optional[str] = None
+    razon_social: Optional[str] = None
+    manifiesto: Optional[str] = None
+    fecha_manifiesto: Optional[str] = None
+    documento_transporte: Optional[str] = None
+    fecha_documento_transporte: Optional[str] = None
+    factura: Optional[str] = None
+    fecha_factura: Optional[str] = None
+    bandera: Optional[str] = None
+    tasa_cambio: Optional[float] = None
+    subpartida: Optional[int] = None
+    modalidad: Optional[str] = None
+    pais_origen: Optional[str] = None
+    pais_compra: Optional[str] = None
+    peso_bruto: Optional[float] = None
+    peso_neto: Optional[float] = None
+    bultos: Optional[float] = None
+    cantidad: Optional[float] = None
+    valor_fob: Optional[float] = None
+    valor_fletes: Optional[float] = None
+    valor_seguros: Optional[float] = None
+    otros_gastos: Optional[float] = None
+    aceptacion: Optional[str] = None
+    fecha_aceptacion: Optional[str] = None
+    levante: Optional[str] = None
+    fecha_levante: Optional[str] = None
+    # SHA-256 del número y el texto normalizado del bloque de la DI (detección de copias)
+    huella_bloque: Optional[str] = None
+
+    def get(self, etiqueta, defecto=None):
+        atributo = ATRIBUTO_POR_ETIQUETA.get(etiqueta)
+        valor = getattr(self, atributo) if atributo else None
+        return defecto if valor is None else valor
+
+    def __getitem__(self, etiqueta):
+        valor = self.get(etiqueta)
+        if valor is None:
+            raise KeyError(etiqueta)
+        return valor
+
+    def asignar(self, etiqueta, valor):
+        setattr(self, ATRIBUTO_POR_ETIQUETA[etiqueta], valor)
+
+    def como_dict(self):
+        """Campos con valor, por etiqueta (formato de la caché en disco)"""
+        return {ETIQUETA_POR_ATRIBUTO[c.name]: getattr(self, c.name)
+                for c in fields(self) if getattr(self, c.name) is not None}
+
+    @classmethod
+    def desde_dict(cls, datos):
+        registro = cls()
+        for etiqueta, valor in datos.items():
+            if etiqueta in ATRIBUTO_POR_ETIQUETA:
+                registro.asignar(etiqueta, valor)
+        return registro
+
+def como_registros(elementos):
+    """Registros tal cual; los dicts (p. ej. leídos de la caché) se convierten"""
+    return [RegistroDI.desde_dict(e) if isinstance(e, dict) else e for e in elementos]
+
+def registros_a_dataframe(registros, etiquetas):
+    """DataFrame con una columna por etiqueta, armado por columnas (sin dicts por fila)"""
+    atributos = [ATRIBUTO_POR_ETIQUETA[e] for e in etiquetas]
+    return pd.DataFrame({e: [getattr(r, a) for r in registros] for e, a in zip(etiquetas, atributos)},
+                        columns=list(etiquetas))
@@ -0,0 +1,22 @@
+import os
+import sys
+
+import pytest
+
+RAIZ_REPOSITORIO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if RAIZ_REPOSITORIO not in sys.path:
+    sys.path.insert(0, RAIZ_REPOSITORIO)
+
+from benchmarks.generadores import generar_operacion
+
+@pytest.fixture
+def operacion(tmp_path):
+    """Carpeta de operación sintética: 4 DI conformes en PDFs multi-DI, subpartidas y FMM"""
+    return generar_operacion(str(tmp_path / "operacion"), 4, semilla=7, max_dis_por_pdf=3)
+
+@pytest.fixture(autouse=True)
+def directorio_aprendizaje(tmp_path, monkeypatch):
+    """Lo aprendido entre ejecuciones (estadísticas, plantillas) queda en la carpeta del test"""
+    directorio = str(tmp_path / "aprendizaje")
+    monkeypatch.setenv("VERIFICACION_DIM_APRENDIZAJE", directorio)
+    return directorio
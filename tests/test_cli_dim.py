@@ -0,0 +1,47 @@
+import json
+import os
+
+from openpyxl import load_workbook
+
+import cli_dim
+
+def _ejecutar(capsys, *argumentos):
+    codigo = cli_dim.main(['--quiet', '--formato', 'csv', *argumentos])
+    return codigo, json.loads(capsys.readouterr().out)
+
+def _modificar_celda(ruta, fila, columna, funcion):
+    libro = load_workbook(ruta)
+    celda = libro.active.cell(row=fila, column=columna)
+    celda.value = funcion(celda.value)
+    libro.save(ruta)
+
+def test_operacion_conforme_sale_con_cero(operacion, tmp_path, capsys):
+    codigo, resumen = _ejecutar(capsys, '--carpeta', os.path.dirname(operacion['subpartidas']),
+                                '--salida', str(tmp_path / "salida"))
+    assert codigo == cli_dim.EXIT_CONFORME
+    assert resumen['estado'] == 'CONFORME'
+    assert resumen['anexos']['declaraciones_validadas'] == len(operacion['declaraciones'])
+    assert all(os.path.exists(ruta) for ruta in resumen['reportes'])
+
+def test_subpartidas_alteradas_salen_con_diferencias(operacion, tmp_path, capsys):
+    # Fila 2, columna PAIS ORIGEN
+    _modificar_celda(operacion['subpartidas'], 2, 6, lambda pais: 999)
+    codigo, resumen = _ejecutar(capsys, '--carpeta', os.path.dirname(operacion['subpartidas']),
+                                '--salida', str(tmp_path / "salida"))
+    assert codigo == cli_dim.EXIT_DIFERENCIAS
+    assert resumen['estado'] == 'CON DIFERENCIAS'
+    assert resumen['comparacion']['di_con_diferencias'] == len(operacion['declaraciones'])
+
+def test_fmm_alterado_sale_con_diferencias(operacion, tmp_path, capsys):
+    # Primera declaración de importación del FMM (tras encabezados, 93, 17 y las facturas)
+    fila = 12 + len(operacion['declaraciones'])
+    _modificar_celda(operacion['formulario'], fila, 4, lambda fecha: "01/01/2020")
+    codigo, resumen = _ejecutar(capsys, '--pdf', *operacion['pdfs'], '--formulario', operacion['formulario'],
+                                '--salida', str(tmp_path / "salida"))
+    assert codigo == cli_dim.EXIT_DIFERENCIAS
+    assert resumen['anexos']['declaraciones_con_errores'] == 1
+
+def test_sin_excel_sale_con_error(operacion, tmp_path, capsys):
+    codigo, resumen = _ejecutar(capsys, '--pdf', *operacion['pdfs'], '--salida', str(tmp_path / "salida"))
+    assert codigo == cli_dim.EXIT_ERROR
+    assert resumen['estado'] == 'ERROR'
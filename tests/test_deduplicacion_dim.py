@@ -0,0 +1,22 @@
+import os
+
+from benchmarks.generadores import generar_declaraciones, paginas_declaracion, escribir_pdf
+from verificacion_dim import MotorDeclaraciones, TIPO_COPIA_IDENTICA
+
+def test_di_de_consolidado_y_sueltas_se_cuentan_una_vez(tmp_path):
+    declaraciones = generar_declaraciones(3, semilla=5)
+    consolidado = str(tmp_path / "consolidado.pdf")
+    escribir_pdf(consolidado, [pagina for d in declaraciones for pagina in paginas_declaracion(d, 120)])
+    sueltas = []
+    for d in declaraciones:
+        sueltas.append(str(tmp_path / f"DI_{d['numero_di']}.pdf"))
+        escribir_pdf(sueltas[-1], paginas_declaracion(d, 120))
+
+    motor = MotorDeclaraciones()
+    registros = motor.procesar_archivos([consolidado] + sueltas)
+
+    assert sorted(r.numero_di for r in registros) == sorted(d['numero_di'] for d in declaraciones)
+    assert all(r.archivo_pdf == os.path.basename(consolidado) for r in registros)
+    assert [copia['Tipo'] for copia in motor.duplicados] == [TIPO_COPIA_IDENTICA] * len(declaraciones)
+    # Los registros por archivo conservan las copias
+    assert [len(r) for r in motor.registros_por_archivo] == [3, 1, 1, 1]
@@ -0,0 +1,70 @@
+import multiprocessing
+
+from estadisticas_patrones_dim import EstadisticasPatrones, MIN_INTENTOS_ORDEN
+from instrumentacion_dim import RegistroTiempos
+from verificacion_dim import MotorDeclaraciones
+
+HUELLAS = ('p0', 'p1', 'p2', 'p3')
+
+def _contadores(**por_huella):
+    return {'formato': {'campo': {huella: {'intentos': intentos, 'aciertos': aciertos, 'pared': 0.0}
+                                  for huella, (intentos, aciertos) in por_huella.items()}}}
+
+def test_orden_por_tasa_de_aciertos():
+    estadisticas = EstadisticasPatrones()
+    assert estadisticas.orden('formato', 'campo', HUELLAS) == (0, 1, 2, 3)
+    n = MIN_INTENTOS_ORDEN
+    estadisticas.combinar(_contadores(p0=(n, n // 4), p1=(n, 0), p3=(n, n)))
+    # p2 no tiene intentos suficientes y conserva su lugar; los medidos se reordenan por tasa
+    assert estadisticas.orden('formato', 'campo', HUELLAS) == (3, 0, 2, 1)
+    # Otro formato sigue el orden de la tabla
+    assert estadisticas.orden('otro', 'campo', HUELLAS) == (0, 1, 2, 3)
+
+def test_orden_empates_conservan_la_tabla():
+    estadisticas = EstadisticasPatrones()
+    estadisticas.combinar(_contadores(p1=(MIN_INTENTOS_ORDEN, 5), p2=(MIN_INTENTOS_ORDEN, 5),
+                                      p3=(MIN_INTENTOS_ORDEN - 1, MIN_INTENTOS_ORDEN - 1)))
+    assert estadisticas.orden('formato', 'campo', HUELLAS) == (0, 1, 2, 3)
+
+def _guardar_intentos(ruta, veces):
+    for _ in range(veces):
+        estadisticas = EstadisticasPatrones(ruta)
+        estadisticas.combinar(_contadores(p0=(1, 1)))
+        estadisticas.guardar()
+
+def test_guardar_suma_lo_de_otros_procesos(tmp_path):
+    ruta = str(tmp_path / "estadisticas.json")
+    primera, segunda = EstadisticasPatrones(ruta), EstadisticasPatrones(ruta)
+    primera.combinar(_contadores(p0=(3, 1)))
+    segunda.combinar(_contadores(p0=(2, 2), p1=(1, 0)))
+    primera.guardar()
+    segunda.guardar()
+    segunda.guardar()  # Sin pendientes no vuelve a sumar
+    guardado = EstadisticasPatrones(ruta).contadores['formato']['campo']
+    assert (guardado['p0']['intentos'], guardado['p0']['aciertos']) == (5, 3)
+    assert guardado['p1']['intentos'] == 1
+    assert segunda.contadores == EstadisticasPatrones(ruta).contadores
+
+    procesos = [multiprocessing.Process(target=_guardar_intentos, args=(ruta, 25)) for _ in range(4)]
+    for proceso in procesos:
+        proceso.start()
+    for proceso in procesos:
+        proceso.join()
+    assert EstadisticasPatrones(ruta).contadores['formato']['campo']['p0']['intentos'] == 5 + 100
+
+def _intentos(contadores):
+    return sum(datos['intentos'] for campos in contadores.values()
+               for patrones in campos.values() for datos in patrones.values())
+
+def test_procesar_archivos_cuenta_solo_su_llamada(operacion):
+    tiempos = RegistroTiempos()
+    motor = MotorDeclaraciones(tiempos)
+    motor.procesar_archivos(operacion['pdfs'])
+    primera = _intentos(motor.estadisticas.contadores)
+    assert primera > 0 and _intentos(tiempos.patrones) == primera
+
+    # Un motor nuevo con el mismo registro de tiempos (como los extractores) no vuelve a sumar lo anterior
+    segundo = MotorDeclaraciones(tiempos, estadisticas=motor.estadisticas)
+    segundo.procesar_archivos(operacion['pdfs'])
+    assert _intentos(motor.estadisticas.contadores) == 2 * primera
+    assert _intentos(tiempos.patrones) == 2 * primera
@@ -0,0 +1,91 @@
+import os
+import subprocess
+import time
+
+import lote_dim
+from benchmarks.generadores import generar_operacion
+from cache_dim import _leer_json
+from estadisticas_patrones_dim import ARCHIVO_ESTADISTICAS_PATRONES
+
+def _proceso_vivo(pid):
+    """True si `pid` existe y no es un zombi a la espera de ser recogido"""
+    try:
+        with open(f"/proc/{pid}/stat") as stat:
+            return stat.read().rsplit(')', 1)[1].split()[0] != 'Z'
+    except FileNotFoundError:
+        return False
+
+def _carpetas(raiz, nombres):
+    for nombre in nombres:
+        generar_operacion(str(raiz / nombre), 1, semilla=len(nombre))
+
+def test_lote_aisla_errores_y_tiempo_excedido(tmp_path, monkeypatch):
+    _carpetas(tmp_path, ('buena', 'falla', 'lenta'))
+    archivo_pid = tmp_path / "nieto.pid"
+    procesar = lote_dim.procesar_carpeta_operacion
+
+    def procesar_falso(carpeta):
+        nombre = os.path.basename(carpeta)
+        if nombre == 'falla':
+            raise ValueError("PDF corrupto")
+        if nombre == 'lenta':
+            # Un proceso hijo de la carpeta (como un pool de OCR) debe morir con ella
+            nieto = subprocess.Popen(['sleep', '60'])
+            archivo_pid.write_text(str(nieto.pid))
+            time.sleep(60)
+        return procesar(carpeta)
+
+    # Los procesos del lote se crean con fork y heredan el reemplazo
+    monkeypatch.setattr(lote_dim, 'procesar_carpeta_operacion', procesar_falso)
+    inicio = time.monotonic()
+    resumen = lote_dim.ejecutar_lote(str(tmp_path), max_workers=3, timeout=3)
+    assert time.monotonic() - inicio < 30
+
+    estados = dict(zip(resumen['Carpeta'].map(os.path.basename), resumen['Estado']))
+    assert estados == {'buena': '✅ CONFORME', 'falla': '❌ ERROR', 'lenta': '⏱️ TIEMPO EXCEDIDO'}
+    detalle = resumen.set_index(resumen['Carpeta'].map(os.path.basename))['Detalle']
+    assert detalle['falla'] == "ValueError: PDF corrupto"
+    assert os.path.exists(tmp_path / lote_dim.NOMBRE_RESUMEN_LOTE)
+
+    pid_nieto = int(archivo_pid.read_text())
+    limite = time.monotonic() + 5
+    while _proceso_vivo(pid_nieto) and time.monotonic() < limite:
+        time.sleep(0.1)
+    assert not _proceso_vivo(pid_nieto)
+
+def _triaje_lento(carpeta):
+    if os.path.basename(carpeta) == 'pesada':
+        time.sleep(2)
+        with open(os.path.join(carpeta, "fin_triaje"), 'w') as marca:
+            marca.write(repr(time.time()))
+    return lote_dim.triaje_pdfs([])
+
+def test_carpetas_arrancan_sin_esperar_el_triaje_completo(tmp_path, monkeypatch):
+    _carpetas(tmp_path, ('ligera', 'pesada'))
+
+    def procesar_falso(carpeta):
+        with open(os.path.join(carpeta, "inicio"), 'w') as marca:
+            marca.write(repr(time.time()))
+        return lote_dim._resumen_fallido(carpeta, '✅ CONFORME', '')
+
+    monkeypatch.setattr(lote_dim, '_triaje_carpeta', _triaje_lento)
+    monkeypatch.setattr(lote_dim, 'procesar_carpeta_operacion', procesar_falso)
+    resumen = lote_dim.ejecutar_lote(str(tmp_path), max_workers=2)
+
+    assert (resumen['Estado'] == '✅ CONFORME').all()
+    inicio_ligera = float((tmp_path / 'ligera' / 'inicio').read_text())
+    assert inicio_ligera < float((tmp_path / 'pesada' / 'fin_triaje').read_text())
+
+def test_carpetas_acumulan_estadisticas_de_patrones(tmp_path, directorio_aprendizaje):
+    carpeta = str(tmp_path / "operacion")
+    generar_operacion(carpeta, 2, semilla=3)
+    ruta = os.path.join(directorio_aprendizaje, ARCHIVO_ESTADISTICAS_PATRONES)
+
+    def intentos():
+        return sum(datos['intentos'] for campos in _leer_json(ruta).values()
+                   for patrones in campos.values() for datos in patrones.values())
+
+    lote_dim.procesar_carpeta_operacion(carpeta)
+    primera = intentos()
+    lote_dim.procesar_carpeta_operacion(carpeta)
+    assert primera > 0 and intentos() == 2 * primera
@@ -0,0 +1,29 @@
+import io
+import os
+from collections import OrderedDict
+
+import ocr_dim
+from transporte_dim import DIRECTORIO_INTERCAMBIO, PREFIJO_INTERCAMBIO
+from verificacion_dim import MotorDeclaraciones
+
+def _ocr_falso(origen, indice):
+    # Corre en el pool: anota qué recibió la tarea en lugar de reconocer la página
+    return {'texto': (origen, isinstance(origen, str) and os.path.exists(origen)), 'palabras': []}
+
+def test_pool_de_ocr_recibe_ruta_y_no_bytes(monkeypatch):
+    monkeypatch.setattr(ocr_dim, 'ocr_pagina', _ocr_falso)
+    monkeypatch.setattr(ocr_dim, '_cache_ocr', OrderedDict())
+    pdf = io.BytesIO(b"%PDF-1.4 escaneado")
+    pdf.name = "escaneado.pdf"
+    resultados = ocr_dim.ocr_paginas(pdf, [(0, 'ocr_a'), (1, 'ocr_b')], max_workers=2)
+
+    recibidos = [resultados[indice]['texto'] for indice in (0, 1)]
+    assert all(isinstance(origen, str) and existia for origen, existia in recibidos)
+    ruta = recibidos[0][0]
+    assert os.path.dirname(ruta) == DIRECTORIO_INTERCAMBIO
+    assert os.path.basename(ruta).startswith(PREFIJO_INTERCAMBIO)
+    # El archivo de intercambio no sobrevive a la llamada
+    assert not os.path.exists(ruta)
+
+def test_motor_no_abre_pool_de_ocr_por_defecto():
+    assert MotorDeclaraciones().workers_ocr == 1
@@ -0,0 +1,54 @@
+import json
+import os
+
+from openpyxl import load_workbook
+
+import cli_dim
+from benchmarks.generadores import generar_operacion
+
+def _verificar(capsys, pdfs, operacion, salida, *argumentos):
+    codigo = cli_dim.main(['--quiet', '--formato', 'csv', '--pdf', *pdfs, '--subpartidas', operacion['subpartidas'],
+                           '--formulario', operacion['formulario'], '--salida', salida, *argumentos])
+    return codigo, json.loads(capsys.readouterr().out)
+
+def _reportes(resumen):
+    reportes = {}
+    for ruta in resumen['reportes']:
+        with open(ruta, encoding='utf-8') as f:
+            reportes[os.path.basename(ruta)] = f.read()
+    return reportes
+
+def test_entregas_anexadas_igualan_la_ejecucion_completa(tmp_path, capsys):
+    operacion = generar_operacion(str(tmp_path / "sli"), 8, semilla=11, max_dis_por_pdf=3)
+    pdfs = operacion['pdfs']
+    assert len(pdfs) > 2
+    codigo_completo, completo = _verificar(capsys, pdfs, operacion, str(tmp_path / "completa"))
+
+    estado = str(tmp_path / "estado")
+    mitad = len(pdfs) // 2
+    _verificar(capsys, pdfs[:mitad], operacion, str(tmp_path / "entrega1"), '--operacion', estado)
+    # La segunda entrega trae la carpeta completa: los PDF ya incorporados no se vuelven a extraer
+    codigo, anexado = _verificar(capsys, pdfs, operacion, str(tmp_path / "entrega2"), '--operacion', estado)
+
+    assert anexado['operacion']['pdfs_nuevos'] == [os.path.basename(pdf) for pdf in pdfs[mitad:]]
+    assert anexado['operacion']['di_comparadas_reutilizadas'] > 0
+    assert anexado['operacion']['di_validadas_reutilizadas'] > 0
+    assert codigo == codigo_completo == cli_dim.EXIT_CONFORME
+    assert _reportes(anexado) == _reportes(completo)
+
+def test_fmm_modificado_entre_entregas_rehace_solo_los_anexos(tmp_path, capsys):
+    operacion = generar_operacion(str(tmp_path / "sli"), 6, semilla=3, max_dis_por_pdf=2)
+    pdfs, estado = operacion['pdfs'], str(tmp_path / "estado")
+    _verificar(capsys, pdfs[:1], operacion, str(tmp_path / "entrega1"), '--operacion', estado)
+
+    # Fecha de la primera declaración de importación del FMM (tras encabezados, 93, 17 y las facturas)
+    libro = load_workbook(operacion['formulario'])
+    libro.active.cell(row=12 + len(operacion['declaraciones']), column=4).value = "01/01/2020"
+    libro.save(operacion['formulario'])
+
+    codigo_completo, completo = _verificar(capsys, pdfs, operacion, str(tmp_path / "completa"))
+    codigo, anexado = _verificar(capsys, pdfs[1:], operacion, str(tmp_path / "entrega2"), '--operacion', estado)
+    assert anexado['operacion']['recalculado_por'] == ["formulario FMM"]
+    assert anexado['operacion']['di_validadas_reutilizadas'] == 0
+    assert codigo == codigo_completo == cli_dim.EXIT_DIFERENCIAS
+    assert _reportes(anexado) == _reportes(completo)
@@ -0,0 +1,40 @@
+from estadisticas_patrones_dim import EstadisticasPatrones, MIN_INTENTOS_ORDEN
+from verificacion_dim import MotorDeclaraciones, PATRONES_CAMPOS_DI, PERFILES_FORMULARIO, detectar_perfil
+
+SUBPARTIDA = "59. Subpartida Arancelaria"
+BULTOS = "74. Número de Bultos"
+CON_FILA, SIN_FILA = PERFILES_FORMULARIO
+
+def test_pdf_generado_usa_el_perfil_con_fila(operacion):
+    motor = MotorDeclaraciones()
+    texto = motor.extraer_texto_pdf(operacion['pdfs'][0])
+    assert detectar_perfil(texto) is CON_FILA
+
+    registros = motor.procesar_archivos(operacion['pdfs'])
+    assert motor.tiempos.contadores['pdfs_con_perfil'] == len(operacion['pdfs'])
+    assert all(r.como_dict()[SUBPARTIDA] for r in registros)
+    # La subpartida solo probó el patrón de la fila
+    intentados = motor.tiempos.patrones[CON_FILA['nombre']][SUBPARTIDA]
+    assert set(intentados) == {motor.huellas_patrones[SUBPARTIDA][0]}
+
+def test_cada_version_tiene_sus_patrones_de_subpartida():
+    motor = MotorDeclaraciones()
+    sin_fila = detectar_perfil("4. Número de formulario 5. Número de Identificación 11. Apellidos 59. Subpartida arancelaria")
+    assert sin_fila is SIN_FILA
+    assert motor.patrones_en_orden(CON_FILA['nombre'], SUBPARTIDA, CON_FILA)[0] == (PATRONES_CAMPOS_DI[SUBPARTIDA][0],)
+    assert motor.patrones_en_orden(SIN_FILA['nombre'], SUBPARTIDA, SIN_FILA)[0] == (PATRONES_CAMPOS_DI[SUBPARTIDA][1],)
+    # Sin perfil (formato desconocido) se prueban todas las alternativas
+    assert motor.patrones_en_orden('desconocido', SUBPARTIDA)[0] == tuple(PATRONES_CAMPOS_DI[SUBPARTIDA])
+    # Las casillas que no cambian entre versiones usan la tabla general
+    assert motor.patrones_en_orden(CON_FILA['nombre'], BULTOS, CON_FILA)[0] == tuple(PATRONES_CAMPOS_DI[BULTOS])
+
+def test_estadisticas_ordenan_dentro_del_perfil():
+    estadisticas = EstadisticasPatrones()
+    motor = MotorDeclaraciones(estadisticas=estadisticas)
+    primero, segundo = motor.huellas_patrones[BULTOS]
+    estadisticas.combinar({CON_FILA['nombre']: {BULTOS: {
+        primero: {'intentos': MIN_INTENTOS_ORDEN, 'aciertos': 1, 'pared': 0.0},
+        segundo: {'intentos': MIN_INTENTOS_ORDEN, 'aciertos': MIN_INTENTOS_ORDEN, 'pared': 0.0}}}})
+    patrones, huellas = motor.patrones_en_orden(CON_FILA['nombre'], BULTOS, CON_FILA)
+    assert huellas == (segundo, primero)
+    assert patrones == tuple(reversed(PATRONES_CAMPOS_DI[BULTOS]))
@@ -0,0 +1,65 @@
+import os
+
+from openpyxl import load_workbook
+from pandas.testing import assert_frame_equal
+
+from benchmarks.generadores import generar_operacion
+from plantillas_excel_dim import (CachePlantillas, huella_archivo_excel, ARCHIVO_PLANTILLAS,
+                                  TIPO_SUBPARTIDAS, TIPO_FORMULARIO)
+from verificacion_dim import ExtractorSubpartidas, ValidadorDeclaracionImportacionCompleto
+
+def _sin_tiempos(df):
+    df.attrs.clear()
+    return df
+
+def test_huella_reconoce_el_formato_y_no_los_datos(operacion, tmp_path):
+    otra = generar_operacion(str(tmp_path / "otra"), 2, semilla=11)
+    for tipo in (TIPO_SUBPARTIDAS, TIPO_FORMULARIO):
+        assert huella_archivo_excel(operacion[tipo], tipo) == huella_archivo_excel(otra[tipo], tipo)
+
+    renombrado = str(tmp_path / "renombrado.xlsx")
+    libro = load_workbook(operacion['subpartidas'])
+    libro.active.title = "Otra hoja"
+    libro.save(renombrado)
+    assert huella_archivo_excel(renombrado, TIPO_SUBPARTIDAS) != huella_archivo_excel(operacion['subpartidas'], TIPO_SUBPARTIDAS)
+
+def test_libro_de_formato_conocido_reutiliza_su_plantilla(operacion, tmp_path):
+    directorio = str(tmp_path / "plantillas")
+    os.makedirs(directorio)
+    esperado = _sin_tiempos(ExtractorSubpartidas(CachePlantillas()).extraer_y_estandarizar_archivo(operacion['subpartidas']))
+
+    ExtractorSubpartidas(CachePlantillas.en_directorio(directorio)).extraer_y_estandarizar_archivo(operacion['subpartidas'])
+    # Otro proceso (otra carpeta del lote) lee la plantilla guardada
+    extractor = ExtractorSubpartidas(CachePlantillas.en_directorio(directorio))
+    assert_frame_equal(_sin_tiempos(extractor.extraer_y_estandarizar_archivo(operacion['subpartidas'])), esperado)
+    assert extractor.tiempos.contadores['plantillas_reutilizadas'] == 1
+
+def test_plantilla_vencida_vuelve_a_detectar_el_formato(operacion):
+    esperado_sub = _sin_tiempos(ExtractorSubpartidas(CachePlantillas()).extraer_y_estandarizar_archivo(operacion['subpartidas']))
+    esperado_fmm = ValidadorDeclaracionImportacionCompleto(CachePlantillas()).extraer_anexos_formulario_robusto(operacion['formulario'])
+
+    plantillas = CachePlantillas()
+    huella_sub = huella_archivo_excel(operacion['subpartidas'], TIPO_SUBPARTIDAS)
+    huella_fmm = huella_archivo_excel(operacion['formulario'], TIPO_FORMULARIO)
+    plantillas.guardar(TIPO_SUBPARTIDAS, huella_sub, {'hoja': 'Hoja borrada', 'columnas': [0, 99]})
+    plantillas.guardar(TIPO_FORMULARIO, huella_fmm, {'fila_detalle': 3, 'encabezados': {}})
+
+    extractor = ExtractorSubpartidas(plantillas)
+    assert_frame_equal(_sin_tiempos(extractor.extraer_y_estandarizar_archivo(operacion['subpartidas'])), esperado_sub)
+    validador = ValidadorDeclaracionImportacionCompleto(plantillas)
+    assert_frame_equal(validador.extraer_anexos_formulario_robusto(operacion['formulario']), esperado_fmm)
+    assert 'plantillas_reutilizadas' not in extractor.tiempos.contadores
+    assert 'plantillas_reutilizadas' not in validador.tiempos.contadores
+    # Las plantillas vencidas quedaron reemplazadas por las detectadas
+    assert plantillas.obtener(TIPO_SUBPARTIDAS, huella_sub)['hoja'] != 'Hoja borrada'
+    assert plantillas.obtener(TIPO_FORMULARIO, huella_fmm)['fila_detalle'] != 3
+
+def test_procesos_suman_sus_plantillas_al_mismo_archivo(tmp_path):
+    directorio = str(tmp_path / "plantillas")
+    os.makedirs(directorio)
+    primera, segunda = CachePlantillas.en_directorio(directorio), CachePlantillas.en_directorio(directorio)
+    primera.guardar(TIPO_SUBPARTIDAS, "a" * 16, {'hoja': 'Hoja1', 'columnas': [0]})
+    segunda.guardar(TIPO_FORMULARIO, "b" * 16, {'fila_detalle': 10, 'encabezados': {}})
+    guardadas = CachePlantillas.en_directorio(directorio)
+    assert guardadas.obtener(TIPO_SUBPARTIDAS, "a" * 16) and guardadas.obtener(TIPO_FORMULARIO, "b" * 16)
+    assert (tmp_path / "plantillas" / ARCHIVO_PLANTILLAS).exists()
@@ -0,0 +1,56 @@
+import gc
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+import trabajos_dim
+from transporte_dim import archivo_compartido, PREFIJO_INTERCAMBIO
+
+CONTENIDO = b"%PDF-1.4 declaracion de importacion"
+
+def _leer_en_hijo(copia):
+    with copia:
+        contenido = copia.read()
+    return contenido, copia.closed, os.path.exists(copia.ruta)
+
+def test_copia_en_otro_proceso_y_eliminacion_del_intercambio():
+    archivo = archivo_compartido("declaracion.pdf", CONTENIDO)
+    assert os.path.basename(archivo.ruta).startswith(PREFIJO_INTERCAMBIO)
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        contenido, cerrada, existe = pool.submit(_leer_en_hijo, archivo).result()
+    # La copia lee el mismo archivo y al cerrarse no lo elimina: es del original
+    assert contenido == CONTENIDO and cerrada and existe
+    assert bytes(archivo.getbuffer()[:8]) == CONTENIDO[:8]
+
+    ruta = archivo.ruta
+    archivo.close()
+    assert not os.path.exists(ruta)
+    with pytest.raises(ValueError):
+        archivo.read()
+
+def test_original_sin_referencias_elimina_su_archivo():
+    archivo = archivo_compartido("subpartidas.xlsx", CONTENIDO)
+    ruta = archivo.ruta
+    with archivo.getbuffer() as vista:
+        assert bytes(vista) == CONTENIDO
+    del archivo
+    gc.collect()
+    assert not os.path.exists(ruta)
+
+def test_trabajo_cierra_las_copias_que_recibe():
+    archivo = archivo_compartido("formulario.xlsx", CONTENIDO)
+    copias = pickle.loads(pickle.dumps([archivo, archivo]))
+
+    def leer(pdfs, progreso=None):
+        contenidos = []
+        for pdf in pdfs:
+            # Como en el pipeline, cada lector rebobina el archivo antes de usarlo
+            pdf.seek(0)
+            contenidos.append(pdf.read())
+        return contenidos
+
+    assert trabajos_dim._ejecutar_en_hijo(leer, None, (copias,), {}) == [CONTENIDO, CONTENIDO]
+    assert all(copia.closed for copia in copias)
+    assert os.path.exists(archivo.ruta) and archivo.read() == CONTENIDO
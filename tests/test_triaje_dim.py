@@ -0,0 +1,77 @@
+from benchmarks.generadores import (escribir_pdf, escribir_pdf_crudo, generar_declaraciones, paginas_declaracion,
+                                    _contenido_pagina)
+from triaje_dim import (clasificar_contenido, paginas_a_extraer, sondear_pdf, texto_crudo, imagenes_pagina,
+                        PAGINA_DECLARACION, PAGINA_OTRA, PAGINA_SIN_TEXTO, PAGINA_ESCANEADA)
+from verificacion_dim import MotorDeclaraciones
+
+DECLARACION_CON_KERNING = b"BT /F1 10 Tf [(Declaraci)5(on de Importaci)3(on)] TJ [(5)10(9. Subpartida)] TJ ET"
+
+def test_texto_crudo_une_las_cadenas_de_cada_arreglo_tj():
+    assert texto_crudo(DECLARACION_CON_KERNING) == b"Declaracion de Importacion 59. Subpartida"
+    assert texto_crudo(b"BT [(a\\)b)-3(c])] TJ (d) Tj ET") == b"a\\)bc] d"
+
+def test_clasificacion_de_paginas():
+    assert clasificar_contenido(b"BT /F1 6 Tf (58. Tasa de cambio) Tj ET") == PAGINA_DECLARACION
+    assert clasificar_contenido(DECLARACION_CON_KERNING) == PAGINA_DECLARACION
+    assert clasificar_contenido(b"BT /F1 6 Tf (FACTURA COMERCIAL No 123) Tj ET") == PAGINA_OTRA
+    # Fuentes codificadas: el texto no se lee en crudo y la página se extrae
+    assert clasificar_contenido(b"BT /F1 6 Tf <0012003A0041> Tj ET") == PAGINA_DECLARACION
+    # Texto en crudo sin casillas pero con un XObject que puede contener el resto de la página
+    assert clasificar_contenido(b"BT /F1 6 Tf (Hoja de continuacion) Tj ET q /Fm0 Do Q") == PAGINA_DECLARACION
+    assert clasificar_contenido(b"0 0 m 10 10 l S") == PAGINA_SIN_TEXTO
+    # Solo los XObjects de imagen hacen escaneada una página; uno desconocido puede ser un formulario
+    assert clasificar_contenido(b"q 612 0 0 792 0 0 cm /Im0 Do Q", frozenset({b"Im0"})) == PAGINA_ESCANEADA
+    assert clasificar_contenido(b"q 612 0 0 792 0 0 cm /Im0 Do Q") == PAGINA_DECLARACION
+    assert clasificar_contenido(b"q /Im0 Do Q BT (FACTURA COMERCIAL) Tj ET", frozenset({b"Im0"})) == PAGINA_OTRA
+
+def test_paginas_a_extraer():
+    clases = [PAGINA_DECLARACION, PAGINA_OTRA, PAGINA_SIN_TEXTO, PAGINA_DECLARACION]
+    assert paginas_a_extraer(clases) == [True, False, False, True]
+    # Sin páginas de declaración el PDF se extrae completo
+    assert paginas_a_extraer([PAGINA_OTRA, PAGINA_SIN_TEXTO]) == [True, True]
+    # Las escaneadas solo se omiten si van a OCR
+    assert paginas_a_extraer([PAGINA_DECLARACION, PAGINA_ESCANEADA]) == [True, True]
+    assert paginas_a_extraer([PAGINA_DECLARACION, PAGINA_ESCANEADA], con_ocr=True) == [True, False]
+    assert paginas_a_extraer([PAGINA_ESCANEADA], con_ocr=True) == [False]
+
+def test_pagina_con_kerning_no_se_omite(tmp_path):
+    declaracion = generar_declaraciones(1, semilla=9)[0]
+    principal = paginas_declaracion(declaracion, 40)[0]
+    ruta = str(tmp_path / "kerning.pdf")
+    escribir_pdf_crudo(ruta, [
+        (_contenido_pagina(principal), {}),
+        (b"BT /F1 6 Tf 20 770 Td [(5)10(9. Subpartida arancelaria)] TJ 0 -9 Td (MARCADOR KERNING) Tj ET", {}),
+    ])
+    assert sondear_pdf(ruta)['paginas_declaracion'] == 2
+    assert "MARCADOR KERNING" in MotorDeclaraciones().extraer_texto_pdf(ruta)
+
+def test_texto_en_xobject_de_formulario(tmp_path):
+    ruta = str(tmp_path / "formulario.pdf")
+    escribir_pdf_crudo(ruta, [
+        (b"q /Fm0 Do Q", {'Fm0': ('Form', b"BT /F1 8 Tf 20 770 Td (MARCADOR FORMULARIO) Tj ET")}),
+        (b"q 612 0 0 792 0 0 cm /Im0 Do Q", {'Im0': ('Image', b"")}),
+    ])
+    sondeo = sondear_pdf(ruta)
+    assert sondeo['paginas_declaracion'] == 1 and sondeo['paginas_escaneadas'] == 1
+    assert not sondeo['sin_texto']
+    assert "MARCADOR FORMULARIO" in MotorDeclaraciones().extraer_texto_pdf(ruta)
+
+def test_imagenes_de_los_recursos_de_la_pagina(tmp_path):
+    from pdfminer.pdfdocument import PDFDocument
+    from pdfminer.pdfpage import PDFPage
+    from pdfminer.pdfparser import PDFParser
+    ruta = str(tmp_path / "xobjects.pdf")
+    escribir_pdf_crudo(ruta, [(b"q /Fm0 Do Q q /Im0 Do Q", {'Fm0': ('Form', b"BT (x) Tj ET"), 'Im0': ('Image', b"")})])
+    with open(ruta, 'rb') as f:
+        pagina = next(PDFPage.create_pages(PDFDocument(PDFParser(f))))
+        assert imagenes_pagina(pagina) == {b"Im0"}
+
+def test_sondeo_de_operacion_generada(tmp_path):
+    declaraciones = generar_declaraciones(3, semilla=1)
+    ruta = str(tmp_path / "consolidado.pdf")
+    paginas = [pagina for d in declaraciones for pagina in paginas_declaracion(d, 40)]
+    escribir_pdf(ruta, paginas)
+    sondeo = sondear_pdf(ruta)
+    assert sondeo['paginas'] == len(paginas)
+    assert sondeo['di_estimadas'] == len(declaraciones)
+    assert not sondeo['sin_texto'] and sondeo['error'] is None
@@ -0,0 +1,59 @@
+import threading
+
+import pytest
+
+import verificacion_dim
+from tuberia_dim import ejecutar_por_etapas
+
+def _hilos_de_lectura():
+    return [hilo for hilo in threading.enumerate() if hilo.name.startswith('lectura_pdf')]
+
+def test_etapas_conservan_el_orden():
+    resultados = list(ejecutar_por_etapas(range(20), (lambda x: x * 2, lambda x: x + 1)))
+    assert resultados == [x * 2 + 1 for x in range(20)]
+
+def test_error_de_etapa_llega_al_consumidor():
+    def fallar(x):
+        if x == 3:
+            raise ValueError("página ilegible")
+        return x
+
+    with pytest.raises(ValueError, match="página ilegible"):
+        list(ejecutar_por_etapas(range(10), (fallar, lambda x: x)))
+
+def test_tuberia_sin_cache_no_hashea_y_se_cierra_si_falla_el_calculo(monkeypatch):
+    def digest_prohibido(archivo):
+        raise AssertionError("sin caché no se calcula el hash")
+
+    monkeypatch.setattr(verificacion_dim, 'digest_archivo', digest_prohibido)
+    leidos = []
+
+    def lectura(archivo, digest):
+        assert digest is None
+        leidos.append(archivo)
+        return archivo.upper()
+
+    def calculo(archivo, leido):
+        if archivo == 'c.pdf':
+            raise RuntimeError("regex")
+        return [leido]
+
+    archivos = [f"{letra}.pdf" for letra in "abcdefghij"]
+    assert verificacion_dim._procesar_en_tuberia(lectura, calculo, archivos[:2]) == [['A.PDF'], ['B.PDF']]
+    with pytest.raises(RuntimeError):
+        verificacion_dim._procesar_en_tuberia(lectura, calculo, archivos)
+    # Las etapas se detuvieron sin leer el resto de los archivos
+    assert not _hilos_de_lectura()
+    assert len(leidos) < 2 + len(archivos)
+
+def test_progreso_ve_las_paginas_de_cada_pdf(operacion):
+    motor = verificacion_dim.MotorDeclaraciones()
+    paginas_vistas = []
+
+    def progreso(etapa, completados, total, cantidad, detalle):
+        paginas_vistas.append(motor.tiempos.contadores['paginas'])
+
+    motor.procesar_archivos(operacion['pdfs'], progreso=progreso)
+    assert len(paginas_vistas) == len(operacion['pdfs']) >= 2
+    # Las páginas del hilo lector se cuentan al extraerlas, no al final de la ejecución
+    assert 0 < paginas_vistas[0] <= paginas_vistas[-1] == motor.tiempos.contadores['paginas']
@@ -0,0 +1,231 @@
+import os
+import time
+import uuid
+import threading
+import traceback
+import multiprocessing
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from transporte_dim import cerrar_archivos
+
+ESTADO_EN_COLA = "en_cola"
+ESTADO_EJECUTANDO = "ejecutando"
+ESTADO_COMPLETADO = "completado"
+ESTADO_ERROR = "error"
+
+# Procesos de trabajo para todo el servidor: se deja un núcleo libre para Streamlit
+MAX_TRABAJOS_SIMULTANEOS = max(1, min(4, (os.cpu_count() or 2) - 1))
+MAX_EN_EJECUCION_POR_USUARIO = 1
+MAX_EN_COLA_POR_USUARIO = 3
+MAX_TRABAJOS_RETENIDOS = 50
+
+class LimiteTrabajosExcedido(Exception):
+    """El usuario ya tiene el máximo de verificaciones pendientes"""
+
+# =============================================================================
+# TRABAJO EN SEGUNDO PLANO
+# =============================================================================
+
+class Trabajo:
+    """Verificación enviada a segundo plano. El hilo trabajador actualiza el
+    progreso y el resultado; la interfaz solo lee instantáneas"""
+
+    def __init__(self, id_trabajo, gestor, usuario="", clave=None, descripcion=""):
+        self.id = id_trabajo
+        self.gestor = gestor
+        self.usuario = usuario
+        self.clave = clave
+        self.descripcion = descripcion
+        self.estado = ESTADO_EN_COLA
+        self.creado = time.time()
+        self.iniciado = None
+        self.finalizado = None
+        self.resultado = None
+        self.error = None
+        self.progreso = {'fraccion': 0.0, 'etapa': "En cola", 'detalle': "",
+                         'paginas': 0, 'dis_extraidas': 0, 'declaraciones_validadas': 0,
+                         'di_estimadas': 0, 'eta_segundos': None, 'pdfs_sin_texto': []}
+        self._lock = threading.Lock()
+
+    def actualizar(self, **cambios):
+        with self._lock:
+            self.progreso.update(cambios)
+
+    def ejecutar_en_proceso(self, funcion, *args, **kwargs):
+        """Atajo a GestorTrabajos.ejecutar_en_proceso para este trabajo"""
+        return self.gestor.ejecutar_en_proceso(self, funcion, *args, **kwargs)
+
+    def instantanea(self):
+        progreso_hijo = self.gestor.progreso_compartido(self.id) if self.estado == ESTADO_EJECUTANDO else {}
+        with self._lock:
+            return {
+                'id': self.id,
+                'descripcion': self.descripcion,
+                'estado': self.estado,
+                'progreso': dict(self.progreso, **progreso_hijo),
+                'error': self.error,
+                'duracion': (self.finalizado or time.time()) - (self.iniciado or self.creado)
+            }
+
+    @property
+    def terminado(self):
+        return self.estado in (ESTADO_COMPLETADO, ESTADO_ERROR)
+
+class _ProgresoCompartido:
+    """Callable picklable que publica el progreso de un proceso hijo en el dict del Manager"""
+
+    def __init__(self, compartido, id_trabajo):
+        self.compartido = compartido
+        self.id_trabajo = id_trabajo
+
+    def __call__(self, **cambios):
+        try:
+            self.compartido[self.id_trabajo] = dict(self.compartido.get(self.id_trabajo, {}), **cambios)
+        except (OSError, EOFError):
+            pass  # El progreso es informativo: no interrumpe el trabajo si el Manager se cerró
+
+def _ejecutar_en_hijo(funcion, progreso, args, kwargs):
+    try:
+        return funcion(*args, progreso=progreso, **kwargs)
+    finally:
+        # El proceso del pool sigue vivo: las copias de los archivos compartidos
+        # liberan su mapa y descriptor al terminar el trabajo, no al recolectarse
+        cerrar_archivos(*args, *kwargs.values())
+
+# =============================================================================
+# GESTOR DE TRABAJOS
+# =============================================================================
+
+class GestorTrabajos:
+    """Cola compartida por todas las sesiones con un pool de procesos acotado.
+
+    - Reparto justo: se atiende por turnos a los usuarios con trabajos en cola
+      (FIFO dentro de cada usuario), con un máximo en ejecución y en cola por usuario.
+    - Deduplicación: un envío con la misma `clave` que un trabajo en curso o
+      completado retorna el ID existente.
+    - Los trabajos terminados se conservan por ID; los más antiguos se descartan.
+    """
+
+    def __init__(self, max_workers=MAX_TRABAJOS_SIMULTANEOS, max_por_usuario=MAX_EN_EJECUCION_POR_USUARIO,
+                 max_en_cola_por_usuario=MAX_EN_COLA_POR_USUARIO, max_retenidos=MAX_TRABAJOS_RETENIDOS,
+                 inicializador=None):
+        self.max_workers = max_workers
+        self.max_por_usuario = max_por_usuario
+        self.max_en_cola_por_usuario = max_en_cola_por_usuario
+        self.max_retenidos = max_retenidos
+        # Se ejecuta una vez en cada proceso del pool al crearlo (p. ej. importar dependencias pesadas)
+        self.inicializador = inicializador
+        # Un hilo por trabajo en ejecución coordina; el cómputo va al pool de procesos
+        self._hilos = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="verificacion_dim")
+        self._procesos = None
+        self._manager = None
+        self._compartido = None
+        self._trabajos = OrderedDict()
+        self._colas = OrderedDict()
+        self._en_ejecucion = {}
+        self._por_clave = {}
+        self._lock = threading.Lock()
+
+    def enviar(self, funcion, *args, usuario="", clave=None, descripcion="", **kwargs):
+        """Encola `funcion(trabajo, *args, **kwargs)` y retorna el ID del trabajo"""
+        with self._lock:
+            existente = self._trabajos.get(self._por_clave.get(clave)) if clave is not None else None
+            if existente is not None and existente.estado != ESTADO_ERROR:
+                return existente.id
+            cola = self._colas.setdefault(usuario, deque())
+            if len(cola) >= self.max_en_cola_por_usuario:
+                raise LimiteTrabajosExcedido(
+                    f"Ya tiene {len(cola)} verificaciones en cola; espere a que terminen antes de enviar otra")
+            trabajo = Trabajo(uuid.uuid4().hex[:8], self, usuario, clave, descripcion)
+            self._trabajos[trabajo.id] = trabajo
+            if clave is not None:
+                self._por_clave[clave] = trabajo.id
+            cola.append((trabajo, funcion, args, kwargs))
+            self._purgar()
+            self._despachar()
+        return trabajo.id
+
+    def obtener(self, id_trabajo):
+        with self._lock:
+            return self._trabajos.get((id_trabajo or "").strip())
+
+    def ejecutar_en_proceso(self, trabajo, funcion, *args, **kwargs):
+        """Corre `funcion(*args, progreso=..., **kwargs)` en el pool de procesos y espera
+        su resultado; `funcion` y sus argumentos deben poder serializarse con pickle"""
+        procesos, compartido = self._obtener_pool()
+        progreso = _ProgresoCompartido(compartido, trabajo.id)
+        try:
+            return procesos.submit(_ejecutar_en_hijo, funcion, progreso, args, kwargs).result()
+        finally:
+            trabajo.actualizar(**self.progreso_compartido(trabajo.id))
+            compartido.pop(trabajo.id, None)
+
+    def progreso_compartido(self, id_trabajo):
+        if self._compartido is None:
+            return {}
+        try:
+            return dict(self._compartido.get(id_trabajo, {}))
+        except (OSError, EOFError):
+            return {}
+
+    def cerrar(self):
+        self._hilos.shutdown(wait=False, cancel_futures=True)
+        if self._procesos is not None:
+            self._procesos.shutdown(wait=False, cancel_futures=True)
+        if self._manager is not None:
+            self._manager.shutdown()
+
+    def _obtener_pool(self):
+        with self._lock:
+            if self._procesos is None:
+                # 'spawn' evita heredar hilos y sockets del servidor de Streamlit
+                contexto = multiprocessing.get_context("spawn")
+                self._manager = contexto.Manager()
+                self._compartido = self._manager.dict()
+                self._procesos = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=contexto,
+                                                    initializer=self.inicializador)
+            return self._procesos, self._compartido
+
+    def _despachar(self):
+        """Inicia trabajos mientras haya cupo, por turnos entre usuarios (requiere el lock)"""
+        while sum(self._en_ejecucion.values()) < self.max_workers:
+            usuario = next((u for u, cola in self._colas.items()
+                            if cola and self._en_ejecucion.get(u, 0) < self.max_por_usuario), None)
+            if usuario is None:
+                break
+            trabajo, funcion, args, kwargs = self._colas[usuario].popleft()
+            self._colas.move_to_end(usuario)
+            self._en_ejecucion[usuario] = self._en_ejecucion.get(usuario, 0) + 1
+            trabajo.estado = ESTADO_EJECUTANDO
+            trabajo.iniciado = time.time()
+            trabajo.actualizar(etapa="Iniciando")
+            self._hilos.submit(self._ejecutar, trabajo, funcion, args, kwargs)
+        self._anotar_posiciones()
+
+    def _anotar_posiciones(self):
+        pendientes = sorted((t for cola in self._colas.values() for t, *_ in cola), key=lambda t: t.creado)
+        for posicion, trabajo in enumerate(pendientes, 1):
+            trabajo.actualizar(etapa=f"En cola (posición {posicion})")
+
+    def _ejecutar(self, trabajo, funcion, args, kwargs):
+        try:
+            trabajo.resultado = funcion(trabajo, *args, **kwargs)
+            trabajo.actualizar(fraccion=1.0, etapa="Completado", detalle="")
+            trabajo.estado = ESTADO_COMPLETADO
+        except Exception as e:
+            trabajo.error = f"{e}\n{traceback.format_exc()}"
+            trabajo.actualizar(etapa="Error", detalle=str(e))
+            trabajo.estado = ESTADO_ERROR
+        finally:
+            trabajo.finalizado = time.time()
+            with self._lock:
+                self._en_ejecucion[trabajo.usuario] -= 1
+                self._despachar()
+
+    def _purgar(self):
+        terminados = [id_trabajo for id_trabajo, t in self._trabajos.items() if t.terminado]
+        for id_trabajo in terminados[:max(0, len(self._trabajos) - self.max_retenidos)]:
+            trabajo = self._trabajos.pop(id_trabajo)
+            if self._por_clave.get(trabajo.clave) == id_trabajo:
+                del self._por_clave[trabajo.clave]
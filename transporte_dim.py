@@ -0,0 +1,121 @@
+import io
+import os
+import mmap
+import tempfile
+import weakref
+
+# =============================================================================
+# TRANSPORTE SIN COPIAS DE ARCHIVOS CARGADOS A LOS PROCESOS DE TRABAJO
+# =============================================================================
+
+# En Linux /dev/shm vive en memoria: el archivo de intercambio no toca el disco
+DIRECTORIO_INTERCAMBIO = "/dev/shm" if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK) else tempfile.gettempdir()
+PREFIJO_INTERCAMBIO = "verificacion_dim_"
+
+def _eliminar(ruta):
+    try:
+        os.remove(ruta)
+    except OSError:
+        pass
+
+class ArchivoMapeado(io.RawIOBase):
+    """Archivo de solo lectura respaldado por un archivo de intercambio mapeado en memoria.
+
+    Se usa como el BytesIO de `archivo_en_memoria` (lectura, `seek`, `getbuffer`,
+    `name`), pero al enviarlo a otro proceso solo viaja su ruta: el proceso hijo mapea
+    las mismas páginas en lugar de recibir los bytes serializados. `getbuffer()` da
+    una vista del mapa, de modo que hashear el contenido tampoco lo copia.
+
+    `close()` (o el fin de un `with`) libera el mapa y el descriptor; el del objeto
+    original (el que creó el archivo) además lo elimina, lo que también ocurre cuando
+    deja de usarse. Las copias de otros procesos solo liberan lo suyo.
+    """
+
+    def __init__(self, ruta, nombre, propietario=False):
+        super().__init__()
+        self.ruta = ruta
+        self.name = nombre
+        self._archivo = None
+        self._mapa = None
+        self._posicion = 0
+        self._finalizador = None
+        if propietario:
+            self._finalizador = weakref.finalize(self, _eliminar, ruta)
+
+    def __reduce__(self):
+        return (ArchivoMapeado, (self.ruta, self.name))
+
+    def _mapear(self):
+        if self.closed:
+            raise ValueError("I/O operation on closed file")
+        if self._mapa is None:
+            self._archivo = open(self.ruta, 'rb')
+            # Un archivo vacío no se puede mapear
+            vacio = os.fstat(self._archivo.fileno()).st_size == 0
+            self._mapa = b"" if vacio else mmap.mmap(self._archivo.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mapa
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, posicion, desde=io.SEEK_SET):
+        tamano = len(self._mapear())
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._posicion, io.SEEK_END: tamano}[desde]
+        self._posicion = max(0, base + posicion)
+        return self._posicion
+
+    def tell(self):
+        return self._posicion
+
+    def read(self, cantidad=-1):
+        mapa = self._mapear()
+        fin = len(mapa) if cantidad is None or cantidad < 0 else min(len(mapa), self._posicion + cantidad)
+        datos = mapa[self._posicion:fin]
+        self._posicion = max(self._posicion, fin)
+        return datos
+
+    def readinto(self, destino):
+        datos = self.read(len(destino))
+        destino[:len(datos)] = datos
+        return len(datos)
+
+    def getbuffer(self):
+        """Vista de solo lectura del contenido completo (sin copiarlo)"""
+        return memoryview(self._mapear())
+
+    def close(self):
+        if self._mapa is not None:
+            try:
+                if isinstance(self._mapa, mmap.mmap): self._mapa.close()
+            except BufferError:
+                pass  # Una vista de getbuffer() sigue viva: el mapa se libera con ella
+            self._archivo.close()
+            self._mapa = self._archivo = None
+        super().close()
+        if self._finalizador is not None:
+            self._finalizador()
+
+def cerrar_archivos(*valores):
+    """Cierra los ArchivoMapeado de `valores`, sueltos o en listas y tuplas (p. ej. las
+    copias recibidas por una tarea de otro proceso, al terminarla)"""
+    for valor in valores:
+        if isinstance(valor, (list, tuple)):
+            cerrar_archivos(*valor)
+        elif isinstance(valor, ArchivoMapeado):
+            valor.close()
+
+def archivo_compartido(nombre, contenido):
+    """Equivalente de `archivo_en_memoria` para enviar a otros procesos: escribe los bytes
+    (p. ej. `UploadedFile.getbuffer()`) una sola vez en un archivo de intercambio"""
+    descriptor, ruta = tempfile.mkstemp(prefix=PREFIJO_INTERCAMBIO, suffix=os.path.splitext(nombre)[1],
+                                        dir=DIRECTORIO_INTERCAMBIO)
+    try:
+        with os.fdopen(descriptor, 'wb') as f:
+            f.write(contenido)
+    except OSError:
+        _eliminar(ruta)
+        raise
+    return ArchivoMapeado(ruta, nombre, propietario=True)
@@ -0,0 +1,176 @@
+import os
+import re
+import heapq
+
+from carga_perezosa_dim import ModuloPerezoso
+from registros_dim import ESQUEMA_DI
+from cache_dim import huella_patrones
+
+# Solo el analizador de bajo nivel de pdfminer: sin layout ni extract_text
+pdfminer_parser = ModuloPerezoso('pdfminer.pdfparser')
+pdfminer_documento = ModuloPerezoso('pdfminer.pdfdocument')
+pdfminer_pagina = ModuloPerezoso('pdfminer.pdfpage')
+pdfminer_tipos = ModuloPerezoso('pdfminer.pdftypes')
+
+# =============================================================================
+# PRE-ESCANEO RÁPIDO DE PDFs (TRIAJE ANTES DE LA EXTRACCIÓN)
+# =============================================================================
+
+# "Número de formulario" tal como queda en el flujo de contenido sin decodificar:
+# la ú en WinAnsi/Latin-1, como escape octal o sin tilde
+PATRON_SONDEO_NUMERO_DI = re.compile(rb"N(?:\xfa|\\372|u|U|\xda|\\332)mero\s*de\s*formulario", re.I)
+# Un bloque de texto con al menos un operador que dibuja cadenas
+PATRON_OPERADOR_TEXTO = re.compile(rb"\bBT\b[\s\S]*?(?:T[jJ]|['\"])")
+# Cadenas literales de los operadores de texto, p. ej. "(58. Tasa de cambio) Tj"
+PATRON_CADENA_LITERAL = re.compile(rb"\((?:\\.|[^\\)])*\)")
+# Arreglo de TJ con kerning entre sus cadenas, p. ej. "[(5)10(9. Subpartida)] TJ"
+PATRON_ARREGLO_TJ = re.compile(rb"\[((?:\((?:\\.|[^\\)])*\)|[^\]()])*)\]\s*TJ")
+PATRON_PALABRA_LEGIBLE = re.compile(rb"[A-Za-z]{4}")
+# Dibujo de un XObject (imagen o formulario, según sus recursos) por su nombre
+PATRON_OPERADOR_XOBJECT = re.compile(rb"/([^\s/\[\]()<>]+)\s+Do\b")
+# Imagen en línea
+PATRON_IMAGEN_EN_LINEA = re.compile(rb"\bBI\b")
+
+# Encabezado de alguna casilla que extrae el motor ("4. Número...", "58. Tasa...", "135. Fecha"),
+# con las casillas tomadas del esquema de la DI
+CASILLAS_DI = tuple(sorted({int(m.group(1)) for etiqueta, _ in ESQUEMA_DI if (m := re.match(r"(\d+)\.", etiqueta))}))
+PATRON_ENCABEZADO_CASILLA = re.compile(
+    rb"(?<![\d.,])(?:" + b"|".join(str(c).encode() for c in CASILLAS_DI) + rb")\s*\.\s*[A-Za-z\xc0-\xff]")
+
+# Cambia si cambia el criterio de clasificación (p. ej. una casilla nueva en el esquema)
+VERSION_CLASIFICADOR = huella_patrones(PATRON_OPERADOR_TEXTO, PATRON_CADENA_LITERAL, PATRON_ARREGLO_TJ,
+                                       PATRON_PALABRA_LEGIBLE, PATRON_OPERADOR_XOBJECT, PATRON_IMAGEN_EN_LINEA,
+                                       PATRON_ENCABEZADO_CASILLA)
+
+PAGINA_DECLARACION = 'declaracion'
+PAGINA_OTRA = 'otra'
+PAGINA_SIN_TEXTO = 'sin_texto'
+PAGINA_ESCANEADA = 'escaneada'
+
+# Modelo de costo (segundos en un núcleo): layout de pdfplumber por página con
+# texto más la división y las regex por DI. Solo sirve para ordenar y estimar
+SEGUNDOS_POR_PAGINA = 0.06
+SEGUNDOS_POR_PAGINA_SIN_TEXTO = 0.005
+SEGUNDOS_POR_PAGINA_OCR = 1.5
+SEGUNDOS_POR_DI = 0.01
+
+def _nombre(archivo):
+    return os.path.basename(archivo if isinstance(archivo, str) else getattr(archivo, 'name', 'Desconocido'))
+
+def contenido_pagina(pagina):
+    """Flujos de contenido decodificados de una página de pdfminer (`PDFPage`)"""
+    return b"".join(pdfminer_tipos.resolve1(flujo).get_data() for flujo in (pagina.contents or []))
+
+def imagenes_pagina(pagina):
+    """Nombres (bytes, sin "/") de los XObjects de imagen en los recursos de una página de
+    pdfminer; los demás XObjects (formularios) pueden dibujar texto"""
+    xobjects = pdfminer_tipos.resolve1((pagina.resources or {}).get('XObject')) or {}
+    return frozenset(nombre.encode('latin-1') for nombre, xobject in xobjects.items()
+                     if getattr(getattr(pdfminer_tipos.resolve1(xobject), 'attrs', {}).get('Subtype'), 'name', None) == 'Image')
+
+def texto_crudo(contenido):
+    """Cadenas literales de un flujo de contenido sin decodificar. Las de un mismo arreglo
+    TJ se unen sin separación: el kerning parte palabras y encabezados ("(5)10(9. Sub...)")"""
+    unido = PATRON_ARREGLO_TJ.sub(
+        lambda m: b"(" + b"".join(c[1:-1] for c in PATRON_CADENA_LITERAL.findall(m.group(1))) + b")", contenido)
+    return b" ".join(m.group(0)[1:-1] for m in PATRON_CADENA_LITERAL.finditer(unido))
+
+def clasificar_contenido(contenido, imagenes=None):
+    """Clase de una página por su flujo de contenido, sin análisis de layout.
+
+    `imagenes` son los nombres de los XObjects de imagen de la página (imagenes_pagina);
+    sin ellos, cualquier XObject se trata como un formulario que puede tener texto.
+    PAGINA_ESCANEADA si no dibuja texto pero sí imágenes (candidata a OCR),
+    PAGINA_SIN_TEXTO si no dibuja nada legible (en blanco), PAGINA_OTRA si todo su
+    texto se lee en crudo y no tiene ningún encabezado de casilla de la DI (facturas,
+    BL, hojas de continuación) y PAGINA_DECLARACION en otro caso. Una página omitida
+    pierde sus datos, así que en la duda (fuentes codificadas, texto que puede estar
+    dentro de un XObject de formulario) se clasifica como declaración y se extrae.
+    """
+    dibujados = PATRON_OPERADOR_XOBJECT.findall(contenido)
+    if any(imagenes is None or nombre not in imagenes for nombre in dibujados):
+        return PAGINA_DECLARACION
+    if not PATRON_OPERADOR_TEXTO.search(contenido):
+        return PAGINA_ESCANEADA if dibujados or PATRON_IMAGEN_EN_LINEA.search(contenido) else PAGINA_SIN_TEXTO
+    crudo = texto_crudo(contenido)
+    if PATRON_PALABRA_LEGIBLE.search(crudo) and not PATRON_ENCABEZADO_CASILLA.search(crudo):
+        return PAGINA_OTRA
+    return PAGINA_DECLARACION
+
+def sondear_pdf(archivo):
+    """Páginas, páginas con capa de texto y ocurrencias de "Número de formulario" de un PDF.
+
+    Lee solo la estructura y los flujos de contenido (sin análisis de layout), por lo
+    que cuesta una fracción de la extracción completa. Si las fuentes no permiten ver
+    el texto en crudo, las DI se estiman como una por página con texto.
+    """
+    sondeo = {'archivo': _nombre(archivo), 'paginas': 0, 'paginas_con_texto': 0,
+              'paginas_declaracion': 0, 'paginas_escaneadas': 0, 'ocurrencias_formulario': 0, 'di_estimadas': 0, 'sin_texto': False,
+              'costo': 0.0, 'error': None}
+    try:
+        propio = isinstance(archivo, str)
+        flujo = open(archivo, 'rb') if propio else archivo
+        try:
+            if not propio: flujo.seek(0)
+            documento = pdfminer_documento.PDFDocument(pdfminer_parser.PDFParser(flujo))
+            for pagina in pdfminer_pagina.PDFPage.create_pages(documento):
+                contenido = contenido_pagina(pagina)
+                clase = clasificar_contenido(contenido, imagenes_pagina(pagina))
+                sondeo['paginas'] += 1
+                if clase == PAGINA_ESCANEADA:
+                    sondeo['paginas_escaneadas'] += 1
+                elif clase != PAGINA_SIN_TEXTO:
+                    sondeo['paginas_con_texto'] += 1
+                    sondeo['ocurrencias_formulario'] += len(PATRON_SONDEO_NUMERO_DI.findall(contenido))
+                if clase == PAGINA_DECLARACION:
+                    sondeo['paginas_declaracion'] += 1
+        finally:
+            if propio: flujo.close()
+            else: flujo.seek(0)
+    except Exception as e:
+        sondeo['error'] = f"{type(e).__name__}: {e}"
+        return sondeo
+
+    sondeo['sin_texto'] = sondeo['paginas'] > 0 and sondeo['paginas_con_texto'] == 0
+    # Sin ninguna página de declaración el PDF se extrae completo (ver paginas_a_extraer)
+    extraidas = sondeo['paginas_declaracion'] or sondeo['paginas_con_texto']
+    sondeo['di_estimadas'] = sondeo['ocurrencias_formulario'] or extraidas or sondeo['paginas_escaneadas']
+    sondeo['costo'] = (SEGUNDOS_POR_PAGINA * extraidas
+                       + SEGUNDOS_POR_PAGINA_OCR * sondeo['paginas_escaneadas']
+                       + SEGUNDOS_POR_PAGINA_SIN_TEXTO * (sondeo['paginas'] - extraidas - sondeo['paginas_escaneadas'])
+                       + SEGUNDOS_POR_DI * sondeo['di_estimadas'])
+    return sondeo
+
+def orden_por_costo(sondeos):
+    """Índices de los sondeos del más costoso al más barato (reparto LPT en el pool)"""
+    return sorted(range(len(sondeos)), key=lambda i: -sondeos[i]['costo'])
+
+def estimar_eta(costos, max_workers=1):
+    """Segundos estimados repartiendo los costos, de mayor a menor, al proceso menos cargado"""
+    cargas = [0.0] * max(1, max_workers or 1)
+    for costo in sorted(costos, reverse=True):
+        heapq.heapreplace(cargas, cargas[0] + costo)
+    return max(cargas)
+
+def triaje_pdfs(archivos, max_workers=1):
+    """Resumen del pre-escaneo de un conjunto de PDFs: totales, ETA, orden por costo
+    y los PDFs sin capa de texto (escaneados), que solo producen DI con OCR"""
+    sondeos = [sondear_pdf(archivo) for archivo in archivos]
+    return {
+        'pdfs': sondeos,
+        'paginas': sum(s['paginas'] for s in sondeos),
+        'di_estimadas': sum(s['di_estimadas'] for s in sondeos),
+        'eta_segundos': round(estimar_eta([s['costo'] for s in sondeos], max_workers), 2),
+        'orden_costo': orden_por_costo(sondeos),
+        'sin_texto': [s['archivo'] for s in sondeos if s['sin_texto']],
+        'con_error': [s['archivo'] for s in sondeos if s['error']]
+    }
+
+def paginas_a_extraer(clases, con_ocr=False):
+    """Máscara de páginas cuyo texto se extrae: solo las de declaración. Un PDF sin
+    ninguna (p. ej. una factura suelta) se extrae completo, como antes del triaje.
+    Las páginas escaneadas se omiten solo si van a OCR (`con_ocr`); sin OCR se
+    extraen igual, por si su texto no se vio en el flujo de contenido"""
+    if PAGINA_DECLARACION not in clases:
+        return [not (con_ocr and clase == PAGINA_ESCANEADA) for clase in clases]
+    return [clase == PAGINA_DECLARACION or (clase == PAGINA_ESCANEADA and not con_ocr) for clase in clases]
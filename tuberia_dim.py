@@ -0,0 +1,84 @@
+import queue
+import threading
+
+# =============================================================================
+# TUBERÍA POR ETAPAS CON COLAS ACOTADAS
+# =============================================================================
+
+# Elementos que cada etapa puede adelantar a la siguiente: acota la memoria retenida
+# (texto de PDFs ya leídos) cuando una etapa posterior es más lenta
+CAPACIDAD_COLA = 2
+# Cada cuánto una etapa bloqueada revisa si la tubería se detuvo
+INTERVALO_ESPERA = 0.1
+
+_FIN = object()
+
+class _Fallo:
+    """Excepción de una etapa, llevada por las colas hasta el consumidor"""
+    __slots__ = ('error',)
+
+    def __init__(self, error):
+        self.error = error
+
+def ejecutar_por_etapas(elementos, etapas, capacidad=CAPACIDAD_COLA, nombre='etapa'):
+    """Generador que pasa cada elemento por `etapas` (funciones de un argumento) y
+    entrega los resultados de la última en el orden de `elementos`.
+
+    Cada etapa corre en su propio hilo y se conecta con la siguiente por una cola de
+    `capacidad` elementos, así la lectura del archivo siguiente avanza mientras el
+    consumidor procesa el actual. Lo que haga el consumidor con cada resultado corre en
+    su propio hilo (p. ej. las regex vigiladas por SIGALRM en el hilo principal). Una
+    excepción en una etapa se relanza en el consumidor; al cerrar el generador las
+    etapas se detienen tras terminar el elemento en curso.
+    """
+    detener = threading.Event()
+
+    def poner(cola, valor):
+        while not detener.is_set():
+            try:
+                cola.put(valor, timeout=INTERVALO_ESPERA)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def de_cola(cola):
+        while not detener.is_set():
+            try:
+                valor = cola.get(timeout=INTERVALO_ESPERA)
+            except queue.Empty:
+                continue
+            if valor is _FIN:
+                return
+            yield valor
+
+    def trabajar(funcion, fuente, salida):
+        try:
+            for valor in fuente:
+                if not isinstance(valor, _Fallo):
+                    try:
+                        valor = funcion(valor)
+                    except BaseException as e:
+                        valor = _Fallo(e)
+                if not poner(salida, valor) or isinstance(valor, _Fallo):
+                    return
+        except BaseException as e:  # El iterable de entrada falló
+            poner(salida, _Fallo(e))
+        finally:
+            poner(salida, _FIN)
+
+    colas = [queue.Queue(maxsize=capacidad) for _ in etapas]
+    fuentes = [iter(elementos)] + [de_cola(cola) for cola in colas[:-1]]
+    hilos = [threading.Thread(target=trabajar, args=(funcion, fuente, cola), daemon=True, name=f"{nombre}_{i}")
+             for i, (funcion, fuente, cola) in enumerate(zip(etapas, fuentes, colas))]
+    for hilo in hilos:
+        hilo.start()
+    try:
+        for valor in de_cola(colas[-1]):
+            if isinstance(valor, _Fallo):
+                raise valor.error
+            yield valor
+    finally:
+        detener.set()
+        for hilo in hilos:
+            hilo.join()
@@ -1,14 +1,51 @@
-import pandas as pd
-import pdfplumber
+from __future__ import annotations
+
 import re
 import os
+import io
 import glob
 from datetime import datetime
-import numpy as np
-from collections import OrderedDict
-from openpyxl import load_workbook
+from types import MappingProxyType
+from collections import Counter, defaultdict
+from dataclasses import replace
 import warnings
 import unicodedata
+import time
+import hashlib
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+from carga_perezosa_dim import ModuloPerezoso, precargar
+from cache_dim import huella_patrones, digest_archivo, directorio_aprendizaje
+from instrumentacion_dim import RegistroTiempos, combinar_patrones
+from tuberia_dim import ejecutar_por_etapas
+from triaje_dim import (sondear_pdf, orden_por_costo, contenido_pagina, clasificar_contenido, imagenes_pagina,
+                        paginas_a_extraer, VERSION_CLASIFICADOR, PAGINA_ESCANEADA)
+from ocr_dim import ocr_disponible, huella_imagen_pagina, ocr_paginas
+from estadisticas_patrones_dim import EstadisticasPatrones, firma_formato, huellas_por_campo
+from plantillas_excel_dim import (CachePlantillas, PLANTILLAS_PROCESO, TIPO_SUBPARTIDAS, TIPO_FORMULARIO,
+                                  FILAS_HUELLA, huella_libro, huella_archivo_excel)
+from registros_dim import RegistroDI, ESQUEMA_DI, como_registros, registros_a_dataframe
+from exportacion_dim import escribir_excel, COLUMNA_VEREDICTO_COMPARACION, COLUMNA_VEREDICTO_ANEXOS
+from regex_seguro_dim import buscar, buscar_todos, TiempoRegexExcedido, PRESUPUESTO_DIVISION_DI
+
+NOMBRE_REPORTE_COMPARACION = "Resultado Validación Subpartida vs DIM.xlsx"
+NOMBRE_REPORTE_ANEXOS = "Resultado Validacion Anexos FMM vs DIM.xlsx"
+
+# Dependencias pesadas: se importan en la primera etapa que las usa (ver precalentar)
+pd = ModuloPerezoso('pandas')
+np = ModuloPerezoso('numpy')
+pdfplumber = ModuloPerezoso('pdfplumber')
+openpyxl = ModuloPerezoso('openpyxl')
+pdfminer_tipos = ModuloPerezoso('pdfminer.pdftypes')
+
+# Los formularios FMM traen estilos que openpyxl no reconoce; el filtro se instala una sola vez
+warnings.filterwarnings('ignore', category=UserWarning, module='openpyxl')
+
+FLAGS_CAMPOS = re.IGNORECASE | re.MULTILINE | re.DOTALL
+
+def _compilar_patrones(tabla, flags=FLAGS_CAMPOS):
+    """Tabla campo -> tupla de patrones compilados, de solo lectura y compartida por todas las instancias"""
+    return MappingProxyType({campo: tuple(re.compile(p, flags) for p in patrones) for campo, patrones in tabla.items()})
 
 # =============================================================================
 # CLASE PARA CORRECCIÓN DE NOMBRES
@@ -45,190 +82,209 @@ class CorrectorNombres:
 # CLASE 1: EXTRACCIÓN DE PDFs (DIAN)
 # =============================================================================
 
+# Campos y patrones de la DI (DIAN): se compilan una vez al importar el módulo
+CAMPOS_DIAN = MappingProxyType({
+    "4.": "4. Número DI",
+    "55.": "55. Cod. de Bandera", 
+    "58.": "58. Tasa de Cambio",
+    "59.": "59. Subpartida Arancelaria",
+    "62.": "62. Cod. Modalidad",
+    "66.": "66. Cod. Pais de Origen",
+    "70.": "70. Cod. Pais Compra",
+    "71.": "71. Peso Bruto kgs.",
+    "72.": "72. Peso Neto kgs.",
+    "74.": "74. Número de Bultos",
+    "77.": "77. Cantidad dcms.",
+    "78.": "78. Valor FOB USD",
+    "79.": "79. Valor Fletes USD",
+    "80.": "80. Valor Seguros USD",
+    "81.": "81. Valor Otros Gastos USD"
+})
+
+PATRONES_DIAN = _compilar_patrones({
+    "55. Cod. de Bandera": [r"55\s*\.\s*?C[oó]digo\s*de.*?\n(?:\s*\d+\s+){2}(\d+)"],
+    "58. Tasa de Cambio": [r"58\s*\.?\s*Tasa\s*de\s*cambio\b(?:\s*\$?\s*cvs\.?)?[\s\S]{0,200}?([0-9]{1,3}(?:[.,][0-9]{3})*(?:[.,][0-9]{2}))"],
+    "59. Subpartida Arancelaria": [
+        r"59\s*\.?\s*Subpartida\s*arancelaria\s*\d+\s*\.\s*Cod\s*\.\s*\d+\s*\.\s*Cod\s*\.\s*\d+\s*\.\s*Cod\s*\.\s*Modalidad\s*\d+\s*\.\s*No\s*\.\s*cuotas\s*\d+\s*\.\s*Valor\s*cuota\s*USD\s*\d+\s*\.\s*Periodicidad\s*del\s*\d+\s*\.\s*Cod\s*\.\s*país\s*\d+\s*\.\s*Cod\s*\.\s*Acuerdo\s*([\d]{10})",
+        r"59\s*\.?\s*Subpartida\s*arancelaria[\s\S]{0,150}?\b(\d{10})\b"
+    ],
+    "62. Cod. Modalidad": [r"62\s*\.?\s*Cod\s*\.\s*Modalidad\s*(?:(?:.*?\n)|(?:(?:[:;.\-]|\s)+))[^\n]*?\b([A-Z]\d{3})\b"],
+    "66. Cod. Pais de Origen": [r"66\s*\.?\s*Cod\s*\.\s*país[\s\S]*?\n.*?\n.*?\b(\d{3})\b"],
+    "70. Cod. Pais Compra": [r"70\s*\.?\s*Cod\s*\.\s*país[\s\S]*?\n.*?\n.*?\b(\d{3})\b"],
+    "71. Peso Bruto kgs.": [r"71\s*\.?\s*Peso\s*bruto\s*kgs\s*\.?\s*dcms\s*\.?[\s\S]{0,500}?(\d{1,3}(?:\.\d{3})*\.\d{2})"],
+    "72. Peso Neto kgs.": [r"72\s*\.?\s*Peso\s*neto\s*kgs\s*\.?\s*dcms\s*\.?[\s\S]{0,500}?\d{1,3}(?:\.\d{3})*\.\d{2}[\s\S]{0,100}?(\d{1,3}(?:\.\d{3})*\.\d{2})"],
+    "74. Número de Bultos": [
+       r"74\s*\.\s*?\s*No\s*\.\s*bultos[\s\S]*?embalaje\s+(\d+[\.,]?\d*)",
+       r"(?is)(?:embalaje[\s\S]{0,200}?\b[A-Z]{2,3}\b[\s\S]{0,50}?(\d{1,3}(?:\.\d{3})*)|embalaje[\s\S]{0,80}?(\d{1,3}(?:\.\d{3})*))" 
+    ],
+    "77. Cantidad dcms.": [r"77\s*\.?\s*Cantidad\s*dcms\.[\s\S]*?comercial\s+(\d{1,4}(?:\.\d{3})*\.\d{2})"],
+    "78. Valor FOB USD": [r"78\s*\.?\s*Valor\s*FOB\s*USD[\s\S]*?\n\s*([\d.,]+)"],
+    "79. Valor Fletes USD": [r"79\s*\.?\s*Valor\s*fletes\s*USD[\s\S]*?\n\s*[\d.,]+\s+([\d.,]+)"],
+    "80. Valor Seguros USD": [r"80\s*\.?\s*Valor\s*Seguros\s*USD[\s\S]*?\n\s*([\d.,]+)"],
+    "81. Valor Otros Gastos USD": [r"81\s*\.?\s*Valor\s*Otros\s*Gastos\s*USD[\s\S]*?\n\s*[\d.,]+\s+([\d.,]+)"]
+})
+
 class ExtractorDIANSimplificado:
     def __init__(self):
-        self.CAMPOS_DI = {
-            "4.": "4. Número DI",
-            "55.": "55. Cod. de Bandera", 
-            "58.": "58. Tasa de Cambio",
-            "59.": "59. Subpartida Arancelaria",
-            "62.": "62. Cod. Modalidad",
-            "66.": "66. Cod. Pais de Origen",
-            "70.": "70. Cod. Pais Compra",
-            "71.": "71. Peso Bruto kgs.",
-            "72.": "72. Peso Neto kgs.",
-            "74.": "74. Número de Bultos",
-            "77.": "77. Cantidad dcms.",
-            "78.": "78. Valor FOB USD",
-            "79.": "79. Valor Fletes USD",
-            "80.": "80. Valor Seguros USD",
-            "81.": "81. Valor Otros Gastos USD"
-        }
-
-        self.patrones = {
-            "4. Número DI": [
-                r"(?:^|\n)\s*4\s*\.?\s*N[úu]mero\s*de\s*formulario[\s\S]*?(\d{15,16})",
-                r"(?:^|\n)\s*4\s*\.?\s*N[úu]mero\s*de\s*formulario[\s\S]*?([\d\-]{15})",
-                r"4\s*\.?\s*N[úu]mero\s*de\s*formulario\s*[:\-]?\s*(\d{17}(?:-\d)?)",
-                r"4\s*\.?\s*N[úu]mero\s*de\s*formulario[\s\S]*?(\d{15,17})(?:-\d)?"
-            ],
-            "55. Cod. de Bandera": [r"55\s*\.\s*?C[oó]digo\s*de.*?\n(?:\s*\d+\s+){2}(\d+)"],
-            "58. Tasa de Cambio": [r"58\s*\.?\s*Tasa\s*de\s*cambio\b(?:\s*\$?\s*cvs\.?)?[\s\S]{0,200}?([0-9]{1,3}(?:[.,][0-9]{3})*(?:[.,][0-9]{2}))"],
-            "59. Subpartida Arancelaria": [
-                r"59\s*\.?\s*Subpartida\s*arancelaria\s*\d+\s*\.\s*Cod\s*\.\s*\d+\s*\.\s*Cod\s*\.\s*\d+\s*\.\s*Cod\s*\.\s*Modalidad\s*\d+\s*\.\s*No\s*\.\s*cuotas\s*\d+\s*\.\s*Valor\s*cuota\s*USD\s*\d+\s*\.\s*Periodicidad\s*del\s*\d+\s*\.\s*Cod\s*\.\s*país\s*\d+\s*\.\s*Cod\s*\.\s*Acuerdo\s*([\d]{10})",
-                r"59\s*\.?\s*Subpartida\s*arancelaria[\s\S]{0,150}?\b(\d{10})\b"
-            ],
-            "62. Cod. Modalidad": [r"62\s*\.?\s*Cod\s*\.\s*Modalidad\s*(?:(?:.*?\n)|(?:(?:[:;.\-]|\s)+))[^\n]*?\b([A-Z]\d{3})\b"],
-            "66. Cod. Pais de Origen": [r"66\s*\.?\s*Cod\s*\.\s*país[\s\S]*?\n.*?\n.*?\b(\d{3})\b"],
-            "70. Cod. Pais Compra": [r"70\s*\.?\s*Cod\s*\.\s*país[\s\S]*?\n.*?\n.*?\b(\d{3})\b"],
-            "71. Peso Bruto kgs.": [r"71\s*\.?\s*Peso\s*bruto\s*kgs\s*\.?\s*dcms\s*\.?[\s\S]{0,500}?(\d{1,3}(?:\.\d{3})*\.\d{2})"],
-            "72. Peso Neto kgs.": [r"72\s*\.?\s*Peso\s*neto\s*kgs\s*\.?\s*dcms\s*\.?[\s\S]{0,500}?\d{1,3}(?:\.\d{3})*\.\d{2}[\s\S]{0,100}?(\d{1,3}(?:\.\d{3})*\.\d{2})"],
-            "74. Número de Bultos": [
-               r"74\s*\.\s*?\s*No\s*\.\s*bultos[\s\S]*?embalaje\s+(\d+[\.,]?\d*)",
-               r"(?is)(?:embalaje[\s\S]{0,200}?\b[A-Z]{2,3}\b[\s\S]{0,50}?(\d{1,3}(?:\.\d{3})*)|embalaje[\s\S]{0,80}?(\d{1,3}(?:\.\d{3})*))" 
-            ],
-            "77. Cantidad dcms.": [r"77\s*\.?\s*Cantidad\s*dcms\.[\s\S]*?comercial\s+(\d{1,4}(?:\.\d{3})*\.\d{2})"],
-            "78. Valor FOB USD": [r"78\s*\.?\s*Valor\s*FOB\s*USD[\s\S]*?\n\s*([\d.,]+)"],
-            "79. Valor Fletes USD": [r"79\s*\.?\s*Valor\s*fletes\s*USD[\s\S]*?\n\s*[\d.,]+\s+([\d.,]+)"],
-            "80. Valor Seguros USD": [r"80\s*\.?\s*Valor\s*Seguros\s*USD[\s\S]*?\n\s*([\d.,]+)"],
-            "81. Valor Otros Gastos USD": [r"81\s*\.?\s*Valor\s*Otros\s*Gastos\s*USD[\s\S]*?\n\s*[\d.,]+\s+([\d.,]+)"]
-        }
-
-    def normalizar_numero_entero(self, numero_str, campo_nombre=""):
-        if not isinstance(numero_str, str) or numero_str == "NO ENCONTRADO":
-            return np.nan
-
-        if '62. Cod. Modalidad' in campo_nombre:
-            return numero_str.strip()
-
-        if '74. Número de Bultos' in campo_nombre:
-            # 1. Eliminar los puntos completamente (asumimos que son miles: 7.333 -> 7333)
-            cleaned_str = numero_str.replace('.', '')
-            # 2. Reemplazar comas por puntos (por si hubiera decimales reales: 7,5 -> 7.5)
-            cleaned_str = cleaned_str.replace(',', '.')
-            # 3. Limpiar cualquier basura restante
-            cleaned_str = re.sub(r'[^\d.]', '', cleaned_str)
-            try:
-                valor = float(cleaned_str)
-                return valor
-            except ValueError:
-                return np.nan          
-
-        if any(codigo in campo_nombre for codigo in ['55. Cod. de Bandera', '66. Cod. Pais de Origen', '70. Cod. Pais Compra']):
-            if numero_str.isdigit():
-                return numero_str
-            if ' - ' in numero_str:
-                codigo = numero_str.split(' - ')[0].strip()
-                if codigo.isdigit():
-                    return codigo
-            return numero_str
-
-        cleaned_str = re.sub(r'(?<=\d)\.(?=\d{3})', '', numero_str)
-        cleaned_str = re.sub(r'(?<=\d),(?=\d{3})', '', cleaned_str)
-        if ',' in cleaned_str and '.' not in cleaned_str:
-            cleaned_str = cleaned_str.replace(',', '.')
-
-        try:
-            valor = float(cleaned_str)
-            if valor.is_integer():
-                return int(valor)
-            return valor
-        except ValueError:
-            return np.nan
-
-    def extraer_texto_pdf(self, pdf_path):
-        texto_completo = ""
-        try:
-            with pdfplumber.open(pdf_path) as pdf:
-                for pagina in pdf.pages:
-                    texto = pagina.extract_text(x_tolerance=3, y_tolerance=3)
-                    if texto:
-                        texto_completo += texto + "\n\n"
-            return texto_completo
-        except Exception:
-            return ""
-
-    def extraer_campo(self, texto, patrones, campo_nombre=""):
-        for patron in patrones:
-            try:
-                match = re.search(patron, texto, re.IGNORECASE | re.MULTILINE | re.DOTALL)
-                if match:
-                    if match.groups():
-                        for group_val in match.groups():
-                            if group_val and group_val.strip():
-                                return group_val.strip()
-                    else:
-                        return match.group(0).strip()
-            except Exception:
-                pass
-        return "NO ENCONTRADO"
-
-    def extraer_multiples_di_de_texto(self, texto_completo, pdf_filename):
-        di_bloques = []
-        form_number_matches = []
-        for patron in self.patrones["4. Número DI"]:
-            matches = list(re.finditer(patron, texto_completo, re.IGNORECASE | re.MULTILINE | re.DOTALL))
-            form_number_matches.extend(matches)
-        
-        form_number_matches.sort(key=lambda m: m.start())
-        
-        if not form_number_matches:
-            form_num = self.extraer_campo(texto_completo, self.patrones["4. Número DI"], "4. Número DI")
-            if form_num != "NO ENCONTRADO":
-                di_bloques.append({'form_number': form_num, 'text': texto_completo})
-            else:
-                di_bloques.append({'form_number': "Desconocido_" + pdf_filename, 'text': texto_completo})
-            return di_bloques
-
-        unique_matches = []
-        last_end = -1
-        for match in form_number_matches:
-            if match.start() >= last_end:
-                unique_matches.append(match)
-                last_end = match.end()
-        
-        for i, match in enumerate(unique_matches):
-            form_number = match.group(1).strip()
-            start_index = match.start()
-            end_index = unique_matches[i+1].start() if i + 1 < len(unique_matches) else len(texto_completo)
-            di_text_block = texto_completo[start_index:end_index]
-            di_bloques.append({'form_number': form_number, 'text': di_text_block})
-        return di_bloques
-
-    def procesar_di_individual(self, di_text_block, form_number, pdf_filename):
-        resultados = OrderedDict()
-        resultados['Nombre Archivo PDF'] = pdf_filename
-        resultados["4. Número DI"] = form_number
-
-        for _, nombre_campo in self.CAMPOS_DI.items():
-            if nombre_campo == "4. Número DI":
-                continue 
-            if nombre_campo in self.patrones:
-                valor = self.extraer_campo(di_text_block, self.patrones[nombre_campo], nombre_campo)
-                resultados[nombre_campo] = self.normalizar_numero_entero(valor, nombre_campo)
-            else:
-                resultados[nombre_campo] = "PATRON NO CONFIGURADO"
-        return resultados
-
-    def procesar_multiples_dis(self, folder_path):
+        self.tiempos = RegistroTiempos()
+        self.CAMPOS_DI = CAMPOS_DIAN
+
+    def procesar_pdf(self, pdf_file_path):
+        """Registros de todas las DI contenidas en un PDF (ver MotorDeclaraciones)"""
+        return MotorDeclaraciones(self.tiempos).procesar_pdf(pdf_file_path)
+
+    def procesar_archivos_pdf(self, pdf_files, max_workers=1, cache=None, progreso=None, registros=None):
+        """DataFrame con las casillas de la comparación, una fila por DI.
+
+        Sin `registros` extrae los PDFs con MotorDeclaraciones (opcionalmente en paralelo
+        y con caché por contenido); `progreso(etapa, completados, total, cantidad, detalle)`
+        se invoca al terminar cada PDF con la cantidad de DI extraídas y el nombre del archivo.
+        """
+        if registros is None:
+            registros = MotorDeclaraciones(self.tiempos).procesar_archivos(pdf_files, max_workers, cache, progreso)
+        if not registros: return None
+        df = registros_a_dataframe(registros, ("Nombre Archivo PDF",) + tuple(self.CAMPOS_DI.values()))
+        df.attrs['tiempos'] = self.tiempos.como_dict()
+        df.attrs['regex_excedidos'] = list(self.tiempos.excesos_regex)
+        return df
+
+    def procesar_multiples_dis(self, folder_path, max_workers=1, cache=None, registros=None):
         if not os.path.isdir(folder_path): return None
-        all_results = []
         pdf_files = glob.glob(os.path.join(folder_path, "*.pdf"))
         if not pdf_files: return None
+        return self.procesar_archivos_pdf(pdf_files, max_workers, cache, registros=registros)
 
-        for pdf_file_path in pdf_files:
-            pdf_filename = os.path.basename(pdf_file_path)
-            texto_completo_pdf = self.extraer_texto_pdf(pdf_file_path)
-            if not texto_completo_pdf: continue
+def archivo_en_memoria(nombre, contenido):
+    """Envuelve bytes (p. ej. `UploadedFile.getbuffer()`) en un BytesIO con nombre,
+    aceptado por todas las clases en lugar de una ruta"""
+    buffer = io.BytesIO(bytes(contenido))
+    buffer.name = nombre
+    return buffer
 
-            di_bloques = self.extraer_multiples_di_de_texto(texto_completo_pdf, pdf_filename)
-            if not di_bloques: continue
+def _nombre_archivo(archivo):
+    return os.path.basename(archivo) if isinstance(archivo, str) else os.path.basename(getattr(archivo, 'name', 'Desconocido'))
 
-            for bloque in di_bloques:
-                resultados_di = self.procesar_di_individual(bloque['text'], bloque['form_number'], pdf_filename)
-                if resultados_di:
-                    all_results.append(resultados_di)
-        return pd.DataFrame(all_results) if all_results else None
+def _tamano_archivo(archivo):
+    try:
+        if isinstance(archivo, str): return os.path.getsize(archivo)
+        return archivo.getbuffer().nbytes if hasattr(archivo, 'getbuffer') else 0
+    except (OSError, ValueError):
+        return 0
+
+def _rebobinar(archivo):
+    """Los buffers en memoria se leen varias veces (DIM, anexos): siempre desde el inicio"""
+    if hasattr(archivo, 'seek'): archivo.seek(0)
+    return archivo
+
+def _reportar_exceso_regex(tiempos, archivo, numero_di, error):
+    """Registra y avisa de un DI (o archivo completo si no hay número) descartado por tiempo de regex"""
+    tiempos.registrar_exceso_regex(archivo, numero_di, error.campo, error.segundos)
+    destino = f"DI {numero_di}" if numero_di else "archivo completo"
+    print(f"⏱️ Regex de '{error.campo}' superó {error.segundos:.2f} s en {archivo} ({destino}) - se omite")
+
+def _procesar_pdf_declaraciones(pdf_path, paginas=None, estadisticas=None):
+    # El pool ya reparte archivos: el OCR de cada uno va en el mismo proceso
+    motor = MotorDeclaraciones(paginas=paginas, workers_ocr=1, estadisticas=estadisticas)
+    return motor.procesar_pdf(pdf_path), motor.tiempos.como_dict()
+
+def _aviso_por_archivo(progreso, etapa):
+    """Adapta un callback `progreso(etapa, completados, total, cantidad, detalle)` al aviso por archivo"""
+    if progreso is None:
+        return None
+    return lambda completados, total, archivo, registros: progreso(
+        etapa, completados, total, len(registros), _nombre_archivo(archivo))
+
+def _procesar_por_archivo(metodo, funcion_proceso, archivos, max_workers=1, cache=None, tipo='', version='', tiempos=None, aviso=None, etapas=None):
+    """Aplica `metodo` a cada archivo conservando el orden.
+
+    Los archivos ya presentes en la caché no se vuelven a procesar; el resto se
+    reparte en un pool de procesos con `funcion_proceso` (que además retorna los
+    tiempos del hijo) cuando `max_workers` es mayor que 1, enviando primero los más
+    costosos según el pre-escaneo (triaje_dim). Sin pool y con `etapas` = (lectura,
+    cálculo) se procesa en tubería (ver _procesar_en_tuberia). `aviso(completados,
+    total, archivo, registros)` se llama cada vez que termina un archivo.
+    """
+    if etapas is not None and not (max_workers and max_workers > 1 and len(archivos) > 1):
+        return _procesar_en_tuberia(*etapas, archivos, cache, tipo, version, tiempos, aviso)
+    resultados = [None] * len(archivos)
+    digests = [None] * len(archivos)
+    pendientes = []
+    completados = 0
+    for i, archivo in enumerate(archivos):
+        if cache is not None:
+            digests[i] = digest_archivo(archivo)
+            registros = cache.obtener(digests[i], tipo, version)
+            if registros is not None:
+                resultados[i] = registros
+                completados += 1
+                if aviso: aviso(completados, len(archivos), archivo, registros)
+                continue
+        pendientes.append(i)
+
+    calculados = {}
+    con_exceso_regex = set()
+    if max_workers and max_workers > 1 and len(pendientes) > 1:
+        if len(pendientes) > max_workers:
+            # Los PDFs más costosos (según el pre-escaneo) primero: ninguno largo queda para el final
+            sondeos = [sondear_pdf(archivos[i]) for i in pendientes]
+            pendientes = [pendientes[j] for j in orden_por_costo(sondeos)]
+        with ProcessPoolExecutor(max_workers=min(max_workers, len(pendientes)), initializer=precalentar) as pool:
+            for i, (registros, tiempos_hijo) in zip(pendientes, pool.map(funcion_proceso, [archivos[i] for i in pendientes])):
+                calculados[i] = registros
+                if tiempos_hijo.get('excesos_regex'): con_exceso_regex.add(i)
+                if tiempos is not None: tiempos.combinar(tiempos_hijo)
+                completados += 1
+                if aviso: aviso(completados, len(archivos), archivos[i], registros)
+    else:
+        for i in pendientes:
+            excesos_previos = len(tiempos.excesos_regex) if tiempos is not None else 0
+            calculados[i] = metodo(archivos[i])
+            if tiempos is not None and len(tiempos.excesos_regex) > excesos_previos: con_exceso_regex.add(i)
+            completados += 1
+            if aviso: aviso(completados, len(archivos), archivos[i], calculados[i])
+
+    for i, registros in calculados.items():
+        resultados[i] = registros
+        # Un archivo con DI omitidas por tiempo no se cachea: se reintenta en la próxima ejecución
+        if cache is not None and i not in con_exceso_regex:
+            cache.guardar(digests[i], tipo, version, registros)
+    return resultados
+
+def _procesar_en_tuberia(lectura, calculo, archivos, cache=None, tipo='', version='', tiempos=None, aviso=None):
+    """Versión secuencial de _procesar_por_archivo con las etapas solapadas (tuberia_dim).
+
+    Un hilo adelanta la lectura y el hash de los archivos siguientes (y su consulta en
+    la caché), otro ejecuta `lectura(archivo, digest)` (p. ej. el texto del PDF) y el
+    hilo que llama aplica `calculo(archivo, leido)` (las regex). Con caché el hash se hace
+    una sola vez y lo reutilizan la caché y la lectura; sin caché no se calcula.
+    """
+    def prelectura(i):
+        if cache is None:
+            return i, None, None
+        digest = digest_archivo(archivos[i])
+        return i, digest, cache.obtener(digest, tipo, version)
+
+    def leer(previo):
+        i, digest, registros = previo
+        return i, digest, registros, (lectura(archivos[i], digest) if registros is None else None)
+
+    resultados = [None] * len(archivos)
+    tuberia = ejecutar_por_etapas(range(len(archivos)), (prelectura, leer), nombre='lectura_pdf')
+    try:
+        for completados, (i, digest, registros, leido) in enumerate(tuberia, 1):
+            if registros is None:
+                excesos_previos = len(tiempos.excesos_regex) if tiempos is not None else 0
+                registros = calculo(archivos[i], leido)
+                # Un archivo con DI omitidas por tiempo no se cachea: se reintenta en la próxima ejecución
+                con_exceso_regex = tiempos is not None and len(tiempos.excesos_regex) > excesos_previos
+                if cache is not None and not con_exceso_regex:
+                    cache.guardar(digest, tipo, version, registros)
+            resultados[i] = registros
+            if aviso: aviso(completados, len(archivos), archivos[i], registros)
+    finally:
+        # Si el cálculo o el aviso fallan, las etapas de lectura se detienen ya
+        tuberia.close()
+    return resultados
 
 # =============================================================================
 # CLASE 2: COMPARACIÓN DE DATOS
@@ -236,6 +292,7 @@ class ExtractorDIANSimplificado:
 
 class ComparadorDatos:
     def __init__(self):
+        self.tiempos = RegistroTiempos()
         self.campos_comparacion_individual = {
             'pais_origen': ('66. Cod. Pais de Origen', 'PAIS ORIGEN'),
             'pais_compra': ('70. Cod. Pais Compra', 'PAIS COMPRA'), 
@@ -277,21 +334,24 @@ class ComparadorDatos:
         emparejamientos = []
         if datos_subpartidas is None or datos_subpartidas.empty: return emparejamientos
         
+        # Filas como dicts en una sola pasada: iterrows crearía una Series por fila y por comparación
+        filas_dian = datos_dian.to_dict('records')
         if self.detectar_multiples_subpartidas(datos_subpartidas):
-            for _, di in datos_dian.iterrows():
+            filas_subpartidas = datos_subpartidas.to_dict('records')
+            for di in filas_dian:
                 subpartida_di = di.get('59. Subpartida Arancelaria', 'NO ENCONTRADO')
                 subpartida_correspondiente = None
-                for _, subpartida in datos_subpartidas.iterrows():
+                for subpartida in filas_subpartidas:
                     subpartida_excel = subpartida.get('subpartida', 'NO ENCONTRADO')
                     if str(subpartida_di).strip() == str(subpartida_excel).strip():
                         subpartida_correspondiente = subpartida
                         break
                 if subpartida_correspondiente is None and not datos_subpartidas.empty:
-                    subpartida_correspondiente = datos_subpartidas.iloc[0]
+                    subpartida_correspondiente = filas_subpartidas[0]
                 emparejamientos.append({'di': di, 'subpartida': subpartida_correspondiente})
         else:
             subpartida_unica = datos_subpartidas.iloc[0] if not datos_subpartidas.empty else None
-            for _, di in datos_dian.iterrows():
+            for di in filas_dian:
                 emparejamientos.append({'di': di, 'subpartida': subpartida_unica})
         return emparejamientos
 
@@ -444,7 +504,22 @@ class ComparadorDatos:
         
         return errores_criticos
 
-    def generar_reporte_tabular(self, datos_dian, datos_subpartidas):
+    def generar_reporte_tabular(self, datos_dian, datos_subpartidas, previas=None):
+        """Reporte con una fila por DI y la fila de valores acumulados.
+
+        `previas` (modo anexar, ver operacion_dim) trae por cada fila de `datos_dian` la
+        fila de una comparación anterior contra las mismas subpartidas, o None: solo se
+        comparan las DI sin fila previa. La consistencia (58, 62) y los acumulados
+        dependen de todas las DI y siempre se recalculan. Las filas por DI (sin la
+        consistencia) quedan en `self.filas_por_di` para guardarlas.
+        """
+        with self.tiempos.etapa('comparacion'):
+            df_reporte = self._generar_reporte_tabular(datos_dian, datos_subpartidas, previas)
+        df_reporte.attrs['tiempos'] = self.tiempos.como_dict()
+        return df_reporte
+
+    def _generar_reporte_tabular(self, datos_dian, datos_subpartidas, previas=None):
+        self.filas_por_di = []
         if datos_dian is None or datos_dian.empty or datos_subpartidas is None or datos_subpartidas.empty:
             return pd.DataFrame()
         
@@ -452,67 +527,20 @@ class ComparadorDatos:
         print(f"🔍 {'MÚLTIPLES SUBPARTIDAS' if multiples_subpartidas else 'SUBPARTIDA ÚNICA'} detectadas")
         
         emparejamientos = self.emparejar_di_con_subpartida(datos_dian, datos_subpartidas)
+        if previas is None: previas = [None] * len(emparejamientos)
         reporte_filas = []
         
-        for emparejamiento in emparejamientos:
+        for emparejamiento, previa in zip(emparejamientos, previas):
             di = emparejamiento['di']
-            subpartida = emparejamiento['subpartida']
             numero_di = di.get("4. Número DI", "Desconocido")
-            # SILENCIADO: print(f"\n🔍 Procesando DI: {numero_di}")
+            fila_di = dict(previa) if previa is not None else self._comparar_di(di, emparejamiento['subpartida'], multiples_subpartidas)
+            self.filas_por_di.append(fila_di)
             
             fila_reporte = {"4. Número DI": numero_di}
-            
             for campo_consistencia, campo_dian in self.campos_consistencia.items():
                 fila_reporte[campo_dian] = self.verificar_consistencia_campo(datos_dian, campo_dian, numero_di)
-            
-            for campo, (campo_dian, _) in self.campos_comparacion_individual.items():
-                valor_dian = di.get(campo_dian, "NO ENCONTRADO")
-                valor_subpartida = subpartida.get(campo, "NO ENCONTRADO") if subpartida is not None else "NO ENCONTRADO"
-                valor_formateado, _ = self.comparar_valor_individual_critico(valor_dian, valor_subpartida, campo_dian)
-                fila_reporte[f"{campo_dian} DI"] = valor_formateado
-                fila_reporte[f"{campo_dian} Subpartida"] = self.formatear_numero_entero(valor_subpartida, f"{campo_dian} Subpartida", es_individual=True)
-            
-            for campo, (campo_dian, _) in self.campos_subpartida_arancelaria.items():
-                valor_dian = di.get(campo_dian, "NO ENCONTRADO")
-                valor_subpartida = subpartida.get('subpartida', "NO ENCONTRADO") if subpartida is not None else "NO ENCONTRADO"
-                mostrar_emojis = multiples_subpartidas
-                coinciden = self.es_valor_valido(valor_dian) and self.es_valor_valido(valor_subpartida) and str(valor_dian).strip() == str(valor_subpartida).strip()
-                
-                val_di_fmt = self.formatear_numero_entero(valor_dian, campo_dian)
-                val_sub_fmt = self.formatear_numero_entero(valor_subpartida, f'{campo_dian} Subpartida')
-                
-                if mostrar_emojis:
-                    emoji_di = "✅" if self.es_valor_valido(valor_dian) else "❌"
-                    emoji_sub = "✅" if coinciden else "❌"
-                    fila_reporte[f"{campo_dian} DI"] = f"{emoji_di} {val_di_fmt}"
-                    fila_reporte[f"{campo_dian} Subpartida"] = f"{emoji_sub} {val_sub_fmt}"
-                    # SILENCIADO: print(f"   📊 Subpartida - DI: {emoji_di} {val_di_fmt}, Excel: {emoji_sub} {val_sub_fmt}")
-                else:
-                    fila_reporte[f"{campo_dian} DI"] = val_di_fmt
-                    fila_reporte[f"{campo_dian} Subpartida"] = val_sub_fmt
-
-            for campo, (campo_dian, _) in self.campos_bultos.items():
-                valor_dian = di.get(campo_dian, None)
-                valor_subpartida = subpartida.get(campo, None) if subpartida is not None else None
-                
-                val_di_fmt = self.formatear_numero_entero(valor_dian, campo_dian) if self.es_valor_valido(valor_dian) else "N/A"
-                val_sub_fmt = self.formatear_numero_entero(valor_subpartida, campo_dian) if self.es_valor_valido(valor_subpartida) else "N/A"
-                
-                fila_reporte[f"{campo_dian} DI"] = val_di_fmt if val_di_fmt != "N/A" else None
-                fila_reporte[f"{campo_dian} Subpartida"] = val_sub_fmt if val_sub_fmt != "N/A" else None
-                
-                # SILENCIADO: print(f"   📦 Bultos - DI: {val_di_fmt}, Subpartida: {val_sub_fmt}")
-                
-            for campo, (campo_dian, _) in self.campos_acumulables.items():
-                valor_dian = di.get(campo_dian, None)
-                valor_subpartida = subpartida.get(campo, None) if subpartida is not None else None
-                fila_reporte[f"{campo_dian} DI"] = valor_dian if self.es_valor_valido(valor_dian) else None
-                fila_reporte[f"{campo_dian} Subpartida"] = valor_subpartida if self.es_valor_valido(valor_subpartida) else None
-            
-            tiene_errores = self.determinar_resultado_final(di, subpartida if subpartida is not None else {}, multiples_subpartidas)
-            fila_reporte["Resultado verificación"] = "❌ CON DIFERENCIAS" if tiene_errores else "✅ CONFORME"
+            fila_reporte.update(fila_di)
             reporte_filas.append(fila_reporte)
-            # SILENCIADO: print(f"   {'❌' if tiene_errores else '✅'} DI: {numero_di} - {'CON DIFERENCIAS' if tiene_errores else 'CONFORME'}")
         
         if multiples_subpartidas:
             self._agregar_totales_multiples_subpartidas(reporte_filas, datos_dian, datos_subpartidas)
@@ -523,6 +551,58 @@ class ComparadorDatos:
         columnas_ordenadas = self._ordenar_columnas_reporte_con_di(df_reporte)
         return df_reporte[columnas_ordenadas]
 
+    def _comparar_di(self, di, subpartida, multiples_subpartidas):
+        """Columnas de una DI frente a su subpartida, sin las de consistencia entre DI"""
+        fila_reporte = {}
+        # SILENCIADO: print(f"\n🔍 Procesando DI: {di.get('4. Número DI')}")
+        for campo, (campo_dian, _) in self.campos_comparacion_individual.items():
+            valor_dian = di.get(campo_dian, "NO ENCONTRADO")
+            valor_subpartida = subpartida.get(campo, "NO ENCONTRADO") if subpartida is not None else "NO ENCONTRADO"
+            valor_formateado, _ = self.comparar_valor_individual_critico(valor_dian, valor_subpartida, campo_dian)
+            fila_reporte[f"{campo_dian} DI"] = valor_formateado
+            fila_reporte[f"{campo_dian} Subpartida"] = self.formatear_numero_entero(valor_subpartida, f"{campo_dian} Subpartida", es_individual=True)
+        
+        for campo, (campo_dian, _) in self.campos_subpartida_arancelaria.items():
+            valor_dian = di.get(campo_dian, "NO ENCONTRADO")
+            valor_subpartida = subpartida.get('subpartida', "NO ENCONTRADO") if subpartida is not None else "NO ENCONTRADO"
+            mostrar_emojis = multiples_subpartidas
+            coinciden = self.es_valor_valido(valor_dian) and self.es_valor_valido(valor_subpartida) and str(valor_dian).strip() == str(valor_subpartida).strip()
+            
+            val_di_fmt = self.formatear_numero_entero(valor_dian, campo_dian)
+            val_sub_fmt = self.formatear_numero_entero(valor_subpartida, f'{campo_dian} Subpartida')
+            
+            if mostrar_emojis:
+                emoji_di = "✅" if self.es_valor_valido(valor_dian) else "❌"
+                emoji_sub = "✅" if coinciden else "❌"
+                fila_reporte[f"{campo_dian} DI"] = f"{emoji_di} {val_di_fmt}"
+                fila_reporte[f"{campo_dian} Subpartida"] = f"{emoji_sub} {val_sub_fmt}"
+                # SILENCIADO: print(f"   📊 Subpartida - DI: {emoji_di} {val_di_fmt}, Excel: {emoji_sub} {val_sub_fmt}")
+            else:
+                fila_reporte[f"{campo_dian} DI"] = val_di_fmt
+                fila_reporte[f"{campo_dian} Subpartida"] = val_sub_fmt
+
+        for campo, (campo_dian, _) in self.campos_bultos.items():
+            valor_dian = di.get(campo_dian, None)
+            valor_subpartida = subpartida.get(campo, None) if subpartida is not None else None
+            
+            val_di_fmt = self.formatear_numero_entero(valor_dian, campo_dian) if self.es_valor_valido(valor_dian) else "N/A"
+            val_sub_fmt = self.formatear_numero_entero(valor_subpartida, campo_dian) if self.es_valor_valido(valor_subpartida) else "N/A"
+            
+            fila_reporte[f"{campo_dian} DI"] = val_di_fmt if val_di_fmt != "N/A" else None
+            fila_reporte[f"{campo_dian} Subpartida"] = val_sub_fmt if val_sub_fmt != "N/A" else None
+            
+            # SILENCIADO: print(f"   📦 Bultos - DI: {val_di_fmt}, Subpartida: {val_sub_fmt}")
+            
+        for campo, (campo_dian, _) in self.campos_acumulables.items():
+            valor_dian = di.get(campo_dian, None)
+            valor_subpartida = subpartida.get(campo, None) if subpartida is not None else None
+            fila_reporte[f"{campo_dian} DI"] = valor_dian if self.es_valor_valido(valor_dian) else None
+            fila_reporte[f"{campo_dian} Subpartida"] = valor_subpartida if self.es_valor_valido(valor_subpartida) else None
+        
+        tiene_errores = self.determinar_resultado_final(di, subpartida if subpartida is not None else {}, multiples_subpartidas)
+        fila_reporte["Resultado verificación"] = "❌ CON DIFERENCIAS" if tiene_errores else "✅ CONFORME"
+        return fila_reporte
+
     def _agregar_totales_multiples_subpartidas(self, reporte_filas, datos_dian, datos_subpartidas):
         """Agrega fila de totales (Múltiples Subpartidas)"""
         totales_di = self.calcular_totales_di(datos_dian)
@@ -719,8 +799,8 @@ class ComparadorDatos:
         todas = columnas_base + columnas_consistencia + columnas_individuales + columnas_subpartida + columnas_bultos + columnas_acumulables + columnas_finales
         return [c for c in todas if c in df_reporte.columns]
 
-    def generar_reporte_comparacion(self, datos_dian, datos_subpartidas, output_path):
-        df_reporte = self.generar_reporte_tabular(datos_dian, datos_subpartidas)
+    def generar_reporte_comparacion(self, datos_dian, datos_subpartidas, output_path, previas=None):
+        df_reporte = self.generar_reporte_tabular(datos_dian, datos_subpartidas, previas)
         if not df_reporte.empty:
             try:
                 for col in df_reporte.columns:
@@ -728,8 +808,10 @@ class ComparadorDatos:
                         mask_totales = df_reporte['4. Número DI'].str.contains('VALORES ACUMULADOS', na=False)
                         df_reporte.loc[~mask_totales, col] = pd.to_numeric(df_reporte.loc[~mask_totales, col], errors='coerce')
                 
-                df_reporte.to_excel(output_path, index=False)
-                print(f"💾 Reporte de comparación guardado en: {output_path}")
+                with self.tiempos.etapa('escritura_excel'):
+                    escribir_excel(df_reporte, output_path, columna_veredicto=COLUMNA_VEREDICTO_COMPARACION)
+                df_reporte.attrs['tiempos'] = self.tiempos.como_dict()
+                if isinstance(output_path, str): print(f"💾 Reporte de comparación guardado en: {output_path}")
                 self._mostrar_resumen_estadistico(df_reporte)
             except Exception as e:
                 print(f"❌ Error al guardar el reporte de comparación: {e}")
@@ -752,9 +834,27 @@ class ComparadorDatos:
 # CLASE 3: EXTRACCIÓN DE EXCEL (SUBPARTIDAS)
 # =============================================================================
 
+# Encabezado del Excel de subpartidas -> columna estandarizada
+COLUMNAS_SUBPARTIDAS = MappingProxyType({
+    'SUBPARTIDA': 'subpartida', 'DESCRIPCION': 'descripcion',
+    'PESO BRUTO': 'peso_bruto', 'PESO NETO': 'peso_neto',
+    'NUMERO BULTOS': 'numero_bultos', 'PAIS ORIGEN': 'pais_origen',
+    'PAIS COMPRA': 'pais_compra', 'PAIS PROCEDENCIA': 'pais_procedencia',
+    'PAIS DESTINO': 'pais_destino', 'VALOR_FLETES': 'valor_fletes',
+    'VALOR_SEGURO': 'valor_seguro', 'OTROS_GASTOS': 'otros_gastos',
+    'BANDERA': 'bandera', 'UNIDAD': 'unidad',
+    'VALOR FOB': 'valor_fob', 'CANTIDAD': 'cantidad'
+})
+
 class ExtractorSubpartidas:
-    def __init__(self):
+    """Con `plantillas` (plantillas_excel_dim.CachePlantillas) un libro de formato ya
+    conocido se lee directo de su hoja y columnas, sin volver a detectarlas; si la
+    plantilla ya no coincide con el libro se detectan de nuevo"""
+
+    def __init__(self, plantillas=None):
+        self.tiempos = RegistroTiempos()
         self.datos_estandarizados = pd.DataFrame()
+        self.plantillas = plantillas if plantillas is not None else PLANTILLAS_PROCESO
     
     def buscar_archivo_subpartidas(self, carpeta_base):
         patrones = ["*subpartida*.xlsx", "*subpartida*.xls", "*resumen*.xlsx", "*resumen*.xls", "*.xlsx"]
@@ -768,19 +868,19 @@ class ExtractorSubpartidas:
     
     def detectar_hoja_correcta(self, archivo_excel):
         try:
-            hojas_disponibles = pd.ExcelFile(archivo_excel).sheet_names
+            hojas_disponibles = pd.ExcelFile(_rebobinar(archivo_excel)).sheet_names
             palabras_clave = ['subpartida', 'resumen', 'datos', '847156', 'hoja1', 'sheet1']
             for hoja in hojas_disponibles:
                 hoja_lower = hoja.lower()
                 if any(palabra in hoja_lower for palabra in palabras_clave):
                     try:
-                        df_prueba = pd.read_excel(archivo_excel, sheet_name=hoja, nrows=5)
+                        df_prueba = pd.read_excel(_rebobinar(archivo_excel), sheet_name=hoja, nrows=5)
                         if len([col for col in df_prueba.columns if any(palabra in str(col).lower() for palabra in ['subpartida', 'descripcion', 'peso', 'pais', 'valor'])]) >= 3:
                             return hoja
                     except: continue
             for hoja in hojas_disponibles:
                 try:
-                    df_prueba = pd.read_excel(archivo_excel, sheet_name=hoja, nrows=5)
+                    df_prueba = pd.read_excel(_rebobinar(archivo_excel), sheet_name=hoja, nrows=5)
                     if len(df_prueba.columns) >= 5 and not df_prueba.empty: return hoja
                 except: continue
             return hojas_disponibles[0] if hojas_disponibles else None
@@ -790,23 +890,54 @@ class ExtractorSubpartidas:
         try:
             archivo_excel = self.buscar_archivo_subpartidas(carpeta_base)
             if not archivo_excel: return pd.DataFrame()
-            hoja_correcta = self.detectar_hoja_correcta(archivo_excel)
-            if not hoja_correcta: return pd.DataFrame()
-            df = pd.read_excel(archivo_excel, sheet_name=hoja_correcta, header=0)
-            return self._estandarizar_y_filtrar_columnas(df)
+            return self.extraer_y_estandarizar_archivo(archivo_excel)
+        except: return pd.DataFrame()
+
+    def extraer_y_estandarizar_archivo(self, archivo_excel) -> pd.DataFrame:
+        try:
+            archivo = _nombre_archivo(archivo_excel)
+            self.tiempos.sumar('bytes_leidos', _tamano_archivo(archivo_excel))
+            with self.tiempos.etapa('deteccion_hoja', archivo):
+                huella = huella_archivo_excel(archivo_excel, TIPO_SUBPARTIDAS)
+                plantilla = self.plantillas.obtener(TIPO_SUBPARTIDAS, huella)
+                hoja_correcta = plantilla['hoja'] if plantilla else self.detectar_hoja_correcta(archivo_excel)
+            df = None
+            if plantilla:
+                with self.tiempos.etapa('lectura_subpartidas', archivo):
+                    # Formato conocido: solo las columnas que se estandarizan
+                    df = self._leer_segun_plantilla(archivo_excel, plantilla)
+                    if df is not None:
+                        df = self._estandarizar_y_filtrar_columnas(df)
+                        self.tiempos.sumar('plantillas_reutilizadas', 1)
+                if df is None:
+                    # La plantilla ya no coincide con el libro: se detecta de nuevo y se reemplaza
+                    with self.tiempos.etapa('deteccion_hoja', archivo):
+                        hoja_correcta = self.detectar_hoja_correcta(archivo_excel)
+            if df is None:
+                if not hoja_correcta: return pd.DataFrame()
+                with self.tiempos.etapa('lectura_subpartidas', archivo):
+                    df = pd.read_excel(_rebobinar(archivo_excel), sheet_name=hoja_correcta, header=0)
+                    columnas = [i for i, col in enumerate(df.columns) if col in COLUMNAS_SUBPARTIDAS]
+                    df = self._estandarizar_y_filtrar_columnas(df)
+                self.plantillas.guardar(TIPO_SUBPARTIDAS, huella, {'hoja': hoja_correcta, 'columnas': columnas})
+            df.attrs['tiempos'] = self.tiempos.como_dict()
+            return df
         except: return pd.DataFrame()
     
+    def _leer_segun_plantilla(self, archivo_excel, plantilla):
+        """Solo las columnas que se estandarizan, de la hoja y posiciones de la plantilla;
+        None si ya no coinciden con el libro (hoja o columna inexistente, otro encabezado)"""
+        try:
+            df = pd.read_excel(_rebobinar(archivo_excel), sheet_name=plantilla['hoja'], header=0,
+                               usecols=plantilla['columnas'])
+        except (ValueError, KeyError, IndexError, TypeError):
+            return None
+        if len(df.columns) != len(plantilla['columnas']) or not all(col in COLUMNAS_SUBPARTIDAS for col in df.columns):
+            return None
+        return df
+
     def _estandarizar_y_filtrar_columnas(self, df: pd.DataFrame) -> pd.DataFrame:
-        mapeo_columnas = {
-            'SUBPARTIDA': 'subpartida', 'DESCRIPCION': 'descripcion',
-            'PESO BRUTO': 'peso_bruto', 'PESO NETO': 'peso_neto', 
-            'NUMERO BULTOS': 'numero_bultos', 'PAIS ORIGEN': 'pais_origen',
-            'PAIS COMPRA': 'pais_compra', 'PAIS PROCEDENCIA': 'pais_procedencia',
-            'PAIS DESTINO': 'pais_destino', 'VALOR_FLETES': 'valor_fletes',
-            'VALOR_SEGURO': 'valor_seguro', 'OTROS_GASTOS': 'otros_gastos',
-            'BANDERA': 'bandera', 'UNIDAD': 'unidad',
-            'VALOR FOB': 'valor_fob', 'CANTIDAD': 'cantidad'
-        }
+        mapeo_columnas = COLUMNAS_SUBPARTIDAS
         columnas_a_mantener = [col for col in mapeo_columnas.keys() if col in df.columns]
         df_filtrado = df[columnas_a_mantener].copy()
         df_renombrado = df_filtrado.rename(columns=mapeo_columnas)
@@ -823,51 +954,86 @@ class ExtractorSubpartidas:
 # CLASE 4: VALIDACIÓN DECLARACIÓN IMPORTACIÓN
 # =============================================================================
 
+# Campos de la declaración, su cruce con los códigos del FMM y sus patrones
+CAMPOS_DECLARACION = MappingProxyType({
+    "5.": "5. Número de Identificación Tributaria (NIT)",
+    "11.": "11. Apellidos y Nombres / Razón Social Importador",
+    "42.": "42. No. Manifiesto de Carga", "43.": "43. Fecha Manifiesto de Carga",
+    "44.": "44. No. Documento de Transporte", "45.": "45. Fecha Documento de Transporte",
+    "51.": "51. No. Factura Comercial", "52.": "52. Fecha Factura Comercial",
+    "132.": "132. No. Aceptación Declaración", "133.": "133. Fecha Aceptación",
+    "134.": "134. Levante No.", "135.": "135. Fecha Levante"
+})
+
+MAPEOS_VALIDACION = MappingProxyType({
+    "5. Número de Identificación Tributaria (NIT)": MappingProxyType({"codigo_formulario": "PROVEEDOR", "descripcion_esperada": "INFORMACION_PROVEEDOR", "tipo": "documento", "cambia_por_declaracion": False}),
+    "11. Apellidos y Nombres / Razón Social Importador": MappingProxyType({"codigo_formulario": "PROVEEDOR", "descripcion_esperada": "INFORMACION_PROVEEDOR", "tipo": "documento", "cambia_por_declaracion": False}),
+    "42. No. Manifiesto de Carga": MappingProxyType({"codigo_formulario": 93, "descripcion_esperada": "FORMULARIO DE SALIDA ZONA FRANCA", "tipo": "documento", "cambia_por_declaracion": False}),
+    "43. Fecha Manifiesto de Carga": MappingProxyType({"codigo_formulario": 93, "descripcion_esperada": "FORMULARIO DE SALIDA ZONA FRANCA", "tipo": "fecha", "cambia_por_declaracion": False}),
+    "44. No. Documento de Transporte": MappingProxyType({"codigo_formulario": (17, 91), "descripcion_esperada": "DOCUMENTO OF TRANSPORTE", "tipo": "documento", "cambia_por_declaracion": False}),
+    "45. Fecha Documento de Transporte": MappingProxyType({"codigo_formulario": (17, 91), "descripcion_esperada": "DOCUMENTO OF TRANSPORTE", "tipo": "fecha", "cambia_por_declaracion": False}),
+    "51. No. Factura Comercial": MappingProxyType({"codigo_formulario": 6, "descripcion_esperada": "FACTURA COMERCIAL", "tipo": "documento", "cambia_por_declaracion": True}),
+    "52. Fecha Factura Comercial": MappingProxyType({"codigo_formulario": 6, "descripcion_esperada": "FACTURA COMERCIAL", "tipo": "fecha", "cambia_por_declaracion": True}),
+    "132. No. Aceptación Declaración": MappingProxyType({"codigo_formulario": 9, "descripcion_esperada": "DECLARACION DE IMPORTACION", "tipo": "documento", "cambia_por_declaracion": True}),
+    "133. Fecha Aceptación": MappingProxyType({"codigo_formulario": 9, "descripcion_esperada": "DECLARACION DE IMPORTACION", "tipo": "fecha", "cambia_por_declaracion": True}),
+    "134. Levante No.": MappingProxyType({"codigo_formulario": 47, "descripcion_esperada": "AUTORIZACION DE LEVANTE", "tipo": "documento", "cambia_por_declaracion": True}),
+    "135. Fecha Levante": MappingProxyType({"codigo_formulario": 47, "descripcion_esperada": "AUTORIZACION DE LEVANTE", "tipo": "fecha", "cambia_por_declaracion": True})
+})
+
+PATRONES_DECLARACION = _compilar_patrones({
+    "5. Número de Identificación Tributaria (NIT)": [r"5\s*\.?\s*N[uú]mero\s*de\s*Identificaci[oó]n\s*Tributaria\s*\(NIT\).*?([0-9]{6,12})", r"5\.\s*Número de Identificación Tributaria \(NIT\)[\s\S]*?(\d{6,12})"],
+    "11. Apellidos y Nombres / Razón Social Importador": [r"11\s*\.?\s*Apellidos\s*y\s*nombres\s*o\s*Raz[oó]n\s*Social\s*\n?\s*\d{6,12}\s*\d?\s*([A-ZÁÉÍÓÚÑ0-9\s\.\-&/]+?)(?=\s*13\s*\.)", r"11\.\s*Apellidos y nombres o Razón Social[\s\S]*?\n\s*(\d{6,12}\s*\d?\s*[A-ZÁÉÍÓÚÑ0-9\s\.\-&/]+)"],
+    "42. No. Manifiesto de Carga": [r"42\s*\.?\s*Manifiesto\s*de\s*carga[\s\S]*?No\.?\s*([A-Z0-9]+)"],
+    "43. Fecha Manifiesto de Carga": [r"43\s*\.?\s*Año\s*[-\s]*Mes\s*[-\s]*Día.*?(\d{4}\s*[-]\s*\d{2}\s*[-]\s*\d{2})"],
+    "44. No. Documento de Transporte": [r"44\s*\.?\s*Documento\s*de\s*transporte[\s\S]*?No\.?\s*[A-Z0-9\-]{3,}[\s\S]*?No\.?\s*((?:(?=[A-Z0-9-]*[A-Z])[A-Z0-9]+(?:-[A-Z0-9]+)*)|(?:[A-Z]+\s*[0-9]+(?:-[A-Z]+)?)|(?:[A-Z0-9]{7,})|(?:[0-9]{6,11}))(?:\s|[0-9]{4}|$)"],
+    "45. Fecha Documento de Transporte": [r"45\s*\.?\s*Año.*?Día[\s\S]*?[0-9]{4}\s*-\s*[0-9]{2}\s*-\s*[0-9]{2}[\s\S]*?([0-9]{4}\s*-\s*[0-9]{2}\s*-\s*[0-9]{2})"],
+    "51. No. Factura Comercial": [r"51\s*\.?\s*No\.?\s*de\s*factura[\s\S]*?\n\s*(?!(?:\d{1,2}[-/]\d{1,2}[-/]\d{2,4})|(?:\d{4}[-/]\d{1,2}[-/]\d{1,2}))([A-Z0-9]+(?:/[A-Z0-9]+)*(?:-[A-Z0-9]+)*(?:\s+(?=[A-Z0-9]*[A-Z])[A-Z0-9]+)?)"],
+    "52. Fecha Factura Comercial": [r"52\s*\.\s*?Año\s*-\s*Mes\s*-\s*Día.*?\n(?:.*?[^\d\w-])?(\d{4}\s*-\s*\d{2}\s*-\s*\d{2})"],
+    "132. No. Aceptación Declaración": [r"132\s*\.?\s*No\.?\s*Aceptaci[oó]n\s*declaraci[oó]n[\s\S]*?(\d{12,18})"],
+    "133. Fecha Aceptación": [r"133\s*\.?\s*Fec*h?a:?\s*(\d{4}\s*[\-\s]*\d{2}\s*[\-\s]*\d{2}|\d{8})\b"],
+    "134. Levante No.": [r"134\s*\.?\s*Levante\s*No\.?[\s\S]{0,300}?(\d{12,})"],
+    "135. Fecha Levante": [r"135\s*\.?\s*Fecha[\s\S]{0,400}?(\d{4}\s*-\s*\d{2}\s*-\s*\d{2})"]
+})
+
+CAMPOS_CON_FECHA = ('Fecha', 'Aceptación', 'Levante')
+# Casillas cuya validación depende del emparejamiento de facturas de todas las DI
+CAMPOS_FACTURA = ("51. No. Factura Comercial", "52. Fecha Factura Comercial")
+FORMATOS_FECHA = tuple((re.compile(p), f) for p, f in [
+    (r'^(\d{4})(\d{2})(\d{2})$', '%Y%m%d'), (r'(\d{4})-(\d{1,2})-(\d{1,2})', '%Y-%m-%d'), (r'(\d{4})/(\d{1,2})/(\d{1,2})', '%Y/%m/%d'),
+    (r'(\d{1,2})-(\d{1,2})-(\d{4})', '%d-%m-%Y'), (r'(\d{1,2})/(\d{1,2})/(\d{4})', '%d/%m/%Y')])
+
+def normalizar_fecha_dd_mm_aaaa(fecha_str, es_fecha=True):
+    """Fecha en formato dd-mm-aaaa; los valores que no parecen fecha se retornan limpios"""
+    if not fecha_str or fecha_str == "NO ENCONTRADO" or str(fecha_str).strip() == "": return "NO ENCONTRADO"
+    if not es_fecha: return str(fecha_str).strip()
+    try:
+        if isinstance(fecha_str, datetime): return fecha_str.strftime('%d-%m-%Y')
+        fecha_limpia = str(fecha_str).strip().replace(' ', '')
+        if len(fecha_limpia) > 10 and fecha_limpia.isdigit(): return fecha_limpia
+        for patron, formato in FORMATOS_FECHA:
+            if patron.match(fecha_limpia): return datetime.strptime(fecha_limpia, formato).strftime('%d-%m-%Y')
+        return fecha_limpia
+    except: return str(fecha_str)
+
+# Filas que se examinan bajo los encabezados de "DETALLE DE LOS ANEXOS"
+MAX_FILAS_ANEXOS = 200
+
 class ValidadorDeclaracionImportacionCompleto:
-    def __init__(self):
-        warnings.filterwarnings('ignore', category=UserWarning, module='openpyxl')
+    """Con `plantillas` (plantillas_excel_dim.CachePlantillas) los anexos de un FMM de
+    formato ya conocido se leen sin buscar la sección ni sus columnas"""
+
+    def __init__(self, plantillas=None):
+        self.tiempos = RegistroTiempos()
+        self.plantillas = plantillas if plantillas is not None else PLANTILLAS_PROCESO
         self.corrector_nombres = CorrectorNombres()
-        self.CAMPOS_DI = {
-            "5.": "5. Número de Identificación Tributaria (NIT)",
-            "11.": "11. Apellidos y Nombres / Razón Social Importador",
-            "42.": "42. No. Manifiesto de Carga", "43.": "43. Fecha Manifiesto de Carga",
-            "44.": "44. No. Documento de Transporte", "45.": "45. Fecha Documento de Transporte",
-            "51.": "51. No. Factura Comercial", "52.": "52. Fecha Factura Comercial",
-            "132.": "132. No. Aceptación Declaración", "133.": "133. Fecha Aceptación",
-            "134.": "134. Levante No.", "135.": "135. Fecha Levante"
-        }
-        self.MAPEOS_VALIDACION = {
-            "5. Número de Identificación Tributaria (NIT)": {"codigo_formulario": "PROVEEDOR", "descripcion_esperada": "INFORMACION_PROVEEDOR", "tipo": "documento", "cambia_por_declaracion": False},
-            "11. Apellidos y Nombres / Razón Social Importador": {"codigo_formulario": "PROVEEDOR", "descripcion_esperada": "INFORMACION_PROVEEDOR", "tipo": "documento", "cambia_por_declaracion": False},
-            "42. No. Manifiesto de Carga": {"codigo_formulario": 93, "descripcion_esperada": "FORMULARIO DE SALIDA ZONA FRANCA", "tipo": "documento", "cambia_por_declaracion": False},
-            "43. Fecha Manifiesto de Carga": {"codigo_formulario": 93, "descripcion_esperada": "FORMULARIO DE SALIDA ZONA FRANCA", "tipo": "fecha", "cambia_por_declaracion": False},
-            "44. No. Documento de Transporte": {"codigo_formulario": [17, 91], "descripcion_esperada": "DOCUMENTO OF TRANSPORTE", "tipo": "documento", "cambia_por_declaracion": False},
-            "45. Fecha Documento de Transporte": {"codigo_formulario": [17, 91], "descripcion_esperada": "DOCUMENTO OF TRANSPORTE", "tipo": "fecha", "cambia_por_declaracion": False},
-            "51. No. Factura Comercial": {"codigo_formulario": 6, "descripcion_esperada": "FACTURA COMERCIAL", "tipo": "documento", "cambia_por_declaracion": True},
-            "52. Fecha Factura Comercial": {"codigo_formulario": 6, "descripcion_esperada": "FACTURA COMERCIAL", "tipo": "fecha", "cambia_por_declaracion": True},
-            "132. No. Aceptación Declaración": {"codigo_formulario": 9, "descripcion_esperada": "DECLARACION DE IMPORTACION", "tipo": "documento", "cambia_por_declaracion": True},
-            "133. Fecha Aceptación": {"codigo_formulario": 9, "descripcion_esperada": "DECLARACION DE IMPORTACION", "tipo": "fecha", "cambia_por_declaracion": True},
-            "134. Levante No.": {"codigo_formulario": 47, "descripcion_esperada": "AUTORIZACION DE LEVANTE", "tipo": "documento", "cambia_por_declaracion": True},
-            "135. Fecha Levante": {"codigo_formulario": 47, "descripcion_esperada": "AUTORIZACION DE LEVANTE", "tipo": "fecha", "cambia_por_declaracion": True}
-        }
-        self.patrones = {
-            "5. Número de Identificación Tributaria (NIT)": [r"5\s*\.?\s*N[uú]mero\s*de\s*Identificaci[oó]n\s*Tributaria\s*\(NIT\).*?([0-9]{6,12})", r"5\.\s*Número de Identificación Tributaria \(NIT\)[\s\S]*?(\d{6,12})"],
-            "11. Apellidos y Nombres / Razón Social Importador": [r"11\s*\.?\s*Apellidos\s*y\s*nombres\s*o\s*Raz[oó]n\s*Social\s*\n?\s*\d{6,12}\s*\d?\s*([A-ZÁÉÍÓÚÑ0-9\s\.\-&/]+?)(?=\s*13\s*\.)", r"11\.\s*Apellidos y nombres o Razón Social[\s\S]*?\n\s*(\d{6,12}\s*\d?\s*[A-ZÁÉÍÓÚÑ0-9\s\.\-&/]+)"],
-            "42. No. Manifiesto de Carga": [r"42\s*\.?\s*Manifiesto\s*de\s*carga[\s\S]*?No\.?\s*([A-Z0-9]+)"],
-            "43. Fecha Manifiesto de Carga": [r"43\s*\.?\s*Año\s*[-\s]*Mes\s*[-\s]*Día.*?(\d{4}\s*[-]\s*\d{2}\s*[-]\s*\d{2})"],
-            "44. No. Documento de Transporte": [r"44\s*\.?\s*Documento\s*de\s*transporte[\s\S]*?No\.?\s*[A-Z0-9\-]{3,}[\s\S]*?No\.?\s*((?:(?=[A-Z0-9-]*[A-Z])[A-Z0-9]+(?:-[A-Z0-9]+)*)|(?:[A-Z]+\s*[0-9]+(?:-[A-Z]+)?)|(?:[A-Z0-9]{7,})|(?:[0-9]{6,11}))(?:\s|[0-9]{4}|$)"],
-            "45. Fecha Documento de Transporte": [r"45\s*\.?\s*Año.*?Día[\s\S]*?[0-9]{4}\s*-\s*[0-9]{2}\s*-\s*[0-9]{2}[\s\S]*?([0-9]{4}\s*-\s*[0-9]{2}\s*-\s*[0-9]{2})"],
-            "51. No. Factura Comercial": [r"51\s*\.?\s*No\.?\s*de\s*factura[\s\S]*?\n\s*(?!(?:\d{1,2}[-/]\d{1,2}[-/]\d{2,4})|(?:\d{4}[-/]\d{1,2}[-/]\d{1,2}))([A-Z0-9]+(?:/[A-Z0-9]+)*(?:-[A-Z0-9]+)*(?:\s+(?=[A-Z0-9]*[A-Z])[A-Z0-9]+)?)"],
-            "52. Fecha Factura Comercial": [r"52\s*\.\s*?Año\s*-\s*Mes\s*-\s*Día.*?\n(?:.*?[^\d\w-])?(\d{4}\s*-\s*\d{2}\s*-\s*\d{2})"],
-            "132. No. Aceptación Declaración": [r"132\s*\.?\s*No\.?\s*Aceptaci[oó]n\s*declaraci[oó]n[\s\S]*?(\d{12,18})"],
-            "133. Fecha Aceptación": [r"133\s*\.?\s*Fec*h?a:?\s*(\d{4}\s*[\-\s]*\d{2}\s*[\-\s]*\d{2}|\d{8})\b"],
-            "134. Levante No.": [r"134\s*\.?\s*Levante\s*No\.?[\s\S]{0,300}?(\d{12,})"],
-            "135. Fecha Levante": [r"135\s*\.?\s*Fecha[\s\S]{0,400}?(\d{4}\s*-\s*\d{2}\s*-\s*\d{2})"]
-        }
+        self.CAMPOS_DI = CAMPOS_DECLARACION
+        self.MAPEOS_VALIDACION = MAPEOS_VALIDACION
         self.nit_proveedor = None
         self.nombre_proveedor = None
         self.facturas_emparejadas = {}
         self._cache_nombres = {}
+        self.resumen_anexos = {'total_anexos': 0, 'resumen_codigos': {}, 'validacion_integridad': {}}
+        self.conteo_declaraciones = {'procesadas': 0, 'con_errores': 0}
 
     def buscar_archivo_formulario(self, carpeta):
         print(f"🔍 Buscando formulario FMM...")
@@ -883,9 +1049,13 @@ class ValidadorDeclaracionImportacionCompleto:
         return None
 
     def extraer_proveedor_formulario(self, archivo_excel):
+        with self.tiempos.etapa('proveedor_fmm', _nombre_archivo(archivo_excel)):
+            return self._extraer_proveedor_formulario(archivo_excel)
+
+    def _extraer_proveedor_formulario(self, archivo_excel):
         try:
             print(f"👤 Extrayendo información del proveedor...")
-            wb = load_workbook(archivo_excel, data_only=True)
+            wb = openpyxl.load_workbook(_rebobinar(archivo_excel), data_only=True)
             sheet = wb.active
             proveedor_encontrado = False
             for row in sheet.iter_rows():
@@ -916,60 +1086,115 @@ class ValidadorDeclaracionImportacionCompleto:
             print(f"❌ ERROR al extraer proveedor: {e}")
             return False
 
-    def extraer_anexos_formulario_robusto(self, archivo_excel):
-        try:
-            print(f"📖 Extrayendo anexos del formulario...")
-            wb = load_workbook(archivo_excel, data_only=True)
-            sheet = wb.active
-            inicio_anexos = None
-            for row in range(1, sheet.max_row + 1):
-                for col in range(1, sheet.max_column + 1):
-                    if sheet.cell(row=row, column=col).value and 'DETALLE DE LOS ANEXOS' in str(sheet.cell(row=row, column=col).value):
-                        inicio_anexos = row
-                        break
-                if inicio_anexos: break
-            
-            if inicio_anexos is None:
-                wb.close(); return pd.DataFrame()
-            
-            encabezados = {}
-            fila_encabezados = inicio_anexos + 1
-            for col in range(1, sheet.max_column + 1):
-                valor = sheet.cell(row=fila_encabezados, column=col).value
-                if valor:
-                    valor_str = str(valor).strip().upper()
-                    if 'CÓDIGO' in valor_str or 'CODIGO' in valor_str: encabezados['codigo'] = col
-                    elif 'DESCRIPCIÓN' in valor_str or 'DESCRIPCION' in valor_str: encabezados['descripcion'] = col
-                    elif 'DOCUMENTO' in valor_str: encabezados['documento'] = col
-                    elif 'FECHA' in valor_str: encabezados['fecha'] = col
-            
-            if not encabezados: encabezados = {'codigo': 1, 'descripcion': 5, 'documento': 19, 'fecha': 34}
-            datos_anexos = []
-            fila_actual = fila_encabezados + 1
-            for i in range(200):
+    def _encabezados_anexos(self, valores):
+        """Columna (1 = A) de CÓDIGO, DESCRIPCIÓN, DOCUMENTO y FECHA en la fila que sigue a
+        "DETALLE DE LOS ANEXOS"; las posiciones habituales si la fila no los trae"""
+        encabezados = {}
+        for col, valor in enumerate(valores, 1):
+            if valor:
+                valor_str = str(valor).strip().upper()
+                if 'CÓDIGO' in valor_str or 'CODIGO' in valor_str: encabezados['codigo'] = col
+                elif 'DESCRIPCIÓN' in valor_str or 'DESCRIPCION' in valor_str: encabezados['descripcion'] = col
+                elif 'DOCUMENTO' in valor_str: encabezados['documento'] = col
+                elif 'FECHA' in valor_str: encabezados['fecha'] = col
+        return encabezados or {'codigo': 1, 'descripcion': 5, 'documento': 19, 'fecha': 34}
+
+    def _filas_anexos(self, celda, fila_encabezados, encabezados):
+        """Anexos con código de interés bajo la fila de encabezados; `celda(fila, columna)`
+        da el valor de una celda. Termina en tres filas seguidas sin código"""
+        datos_anexos = []
+        fila_actual = fila_encabezados + 1
+        for i in range(MAX_FILAS_ANEXOS):
+            try:
+                col_code = encabezados.get('codigo', 1)
+                codigo = celda(fila_actual, col_code)
+                if codigo is None or codigo == '':
+                    if all(celda(fila_actual + j, col_code) in [None, ''] for j in range(3)): break
+                    fila_actual += 1; continue
+
                 try:
-                    col_code = encabezados.get('codigo', 1)
-                    codigo = sheet.cell(row=fila_actual, column=col_code).value
-                    if codigo is None or codigo == '':
-                        if all(sheet.cell(row=fila_actual + j, column=col_code).value in [None, ''] for j in range(3)): break
+                    codigo_str = str(codigo).strip().split('.')[0]
+                    if codigo_str not in ['6', '9', '17', '47', '93', '91']:
                         fila_actual += 1; continue
-                    
-                    try:
-                        codigo_str = str(codigo).strip().split('.')[0]
-                        if codigo_str not in ['6', '9', '17', '47', '93', '91']:
-                            fila_actual += 1; continue
-                    except: fila_actual += 1; continue
-                    
-                    datos_anexos.append({
-                        'Codigo': int(float(codigo_str)),
-                        'Descripcion': sheet.cell(row=fila_actual, column=encabezados.get('descripcion', 5)).value,
-                        'Documento': sheet.cell(row=fila_actual, column=encabezados.get('documento', 19)).value,
-                        'Fecha': self.normalizar_fecha_dd_mm_aaaa(sheet.cell(row=fila_actual, column=encabezados.get('fecha', 34)).value, es_fecha=True),
-                        'Fila_Excel': fila_actual, 'Usado': False
-                    })
-                    fila_actual += 1
                 except: fila_actual += 1; continue
+
+                datos_anexos.append({
+                    'Codigo': int(float(codigo_str)),
+                    'Descripcion': celda(fila_actual, encabezados.get('descripcion', 5)),
+                    'Documento': celda(fila_actual, encabezados.get('documento', 19)),
+                    'Fecha': self.normalizar_fecha_dd_mm_aaaa(celda(fila_actual, encabezados.get('fecha', 34)), es_fecha=True),
+                    'Fila_Excel': fila_actual, 'Usado': False
+                })
+                fila_actual += 1
+            except: fila_actual += 1; continue
+        return datos_anexos
+
+    def _anexos_detectando_formato(self, archivo_excel, huella):
+        """Anexos buscando "DETALLE DE LOS ANEXOS" en todo el libro; el formato resuelto
+        queda en las plantillas con la `huella` del libro. None si no tiene la sección"""
+        wb = openpyxl.load_workbook(_rebobinar(archivo_excel), data_only=True)
+        sheet = wb.active
+        inicio_anexos = None
+        for row in range(1, sheet.max_row + 1):
+            for col in range(1, sheet.max_column + 1):
+                if sheet.cell(row=row, column=col).value and 'DETALLE DE LOS ANEXOS' in str(sheet.cell(row=row, column=col).value):
+                    inicio_anexos = row
+                    break
+            if inicio_anexos: break
+
+        if inicio_anexos is None:
+            wb.close(); return None
+
+        fila_encabezados = inicio_anexos + 1
+        encabezados = self._encabezados_anexos(sheet.cell(row=fila_encabezados, column=col).value
+                                               for col in range(1, sheet.max_column + 1))
+        datos_anexos = self._filas_anexos(lambda fila, col: sheet.cell(row=fila, column=col).value,
+                                          fila_encabezados, encabezados)
+        wb.close()
+        self.plantillas.guardar(TIPO_FORMULARIO, huella, {'fila_detalle': inicio_anexos, 'encabezados': encabezados})
+        return datos_anexos
+
+    def _anexos_segun_plantilla(self, archivo_excel):
+        """(huella del libro, anexos) de un libro de formato conocido, leído en modo de solo
+        lectura hasta la última fila que se puede examinar. Los anexos son None si el formato
+        no está en las plantillas o la sección ya no está donde indica la plantilla"""
+        wb = openpyxl.load_workbook(_rebobinar(archivo_excel), read_only=True, data_only=True)
+        try:
+            huella = huella_libro(wb, FILAS_HUELLA[TIPO_FORMULARIO])
+            plantilla = self.plantillas.obtener(TIPO_FORMULARIO, huella)
+            if plantilla is None:
+                return huella, None
+            fila_encabezados = plantilla['fila_detalle'] + 1
+            filas = list(wb.active.iter_rows(max_row=fila_encabezados + MAX_FILAS_ANEXOS + 3, values_only=True))
+        finally:
             wb.close()
+        inicio_anexos = next((numero for numero, fila in enumerate(filas, 1)
+                              if any(v and 'DETALLE DE LOS ANEXOS' in str(v) for v in fila)), None)
+        if inicio_anexos != plantilla['fila_detalle'] or len(filas) < fila_encabezados:
+            return huella, None
+        encabezados = self._encabezados_anexos(filas[fila_encabezados - 1])
+        if encabezados != plantilla['encabezados']:
+            return huella, None
+
+        def celda(fila, col):
+            valores = filas[fila - 1] if fila <= len(filas) else ()
+            return valores[col - 1] if col <= len(valores) else None
+        self.tiempos.sumar('plantillas_reutilizadas', 1)
+        return huella, self._filas_anexos(celda, fila_encabezados, encabezados)
+
+    def extraer_anexos_formulario_robusto(self, archivo_excel):
+        self.tiempos.sumar('bytes_leidos', _tamano_archivo(archivo_excel))
+        with self.tiempos.etapa('anexos_fmm', _nombre_archivo(archivo_excel)):
+            return self._extraer_anexos_formulario_robusto(archivo_excel)
+
+    def _extraer_anexos_formulario_robusto(self, archivo_excel):
+        try:
+            print(f"📖 Extrayendo anexos del formulario...")
+            huella, datos_anexos = self._anexos_segun_plantilla(archivo_excel)
+            if datos_anexos is None:
+                datos_anexos = self._anexos_detectando_formato(archivo_excel, huella)
+            if datos_anexos is None:
+                return pd.DataFrame()
             df_resultado = pd.DataFrame(datos_anexos)
             
             # === CORRECCIÓN DE TIPOS PARA VALIDACIÓN ESTRICTA ===
@@ -982,6 +1207,11 @@ class ValidadorDeclaracionImportacionCompleto:
                 print("📊 Resumen por código:")
                 for _, row in resumen.iterrows():
                     print(f"   • Código {row['Codigo']}: {row['Documento']} - {row['Descripcion']}")
+                self.resumen_anexos['total_anexos'] = len(df_resultado)
+                self.resumen_anexos['resumen_codigos'] = {
+                    str(row['Codigo']): {'cantidad': int(row['Documento']), 'nombre': str(row['Descripcion']).strip()}
+                    for _, row in resumen.iterrows()
+                }
                 
                 di_rows = df_resultado[df_resultado['Codigo'] == 9]
                 lev_rows = df_resultado[df_resultado['Codigo'] == 47]
@@ -994,6 +1224,12 @@ class ValidadorDeclaracionImportacionCompleto:
                 
                 has_integrity_issues = len(di_dupes) > 0 or len(lev_dupes) > 0 or count_di != count_lev
                 
+                integridad = self.resumen_anexos['validacion_integridad']
+                if len(lev_dupes) > 0:
+                    integridad['levantes_duplicados'] = {'cantidad': str(len(lev_dupes)), 'numero': ', '.join(map(str, lev_dupes))}
+                if count_di != count_lev:
+                    integridad['desbalance'] = {'di': str(count_di), 'levantes': str(count_lev)}
+
                 if has_integrity_issues:
                     print("\n🔍 VALIDACIÓN DE INTEGRIDAD:")
                     if len(di_dupes) > 0:
@@ -1009,56 +1245,8 @@ class ValidadorDeclaracionImportacionCompleto:
         except Exception as e:
             print(f"❌ Error al extraer anexos: {e}"); return pd.DataFrame()
 
-    def extraer_todas_declaraciones_pdf(self, pdf_path):
-        texto_completo = ""
-        try:
-            with pdfplumber.open(pdf_path) as pdf:
-                for pagina in pdf.pages:
-                    texto = pagina.extract_text(x_tolerance=3, y_tolerance=3)
-                    if texto: texto_completo += texto + "\n\n"
-        except: return []
-        
-        matches = list(re.finditer(r"4\s*\.?\s*N[uú]mero\s*de\s*formulario[\s\S]*?(\d{12,18})", texto_completo, re.IGNORECASE))
-        declaraciones = []
-        for i, match in enumerate(matches):
-            end_pos = matches[i+1].start() if i < len(matches) - 1 else len(texto_completo)
-            declaraciones.append(self.extraer_datos_declaracion_individual(texto_completo[match.start():end_pos], match.group(1)))
-        return declaraciones
-
-    def extraer_datos_declaracion_individual(self, texto, numero_formulario):
-        datos = {'Numero_Formulario_Declaracion': numero_formulario, 'Archivo_PDF': os.path.basename(texto.split('\n')[0]) if texto else 'Desconocido'}
-        for campo in self.CAMPOS_DI.values():
-            if campo in self.patrones:
-                valor = self.extraer_campo_individual(texto, self.patrones[campo], campo)
-                if any(p in campo for p in ['Fecha', 'Aceptación', 'Levante']): valor = self.normalizar_fecha_dd_mm_aaaa(valor, es_fecha=True)
-                datos[campo] = valor
-        return datos
-
-    def extraer_campo_individual(self, texto, patrones, campo_nombre=""):
-        for patron in patrones:
-            try:
-                match = re.search(patron, texto, re.IGNORECASE | re.MULTILINE | re.DOTALL)
-                if match:
-                    if match.groups():
-                        for group_val in match.groups():
-                            if group_val and group_val.strip():
-                                return group_val.strip()
-                    else:
-                        return match.group(0).strip()
-            except: continue
-        return "NO ENCONTRADO"
-
     def normalizar_fecha_dd_mm_aaaa(self, fecha_str, es_fecha=True):
-        if not fecha_str or fecha_str == "NO ENCONTRADO" or str(fecha_str).strip() == "": return "NO ENCONTRADO"
-        if not es_fecha: return str(fecha_str).strip()
-        try:
-            if isinstance(fecha_str, datetime): return fecha_str.strftime('%d-%m-%Y')
-            fecha_limpia = str(fecha_str).strip().replace(' ', '')
-            if len(fecha_limpia) > 10 and fecha_limpia.isdigit(): return fecha_limpia
-            for patron, formato in [(r'^(\d{4})(\d{2})(\d{2})$', '%Y%m%d'), (r'(\d{4})-(\d{1,2})-(\d{1,2})', '%Y-%m-%d'), (r'(\d{4})/(\d{1,2})/(\d{1,2})', '%Y/%m/%d'), (r'(\d{1,2})-(\d{1,2})-(\d{4})', '%d-%m-%Y'), (r'(\d{1,2})/(\d{1,2})/(\d{4})', '%d/%m/%Y')]:
-                if re.match(patron, fecha_limpia): return datetime.strptime(fecha_limpia, formato).strftime('%d-%m-%Y')
-            return fecha_limpia
-        except: return str(fecha_str)
+        return normalizar_fecha_dd_mm_aaaa(fecha_str, es_fecha)
 
     def _normalizar_factura(self, factura_str):
         if not factura_str or factura_str == "NO ENCONTRADO": return ""
@@ -1095,13 +1283,15 @@ class ValidadorDeclaracionImportacionCompleto:
             self._cache_nombres[key] = self.corrector_nombres.comparar_por_letras(nombre_pdf, nombre_excel)
         return self._cache_nombres[key]
 
-    def validar_campos_por_declaracion(self, datos_declaracion, anexos_formulario):
+    def validar_campos_por_declaracion(self, datos_declaracion, anexos_formulario, campos=None):
+        """Una fila por casilla validada de la DI; con `campos` solo esas casillas"""
         if anexos_formulario.empty and not (self.nit_proveedor and self.nombre_proveedor): return pd.DataFrame()
         resultados = []
         di_num = datos_declaracion.get('Numero_Formulario_Declaracion', 'NO ENCONTRADO')
         nom_pdf = datos_declaracion.get("11. Apellidos y Nombres / Razón Social Importador", "NO ENCONTRADO")
         
         for campo, config in self.MAPEOS_VALIDACION.items():
+            if campos is not None and campo not in campos: continue
             res = {'Campos DI a Validar': campo, 'Datos Declaración': 'NO ENCONTRADO', 'Datos Formulario': 'NO ENCONTRADO', 'Numero DI': di_num, 'Coincidencias': '❌ NO COINCIDE'}
             try:
                 val_dec = datos_declaracion.get(campo, "NO ENCONTRADO")
@@ -1120,7 +1310,7 @@ class ValidadorDeclaracionImportacionCompleto:
                         if self.nombre_proveedor and nom_pdf != "NO ENCONTRADO":
                             res['Coincidencias'] = '✅ COINCIDE' if self._comparar_nombres_optimizado(nom_pdf, self.nombre_proveedor) else '❌ NO COINCIDE'
                 else:
-                    codes = config["codigo_formulario"] if isinstance(config["codigo_formulario"], list) else [config["codigo_formulario"]]
+                    codes = config["codigo_formulario"] if isinstance(config["codigo_formulario"], (list, tuple)) else [config["codigo_formulario"]]
                     
                     # --- FILTRO ESTRICTO (TODOS COMO STRING) ---
                     if 9 in codes:
@@ -1188,42 +1378,82 @@ class ValidadorDeclaracionImportacionCompleto:
             resultados.append(res)
         return pd.DataFrame(resultados)
 
-    def procesar_validacion_completa(self, carpeta_pdf, archivo_salida=None):
+    def _validar_con_previa(self, datos_declaracion, anexos_formulario, previa):
+        """Filas de una DI ya validada contra el mismo FMM: solo se repiten las casillas de
+        factura si cambió la factura con que se emparejó al sumar DI de otras entregas"""
+        res = pd.DataFrame(previa['filas'])
+        di_num = datos_declaracion.get('Numero_Formulario_Declaracion', 'NO ENCONTRADO')
+        if res.empty or self.facturas_emparejadas.get(di_num) == previa['factura']:
+            return res
+        nuevas = self.validar_campos_por_declaracion(datos_declaracion, anexos_formulario, CAMPOS_FACTURA)
+        por_campo = {fila['Campos DI a Validar']: fila for fila in nuevas.to_dict('records')}
+        return pd.DataFrame([por_campo.get(fila['Campos DI a Validar'], fila) for fila in previa['filas']])
+
+    def procesar_validacion_completa(self, carpeta_pdf, archivo_salida=None, max_workers=1, cache=None, registros=None):
         form_file = self.buscar_archivo_formulario(carpeta_pdf)
         if not form_file: return None
+        if not archivo_salida: archivo_salida = os.path.join(carpeta_pdf, NOMBRE_REPORTE_ANEXOS)
+        pdf_files = glob.glob(os.path.join(carpeta_pdf, "*.pdf"))
+        return self.procesar_validacion_archivos(form_file, pdf_files, archivo_salida, max_workers, cache, registros=registros)
+
+    def procesar_validacion_archivos(self, form_file, pdf_files, archivo_salida=None, max_workers=1, cache=None, progreso=None, registros=None, previas=None):
+        """Valida los PDFs indicados contra el formulario FMM; sin `archivo_salida` no escribe Excel.
+
+        `registros` son los de MotorDeclaraciones para esos PDFs (los mismos de la comparación);
+        si no se entregan se extraen aquí. `previas` (modo anexar, ver operacion_dim) trae por
+        cada registro {'filas', 'factura'} de una validación anterior contra el mismo FMM, o
+        None: esas DI no se revalidan (ver _validar_con_previa). Las filas y la factura de cada
+        DI quedan en `self.validaciones` como (registro, filas, factura).
+        `progreso(etapa, completados, total, cantidad, detalle)` se invoca por PDF leído y por
+        declaración validada.
+        """
+        self.validaciones = []
         self.extraer_proveedor_formulario(form_file)
         anexos = self.extraer_anexos_formulario_robusto(form_file)
         if anexos.empty and not (self.nit_proveedor and self.nombre_proveedor): return None
         
-        todas_decs = []
-        for pdf in glob.glob(os.path.join(carpeta_pdf, "*.pdf")):
-            print(f"\n📄 Procesando PDF: {os.path.basename(pdf)}")
-            decs = self.extraer_todas_declaraciones_pdf(pdf)
-            todas_decs.extend(decs)
-            print(f"📋 {len(decs)} declaraciones encontradas")
+        if registros is None:
+            registros = MotorDeclaraciones(self.tiempos).procesar_archivos(pdf_files, max_workers, cache, progreso)
+        if previas is None: previas = [None] * len(registros)
+        # Solo las DI con número de formulario se cruzan con el FMM
+        pares = [(r, p) for r, p in zip(registros, previas) if not str(r.numero_di).startswith(PREFIJO_DI_DESCONOCIDA)]
+        todas_decs = [r for r, _ in pares]
+        por_archivo = Counter(r.archivo_pdf for r in todas_decs)
+        for pdf in pdf_files:
+            print(f"\n📄 Procesando PDF: {_nombre_archivo(pdf)}")
+            print(f"📋 {por_archivo.get(_nombre_archivo(pdf), 0)} declaraciones encontradas")
             
         facts_form = anexos[anexos['Codigo'] == 6]['Documento'].tolist()
-        facts_decs = {d.get('Numero_Formulario_Declaracion'): d.get('51. No. Factura Comercial', 'NO ENCONTRADO') for d in todas_decs if d.get('Numero_Formulario_Declaracion')}
+        facts_decs = {d.numero_di: d.get('51. No. Factura Comercial', 'NO ENCONTRADO') for d in todas_decs if d.numero_di}
         self.facturas_emparejadas = self._emparejar_facturas_completo(facts_decs, facts_form)
         
-        if not archivo_salida: archivo_salida = os.path.join(carpeta_pdf, "Resultado Validacion Anexos FMM vs DIM.xlsx")
-        
         all_results = []
         err_count = 0
         self._cache_nombres = {}
         print(f"🔍 Validando {len(todas_decs)} declaraciones...")
         
-        for d in todas_decs:
-            res = self.validar_campos_por_declaracion(d, anexos)
-            if not res.empty:
-                if len(res[res['Coincidencias'] == '❌ NO COINCIDE']) > 0: err_count += 1
-                all_results.append(res)
+        with self.tiempos.etapa('validacion'):
+            for n, (d, previa) in enumerate(pares, 1):
+                if previa is not None:
+                    res = self._validar_con_previa(d, anexos, previa)
+                    self.tiempos.sumar('di_validaciones_reutilizadas', 1)
+                else:
+                    res = self.validar_campos_por_declaracion(d, anexos)
+                self.validaciones.append((d, res.to_dict('records'), self.facturas_emparejadas.get(d.numero_di)))
+                if not res.empty:
+                    if len(res[res['Coincidencias'] == '❌ NO COINCIDE']) > 0: err_count += 1
+                    all_results.append(res)
+                if progreso: progreso('validacion', n, len(todas_decs), 1, d.numero_di or '')
+        self.conteo_declaraciones = {'procesadas': len(todas_decs), 'con_errores': err_count}
         
         if all_results:
             df = pd.concat(all_results, ignore_index=True)
             try:
-                with pd.ExcelWriter(archivo_salida, engine='openpyxl') as writer:
-                    df.to_excel(writer, sheet_name='Validacion_Detallada', index=False)
+                if archivo_salida:
+                    with self.tiempos.etapa('escritura_excel'):
+                        escribir_excel(df, archivo_salida, hoja='Validacion_Detallada', columna_veredicto=COLUMNA_VEREDICTO_ANEXOS)
+                df.attrs['tiempos'] = self.tiempos.como_dict()
+                df.attrs['regex_excedidos'] = list(self.tiempos.excesos_regex)
                 print(f"\n{'='*50}\n📊 RESUMEN FINAL DE VALIDACIÓN\n{'='*50}")
                 print(f"   • Total declaraciones procesadas: {len(todas_decs)}")
                 print(f"   • Declaraciones con errores: {err_count}")
@@ -1234,7 +1464,7 @@ class ValidadorDeclaracionImportacionCompleto:
                 else:
                     print(f"⚠️  {err_count} declaraciones requieren revisión")
 
-                print(f"💾 Resultados guardados en: {archivo_salida}")
+                if isinstance(archivo_salida, str): print(f"💾 Resultados guardados en: {archivo_salida}")
                 print(f"{'='*50}")
                 return df
             except PermissionError:
@@ -1242,14 +1472,493 @@ class ValidadorDeclaracionImportacionCompleto:
             except Exception as e: print(f"❌ Error al guardar Excel: {e}")
         return None
 
+    def resumen_validacion(self):
+        """Resumen estructurado de la última validación: proveedor, códigos de anexos,
+        integridad DI/levantes y conteo de declaraciones"""
+        return {
+            'datos_proveedor': {'nit': self.nit_proveedor or 'No disponible', 'nombre': self.nombre_proveedor or 'No disponible'},
+            'resumen_codigos': dict(self.resumen_anexos['resumen_codigos']),
+            'validacion_integridad': dict(self.resumen_anexos['validacion_integridad']),
+            'total_anexos': self.resumen_anexos['total_anexos'],
+            'total_di': self.resumen_anexos['resumen_codigos'].get('9', {}).get('cantidad', 0),
+            'declaraciones_procesadas': self.conteo_declaraciones['procesadas'],
+            'declaraciones_con_errores': self.conteo_declaraciones['con_errores']
+        }
+
+# =============================================================================
+# MOTOR ÚNICO DE EXTRACCIÓN DE DECLARACIONES
+# =============================================================================
+
+# Un solo patrón de número de formulario para dividir el texto en DI: el número
+# completo (12 a 18 dígitos, sin tomar parte de una cifra más larga)
+PATRON_NUMERO_DI = re.compile(r"4\s*\.?\s*N[úu]mero\s*de\s*formulario[\s\S]*?(?<!\d)(\d{12,18})(?!\d)", FLAGS_CAMPOS)
+PREFIJO_DI_DESCONOCIDA = "Desconocido_"
+
+# Tipos de repetición de una DI entre los PDF cargados
+TIPO_COPIA_IDENTICA = "Copia idéntica (omitida)"
+TIPO_CONTENIDO_DISTINTO = "Mismo número, contenido distinto (ambas se verifican)"
+
+# Separa el texto de páginas consecutivas de un PDF (extract_text no deja líneas vacías)
+SEPARADOR_PAGINAS = "\n\n"
+
+# Todas las casillas que se extraen por DI (comparación con subpartidas y anexos FMM)
+PATRONES_CAMPOS_DI = MappingProxyType({**PATRONES_DIAN, **PATRONES_DECLARACION})
+
+# Parámetros de extracción de texto por página (también forman parte de su huella)
+TOLERANCIAS_TEXTO = MappingProxyType({'x_tolerance': 3, 'y_tolerance': 3})
+
+# Encabezado de casilla en el texto extraído: número y primera palabra ("59. Subpartida", "60. Cod")
+PATRON_ENCABEZADO_DI = re.compile(r"(?<![\d.,])(\d{1,3})\s*\.\s*([A-Za-zÀ-ÿ]+)")
+
+def _perfil_formulario(nombre, encabezados, patrones):
+    """Perfil de una versión del formulario: los encabezados que la identifican, en su
+    orden, y por campo los índices (en la tabla general) de los únicos patrones que
+    corresponden a su disposición. Los campos no listados prueban toda la tabla"""
+    return MappingProxyType({
+        'nombre': nombre,
+        'encabezados': tuple(encabezados),
+        'patrones': MappingProxyType({campo: tuple(indices) for campo, indices in patrones.items()})
+    })
+
+# Versiones conocidas del formulario 500, de la más específica a la más general. Solo la
+# subpartida (casilla 59) cambia de disposición entre ellas; las demás casillas comparten
+# patrones y usan la tabla general. Un formato que ningún perfil reconoce prueba todas las alternativas
+PERFILES_FORMULARIO = (
+    # Casillas 59 a 67 en una sola fila de encabezados, con la subpartida bajo ella: solo el patrón de la fila
+    _perfil_formulario("500 con fila de casillas 59-67",
+                       ("4.numero", "5.numero", "11.apellidos", "59.subpartida", "60.cod", "61.cod", "62.cod",
+                        "63.no", "64.valor", "65.periodicidad", "66.cod", "67.cod", "74.no", "75.cod"),
+                       {"59. Subpartida Arancelaria": (0,)}),
+    # Sin esa fila el patrón de la fila no puede coincidir: solo el amplio (a 150 caracteres de la casilla 59)
+    _perfil_formulario("500 sin fila de casillas 59-67",
+                       ("4.numero", "5.numero", "11.apellidos", "59.subpartida"),
+                       {"59. Subpartida Arancelaria": (1,)}),
+)
+
+def encabezados_formulario(texto):
+    """Secuencia de encabezados de casilla ("59.subpartida", sin tildes) en el orden del texto"""
+    return [f"{numero}.{''.join(c for c in unicodedata.normalize('NFD', palabra.lower()) if unicodedata.category(c) != 'Mn')}"
+            for numero, palabra in PATRON_ENCABEZADO_DI.findall(texto)]
+
+def detectar_perfil(texto, perfiles=PERFILES_FORMULARIO):
+    """Primer perfil cuyos encabezados aparecen, en ese orden, en el texto (la primera
+    página de la primera DI de un PDF); None si no corresponde a ninguna versión conocida"""
+    encabezados = encabezados_formulario(texto)
+    for perfil in perfiles:
+        restantes = iter(encabezados)
+        if all(encabezado in restantes for encabezado in perfil['encabezados']):
+            return perfil
+    return None
+
+def huella_bloque_di(numero_di, texto):
+    """SHA-256 del número de formulario y del texto del bloque con los espacios
+    normalizados: la misma DI suelta y dentro de un consolidado da la misma huella"""
+    return hashlib.sha256(f"{numero_di}\n{' '.join(texto.split())}".encode('utf-8')).hexdigest()
+
+def deduplicar_registros(registros):
+    """(únicos, duplicados): conserva la primera aparición de cada bloque de DI (por su
+    huella) y describe las copias omitidas y las DI con el mismo número y contenido distinto"""
+    unicos, duplicados, primero = [], [], {}
+    for registro in registros:
+        original = primero.get(registro.huella_bloque) if registro.huella_bloque else None
+        if original is not None:
+            duplicados.append({'Número DI': registro.numero_di, 'Archivo conservado': original.archivo_pdf,
+                               'Archivo duplicado': registro.archivo_pdf, 'Tipo': TIPO_COPIA_IDENTICA})
+            continue
+        if registro.huella_bloque:
+            primero[registro.huella_bloque] = registro
+        unicos.append(registro)
+
+    por_numero = defaultdict(list)
+    for registro in unicos:
+        if not registro.numero_di.startswith(PREFIJO_DI_DESCONOCIDA):
+            por_numero[registro.numero_di].append(registro)
+    for numero, versiones in por_numero.items():
+        for otra in versiones[1:]:
+            # Ambas se conservan: no hay forma de saber cuál es la corrección válida
+            duplicados.append({'Número DI': numero, 'Archivo conservado': versiones[0].archivo_pdf,
+                               'Archivo duplicado': otra.archivo_pdf, 'Tipo': TIPO_CONTENIDO_DISTINTO})
+    return unicos, duplicados
+
+def huella_pagina(pagina):
+    """Huella del contenido de una página de pdfplumber: sus flujos de dibujo, el
+    tamaño, las fuentes (con su mapa a Unicode) y las tolerancias de extracción"""
+    pdfminer_pagina = pagina.page_obj
+    sha = hashlib.sha256(repr((tuple(pagina.bbox), sorted(TOLERANCIAS_TEXTO.items()))).encode('utf-8'))
+    for flujo in pdfminer_pagina.contents or []:
+        sha.update(pdfminer_tipos.resolve1(flujo).get_data())
+    recursos = pdfminer_tipos.resolve1(pdfminer_pagina.resources) or {}
+    fuentes = pdfminer_tipos.resolve1(recursos.get('Font')) or {}
+    for nombre in sorted(fuentes, key=str):
+        fuente = pdfminer_tipos.resolve1(fuentes[nombre])
+        sha.update(repr((nombre, fuente.get('BaseFont'), fuente.get('Encoding'))).encode('utf-8'))
+        if 'ToUnicode' in fuente:
+            sha.update(pdfminer_tipos.resolve1(fuente['ToUnicode']).get_data())
+    return sha.hexdigest()[:32]
+
+class MotorDeclaraciones:
+    """Lee cada PDF una sola vez, lo divide en DI con PATRON_NUMERO_DI y produce un
+    RegistroDI por DI con todas las casillas (4 a 135). La comparación con
+    subpartidas y la validación de anexos FMM consumen los mismos registros.
+
+    Con un `paginas` (cache_dim.AlmacenPaginas) el texto se toma por página del
+    almacén y solo se extraen las páginas que no estén en él. Las páginas escaneadas
+    se reconocen con OCR (ocr_dim) si hay Tesseract; con `workers_ocr` mayor que 1 en un
+    pool propio, lo que solo conviene en un proceso principal (no en uno del lote o de la app).
+    La versión del formulario se detecta una vez por PDF (PERFILES_FORMULARIO) y limita los
+    campos que cambian de disposición a los patrones de esa versión. Con unas `estadisticas`
+    (estadisticas_patrones_dim) cada campo prueba primero los patrones que más aciertan en
+    ese formato de DI (la versión o, sin perfil, la secuencia de casillas del bloque).
+    """
+
+    def __init__(self, tiempos=None, paginas=None, workers_ocr=1, estadisticas=None):
+        self.tiempos = tiempos if tiempos is not None else RegistroTiempos()
+        self.paginas = paginas
+        self.workers_ocr = max(1, workers_ocr or 1)
+        # Bloques ya extraídos por este motor (una copia no repite las regex) y copias omitidas
+        self.registros_por_huella = {}
+        self.duplicados = []
+        self.registros_por_archivo = []
+        self.patrones = PATRONES_CAMPOS_DI
+        self.patron_numero_di = PATRON_NUMERO_DI
+        # Orden de los patrones por formato de DI según sus aciertos en ejecuciones anteriores
+        self.estadisticas = estadisticas if estadisticas is not None else EstadisticasPatrones()
+        self.perfiles = PERFILES_FORMULARIO
+        self.huellas_patrones = huellas_por_campo(self.patrones)
+        self._ordenes = {}
+
+    def version(self):
+        """Huella de los patrones y del esquema: parte de la clave de la caché de registros por PDF"""
+        return huella_patrones(self.patrones, self.patron_numero_di, ESQUEMA_DI, self.perfiles)
+
+    def normalizar_numero_entero(self, numero_str, campo_nombre=""):
+        if not isinstance(numero_str, str) or numero_str == "NO ENCONTRADO":
+            return np.nan
+
+        if '62. Cod. Modalidad' in campo_nombre:
+            return numero_str.strip()
+
+        if '74. Número de Bultos' in campo_nombre:
+            # 1. Eliminar los puntos completamente (asumimos que son miles: 7.333 -> 7333)
+            cleaned_str = numero_str.replace('.', '')
+            # 2. Reemplazar comas por puntos (por si hubiera decimales reales: 7,5 -> 7.5)
+            cleaned_str = cleaned_str.replace(',', '.')
+            # 3. Limpiar cualquier basura restante
+            cleaned_str = re.sub(r'[^\d.]', '', cleaned_str)
+            try:
+                valor = float(cleaned_str)
+                return valor
+            except ValueError:
+                return np.nan          
+
+        if any(codigo in campo_nombre for codigo in ['55. Cod. de Bandera', '66. Cod. Pais de Origen', '70. Cod. Pais Compra']):
+            if numero_str.isdigit():
+                return numero_str
+            if ' - ' in numero_str:
+                codigo = numero_str.split(' - ')[0].strip()
+                if codigo.isdigit():
+                    return codigo
+            return numero_str
+
+        cleaned_str = re.sub(r'(?<=\d)\.(?=\d{3})', '', numero_str)
+        cleaned_str = re.sub(r'(?<=\d),(?=\d{3})', '', cleaned_str)
+        if ',' in cleaned_str and '.' not in cleaned_str:
+            cleaned_str = cleaned_str.replace(',', '.')
+
+        try:
+            valor = float(cleaned_str)
+            if valor.is_integer():
+                return int(valor)
+            return valor
+        except ValueError:
+            return np.nan
+
+    def extraer_texto_pdf(self, pdf_path, digest=None):
+        archivo = _nombre_archivo(pdf_path)
+        try:
+            if self.paginas is not None:
+                return "".join(p['texto'] + SEPARADOR_PAGINAS for p in self.leer_paginas(pdf_path, digest) if p['texto'])
+            textos = {}
+            with self.tiempos.etapa('texto_pdf', archivo):
+                with pdfplumber.open(_rebobinar(pdf_path)) as pdf:
+                    self.tiempos.sumar('bytes_leidos', _tamano_archivo(pdf_path))
+                    clases = self.clasificar_paginas(pdf)
+                    for indice, (pagina, extraer) in enumerate(zip(pdf.pages, paginas_a_extraer(clases, ocr_disponible()))):
+                        if extraer:
+                            textos[indice] = pagina.extract_text(**TOLERANCIAS_TEXTO)
+                    escaneadas = self.paginas_para_ocr(pdf, clases)
+            self.tiempos.sumar('paginas', len(textos))
+            self.tiempos.sumar('paginas_omitidas', len(clases) - len(textos) - len(escaneadas))
+            textos.update((i, datos['texto']) for i, datos in self.reconocer_paginas(pdf_path, escaneadas).items())
+            return "".join(textos[i] + SEPARADOR_PAGINAS for i in sorted(textos) if textos[i])
+        except Exception:
+            return ""
+
+    def clasificar_paginas(self, pdf):
+        """Clase de cada página de `pdf` según su flujo de contenido (triaje_dim).
+
+        Solo las páginas de declaración pasan por el layout de extract_text: las hojas
+        de continuación, anexos (facturas, BL) y páginas en blanco se omiten, y las
+        escaneadas van a OCR (sin Tesseract se extraen como las demás). Un PDF sin
+        páginas de declaración se recorre completo.
+        """
+        with self.tiempos.etapa('clasificacion_paginas'):
+            return [clasificar_contenido(contenido_pagina(pagina.page_obj), imagenes_pagina(pagina.page_obj))
+                    for pagina in pdf.pages]
+
+    def paginas_para_ocr(self, pdf, clases):
+        """[(índice, huella de imagen)] de las páginas escaneadas; vacío si no hay Tesseract"""
+        if PAGINA_ESCANEADA not in clases or not ocr_disponible():
+            return []
+        return [(indice, huella_imagen_pagina(pdf.pages[indice]))
+                for indice, clase in enumerate(clases) if clase == PAGINA_ESCANEADA]
+
+    def reconocer_paginas(self, pdf_path, escaneadas):
+        """{índice: {'texto', 'palabras'}} de las páginas escaneadas, con caché por huella de imagen"""
+        if not escaneadas:
+            return {}
+        with self.tiempos.etapa('ocr', _nombre_archivo(pdf_path)):
+            reconocidas = ocr_paginas(pdf_path, escaneadas, self.paginas, self.workers_ocr)
+        self.tiempos.sumar('paginas_ocr', len(reconocidas))
+        return reconocidas
+
+    def leer_paginas(self, pdf_path, digest=None):
+        """Texto y palabras ([x0, top, x1, bottom, texto]) de cada página con casillas, vía el almacén.
+
+        Si el PDF ya está indexado el texto se arma sin abrirlo; si no, se abre, se
+        calcula la huella de cada página y solo se extraen (o reconocen con OCR) las
+        que no están guardadas. `digest` evita repetir el hash si ya se calculó.
+        """
+        archivo = _nombre_archivo(pdf_path)
+        digest = digest or digest_archivo(pdf_path)
+        version_indice = VERSION_CLASIFICADOR + ("_ocr" if ocr_disponible() else "")
+        huellas = self.paginas.indice(digest, version_indice)
+        if huellas is not None:
+            with self.tiempos.etapa('texto_almacen', archivo):
+                paginas = [self.paginas.pagina(huella) for huella in huellas if huella]
+            if all(p is not None for p in paginas):
+                self.tiempos.sumar('paginas_reutilizadas', len(paginas))
+                self.tiempos.sumar('paginas_omitidas', len(huellas) - len(paginas))
+                return paginas
+
+        paginas = {}
+        with self.tiempos.etapa('texto_pdf', archivo):
+            with pdfplumber.open(_rebobinar(pdf_path)) as pdf:
+                self.tiempos.sumar('bytes_leidos', _tamano_archivo(pdf_path))
+                clases = self.clasificar_paginas(pdf)
+                huellas = [None] * len(clases)
+                for indice, (pagina, extraer) in enumerate(zip(pdf.pages, paginas_a_extraer(clases, ocr_disponible()))):
+                    if not extraer:
+                        continue
+                    huellas[indice] = huella_pagina(pagina)
+                    datos = self.paginas.pagina(huellas[indice])
+                    if datos is None:
+                        texto = pagina.extract_text(**TOLERANCIAS_TEXTO) or ""
+                        palabras = [[round(p['x0'], 2), round(p['top'], 2), round(p['x1'], 2), round(p['bottom'], 2), p['text']]
+                                    for p in pagina.extract_words(**TOLERANCIAS_TEXTO)]
+                        datos = {'texto': texto, 'palabras': palabras}
+                        self.paginas.guardar_pagina(huellas[indice], texto, palabras)
+                        self.tiempos.sumar('paginas', 1)
+                    else:
+                        self.tiempos.sumar('paginas_reutilizadas', 1)
+                    paginas[indice] = datos
+                escaneadas = self.paginas_para_ocr(pdf, clases)
+        for indice, huella in escaneadas:
+            huellas[indice] = huella
+        paginas.update(self.reconocer_paginas(pdf_path, escaneadas))
+        self.tiempos.sumar('paginas_omitidas', len(clases) - len(paginas))
+        self.paginas.guardar_indice(digest, huellas, version_indice)
+        return [paginas[indice] for indice in sorted(paginas)]
+
+    def extraer_campo(self, texto, patrones, campo_nombre="", formato=None, huellas=None):
+        """Valor del primer patrón que encuentra el campo. Con `huellas` (una por patrón)
+        cada intento queda en las estadísticas de patrones del `formato` del bloque"""
+        inicio = time.perf_counter()
+        valor = "NO ENCONTRADO"
+        for i, patron in enumerate(patrones):
+            inicio_patron = time.perf_counter()
+            acierto = False
+            try:
+                match = buscar(patron, texto, campo=campo_nombre)
+                if match:
+                    if match.groups():
+                        valor = next((g.strip() for g in match.groups() if g and g.strip()), "NO ENCONTRADO")
+                        acierto = valor != "NO ENCONTRADO"
+                    else:
+                        valor = match.group(0).strip(); acierto = True
+            except TiempoRegexExcedido:
+                raise
+            except Exception:
+                pass
+            if huellas is not None:
+                self.tiempos.registrar_patron(formato, campo_nombre, huellas[i], time.perf_counter() - inicio_patron, acierto)
+            if acierto: break
+        self.tiempos.registrar_campo(campo_nombre, time.perf_counter() - inicio, valor != "NO ENCONTRADO")
+        return valor
+
+    def patrones_en_orden(self, formato, campo, perfil=None):
+        """(patrones, huellas) de un campo en el orden adaptativo de las estadísticas para el
+        formato; con un perfil de versión, solo los patrones que el perfil asigna al campo"""
+        clave = (formato, campo)
+        if clave not in self._ordenes:
+            patrones, huellas = self.patrones[campo], self.huellas_patrones[campo]
+            indices = perfil['patrones'].get(campo) if perfil is not None else None
+            if indices is not None:
+                patrones, huellas = tuple(patrones[i] for i in indices), tuple(huellas[i] for i in indices)
+            orden = self.estadisticas.orden(formato, campo, huellas)
+            self._ordenes[clave] = (tuple(patrones[i] for i in orden), tuple(huellas[i] for i in orden))
+        return self._ordenes[clave]
+
+    def detectar_perfil(self, texto):
+        """Perfil de la versión del formulario por la primera página de la primera DI del PDF"""
+        with self.tiempos.etapa('deteccion_formulario'):
+            perfil = detectar_perfil(texto.split(SEPARADOR_PAGINAS, 1)[0], self.perfiles)
+        self.tiempos.sumar('pdfs_con_perfil' if perfil is not None else 'pdfs_sin_perfil', 1)
+        return perfil
+
+    def normalizar_valor(self, valor, campo_nombre):
+        """Números de la DI (casillas 55 a 81) como int/float; fechas como dd-mm-aaaa"""
+        if campo_nombre in PATRONES_DIAN:
+            return self.normalizar_numero_entero(valor, campo_nombre)
+        if any(p in campo_nombre for p in CAMPOS_CON_FECHA):
+            return normalizar_fecha_dd_mm_aaaa(valor, es_fecha=True)
+        return valor
+
+    def dividir_declaraciones(self, texto_completo, pdf_filename):
+        """Bloques de texto por DI, desde cada número de formulario hasta la página (o la
+        línea) donde aparece el siguiente: el encabezado de la DI siguiente no entra en el
+        bloque, así la misma DI suelta y dentro de un consolidado tiene el mismo texto"""
+        matches = buscar_todos(self.patron_numero_di, texto_completo,
+                               presupuesto=PRESUPUESTO_DIVISION_DI, campo="4. Número DI")
+        if not matches:
+            return [{'form_number': PREFIJO_DI_DESCONOCIDA + pdf_filename, 'text': texto_completo}]
+        di_bloques = []
+        for i, match in enumerate(matches):
+            if i + 1 < len(matches):
+                siguiente = matches[i + 1].start()
+                corte = texto_completo.rfind(SEPARADOR_PAGINAS, match.end(), siguiente)
+                if corte < 0:
+                    corte = texto_completo.rfind("\n", match.end(), siguiente)
+                end_index = corte + 1 if corte >= 0 else siguiente
+            else:
+                end_index = len(texto_completo)
+            di_bloques.append({'form_number': match.group(1).strip(), 'text': texto_completo[match.start():end_index]})
+        return di_bloques
+
+    def procesar_declaracion(self, di_text_block, form_number, pdf_filename, perfil=None):
+        """RegistroDI con todas las casillas; None si un patrón superó su presupuesto.
+        Con el `perfil` de la versión del formulario cada campo prueba solo sus patrones"""
+        registro = RegistroDI(archivo_pdf=pdf_filename, numero_di=form_number)
+        formato = perfil['nombre'] if perfil is not None else firma_formato(di_text_block)
+        for nombre_campo in self.patrones:
+            patrones, huellas = self.patrones_en_orden(formato, nombre_campo, perfil)
+            try:
+                valor = self.extraer_campo(di_text_block, patrones, nombre_campo, formato, huellas)
+            except TiempoRegexExcedido as e:
+                _reportar_exceso_regex(self.tiempos, pdf_filename, form_number, e)
+                return None
+            registro.asignar(nombre_campo, self.normalizar_valor(valor, nombre_campo))
+        return registro
+
+    def procesar_pdf(self, pdf_file_path):
+        """Extrae los registros de todas las DI contenidas en un PDF"""
+        return self.procesar_texto(self.extraer_texto_pdf(pdf_file_path), _nombre_archivo(pdf_file_path))
+
+    def procesar_texto(self, texto_completo_pdf, pdf_filename):
+        """Registros de las DI del texto ya extraído de un PDF (división, perfil y regex)"""
+        if not texto_completo_pdf: return []
+
+        try:
+            with self.tiempos.etapa('division_di', pdf_filename):
+                di_bloques = self.dividir_declaraciones(texto_completo_pdf, pdf_filename)
+        except TiempoRegexExcedido as e:
+            _reportar_exceso_regex(self.tiempos, pdf_filename, None, e)
+            return []
+        # Una sola detección de versión por PDF: todas sus DI usan el mismo perfil
+        perfil = self.detectar_perfil(di_bloques[0]['text'])
+        resultados = []
+        with self.tiempos.etapa('regex_campos', pdf_filename):
+            for bloque in di_bloques:
+                huella = huella_bloque_di(bloque['form_number'], bloque['text'])
+                previo = self.registros_por_huella.get(huella)
+                if previo is not None:
+                    # Copia de un bloque ya extraído: mismos valores, con este archivo de origen
+                    resultados.append(replace(previo, archivo_pdf=pdf_filename))
+                    self.tiempos.sumar('di_reutilizadas', 1)
+                    continue
+                registro = self.procesar_declaracion(bloque['text'], bloque['form_number'], pdf_filename, perfil)
+                if registro:
+                    registro.huella_bloque = huella
+                    self.registros_por_huella[huella] = registro
+                    resultados.append(registro)
+        return resultados
+
+    def procesar_archivos(self, pdf_files, max_workers=1, cache=None, progreso=None):
+        """Registros de todos los PDFs en orden, opcionalmente en paralelo y con caché por contenido.
+
+        Los aciertos de cada patrón se suman a `self.estadisticas` (y se guardan si
+        tienen ruta). Cada DI aparece una sola vez aunque esté en varios PDF (p. ej. suelta y en un
+        consolidado); las copias omitidas quedan en `self.duplicados` y los registros de cada PDF,
+        antes de descartar copias, en `self.registros_por_archivo`.
+        `progreso(etapa, completados, total, cantidad, detalle)` se invoca al terminar cada PDF
+        con la cantidad de DI extraídas y el nombre del archivo.
+        """
+        aviso = _aviso_por_archivo(progreso, 'extraccion_dim')
+        registros = []
+        self.registros_por_archivo = []
+        funcion_proceso = partial(_procesar_pdf_declaraciones, paginas=self.paginas, estadisticas=self.estadisticas)
+        # Sin pool, el texto del PDF siguiente se extrae en otro hilo mientras este corre las
+        # regex del actual; ese hilo registra sus tiempos aparte (se suman al final) y sus
+        # contadores directamente en `self.tiempos`, de donde el progreso lee las páginas
+        lector = MotorDeclaraciones(RegistroTiempos(self.tiempos.perfilar, self.tiempos.carpeta_perfiles, self.tiempos),
+                                    self.paginas, self.workers_ocr)
+        etapas = (lector.extraer_texto_pdf, lambda pdf, texto: self.procesar_texto(texto, _nombre_archivo(pdf)))
+        # Los intentos de patrones se cuentan aparte: `self.tiempos` puede traer los de llamadas anteriores
+        patrones_previos, self.tiempos.patrones = self.tiempos.patrones, {}
+        try:
+            for registros_pdf in _procesar_por_archivo(self.procesar_pdf, funcion_proceso, pdf_files, max_workers,
+                                                       cache, 'declaraciones', self.version(), self.tiempos, aviso, etapas):
+                self.registros_por_archivo.append(como_registros(registros_pdf))
+                registros.extend(self.registros_por_archivo[-1])
+            # Los intentos de esta ejecución (también los de los procesos hijos) ordenan la próxima
+            self.estadisticas.combinar(self.tiempos.patrones)
+            self.estadisticas.guardar()
+        finally:
+            self.tiempos.patrones = combinar_patrones(patrones_previos, self.tiempos.patrones)
+            self.tiempos.combinar(lector.tiempos.como_dict())
+        with self.tiempos.etapa('deduplicacion_di'):
+            registros, self.duplicados = deduplicar_registros(registros)
+        for duplicado in self.duplicados:
+            print(f"♻️ DI {duplicado['Número DI']} en {duplicado['Archivo duplicado']} "
+                  f"(ya en {duplicado['Archivo conservado']}): {duplicado['Tipo']}")
+        return registros
+
+_tiempos_precalentamiento = None
+
+def precalentar():
+    """Prepara el proceso actual una sola vez: importa las dependencias pesadas y
+    compila las versiones con presupuesto de todos los patrones. Se usa como
+    inicializador de los pools y retorna los segundos de cada paso."""
+    global _tiempos_precalentamiento
+    if _tiempos_precalentamiento is None:
+        tiempos = precargar(np, pd, pdfplumber, pdfminer_tipos, openpyxl)
+        inicio = time.perf_counter()
+        for campo, patrones in PATRONES_CAMPOS_DI.items():
+            for patron in patrones:
+                buscar(patron, "", campo=campo)
+        buscar_todos(PATRON_NUMERO_DI, "", campo="4. Número DI")
+        tiempos['patrones'] = time.perf_counter() - inicio
+        _tiempos_precalentamiento = tiempos
+    return _tiempos_precalentamiento
+
 # =============================================================================
 # FUNCIÓN PRINCIPAL
 # =============================================================================
 
 def main():
     CARPETA_BASE = r"E:\Users\Lenovo\Desktop\PYTHON\DI\Junior Deposito 401\SLIND 401\SLIND 401\SLI 850232"
-    EXCEL_OUTPUT_COMPARACION = os.path.join(CARPETA_BASE, "Resultado Validación Subpartida vs DIM.xlsx")
-    EXCEL_OUTPUT_ANEXOS = os.path.join(CARPETA_BASE, "Resultado Validacion Anexos FMM vs DIM.xlsx")
+    EXCEL_OUTPUT_COMPARACION = os.path.join(CARPETA_BASE, NOMBRE_REPORTE_COMPARACION)
+    EXCEL_OUTPUT_ANEXOS = os.path.join(CARPETA_BASE, NOMBRE_REPORTE_ANEXOS)
     
     try:
         print("🚀 INICIANDO PROCESO COMPLETO DE EXTRACCIÓN Y COMPARACIÓN INTEGRADO")
@@ -1263,10 +1972,15 @@ def main():
         print(f"{'='*60}")
         
         print("\n📄 EXTRACCIÓN DE DATOS DE PDFs (DIAN)...")
-        datos_dian = ExtractorDIANSimplificado().procesar_multiples_dis(CARPETA_BASE)
+        # Cada PDF se lee una vez: los mismos registros alimentan la comparación y la validación
+        aprendizaje = directorio_aprendizaje()
+        plantillas = CachePlantillas.en_directorio(aprendizaje)
+        motor = MotorDeclaraciones(estadisticas=EstadisticasPatrones.en_directorio(aprendizaje))
+        registros = motor.procesar_archivos(glob.glob(os.path.join(CARPETA_BASE, "*.pdf")))
+        datos_dian = ExtractorDIANSimplificado().procesar_multiples_dis(CARPETA_BASE, registros=registros)
         
         print("\n📊 EXTRACCIÓN DE DATOS DE EXCEL (SUBPARTIDAS)...")
-        datos_sub = ExtractorSubpartidas().extraer_y_estandarizar(CARPETA_BASE)
+        datos_sub = ExtractorSubpartidas(plantillas).extraer_y_estandarizar(CARPETA_BASE)
         
         if datos_dian is not None and not datos_dian.empty:
             print(f"✅ Datos DIAN extraídos: {len(datos_dian)} registros")
@@ -1289,7 +2003,7 @@ def main():
         print("📋 EJECUTANDO: Validación Anexos FMM vs DIM")
         print(f"{'='*60}")
         
-        res_val = ValidadorDeclaracionImportacionCompleto().procesar_validacion_completa(CARPETA_BASE, EXCEL_OUTPUT_ANEXOS)
+        res_val = ValidadorDeclaracionImportacionCompleto(plantillas).procesar_validacion_completa(CARPETA_BASE, EXCEL_OUTPUT_ANEXOS, registros=registros)
         
         print(f"\n{'='*120}")
         print("🎯 PROCESO COMPLETADO EXITOSAMENTE")